@@ -0,0 +1,192 @@
+import asyncio
+import heapq
+import itertools
+import math
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from typing import Dict, List, Optional, Tuple
+
+# Waiter priorities, lower is served first
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 1
+PRIORITY_LOW = 2  # Bulk work that should not delay interactive chats
+
+
+class AdmissionRejected(Exception):
+    """Raised when an upstream call cannot be admitted in time"""
+
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(reason)
+        self.retry_after = retry_after
+
+
+class _Waiter:
+    __slots__ = ("granted", "granted_at", "cancelled", "event", "loop", "future")
+
+    def __init__(self, loop: Optional[asyncio.AbstractEventLoop] = None):
+        self.granted = False
+        self.granted_at = 0.0
+        self.cancelled = False
+        self.loop = loop
+        self.event = threading.Event() if loop is None else None
+        self.future = loop.create_future() if loop is not None else None
+
+    def wake(self):
+        if self.event is not None:
+            self.event.set()
+        else:
+            self.loop.call_soon_threadsafe(_resolve, self.future)
+
+
+def _resolve(future: asyncio.Future):
+    if not future.done():
+        future.set_result(True)
+
+
+class AdmissionController:
+    """Cap the number of in-flight upstream calls.
+
+    Callers beyond max_in_flight wait in a bounded priority queue for at most
+    queue_timeout seconds. A full queue or an expired wait raises
+    AdmissionRejected with a Retry-After estimate. Works for threads
+    (acquire/slot) and asyncio tasks (acquire_async/slot_async).
+    """
+
+    def __init__(self, max_in_flight: int = 8, max_queue: int = 64, queue_timeout: float = 10):
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._lock = threading.Lock()
+        self._heap: List[Tuple[int, int, _Waiter]] = []
+        self._seq = itertools.count()
+        self.in_flight = 0
+        self.queued = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+        self._service_time = 2.0  # moving average of slot hold time, seconds
+
+    def _retry_after(self) -> int:
+        # Called with self._lock held
+        backlog = (self.queued + 1) / max(1, self.max_in_flight)
+        return max(1, math.ceil(self._service_time * backlog))
+
+    def _try_enter(self, priority: int,
+                   loop: Optional[asyncio.AbstractEventLoop] = None) -> Optional[_Waiter]:
+        """Take a free slot (returns None) or enqueue a waiter"""
+        with self._lock:
+            if self.in_flight < self.max_in_flight and self.queued == 0:
+                self.in_flight += 1
+                self.admitted += 1
+                return None
+            if self.queued >= self.max_queue:
+                self.rejected += 1
+                raise AdmissionRejected("Upstream queue is full", self._retry_after())
+            waiter = _Waiter(loop)
+            heapq.heappush(self._heap, (priority, next(self._seq), waiter))
+            self.queued += 1
+            return waiter
+
+    def _abandon(self, waiter: _Waiter) -> bool:
+        """Withdraw a waiter; returns True if it was granted a slot meanwhile"""
+        with self._lock:
+            if waiter.granted:
+                return True
+            waiter.cancelled = True
+            self.queued -= 1
+            return False
+
+    def _timeout(self) -> AdmissionRejected:
+        with self._lock:
+            self.timed_out += 1
+            return AdmissionRejected("Timed out waiting for upstream capacity", self._retry_after())
+
+    def _record_wait(self, started: float):
+        waited = time.monotonic() - started
+        with self._lock:
+            self.wait_seconds_total += waited
+            self.wait_seconds_max = max(self.wait_seconds_max, waited)
+
+    def acquire(self, priority: int = PRIORITY_NORMAL) -> float:
+        """Block until a slot is free; returns the admission time for release()"""
+        started = time.monotonic()
+        waiter = self._try_enter(priority)
+        if waiter is not None and not waiter.event.wait(self.queue_timeout):
+            if not self._abandon(waiter):
+                raise self._timeout()
+        self._record_wait(started)
+        return time.monotonic()
+
+    async def acquire_async(self, priority: int = PRIORITY_NORMAL) -> float:
+        """Async variant of acquire"""
+        started = time.monotonic()
+        waiter = self._try_enter(priority, asyncio.get_running_loop())
+        if waiter is not None:
+            try:
+                done, _ = await asyncio.wait({waiter.future}, timeout=self.queue_timeout)
+            except asyncio.CancelledError:
+                if self._abandon(waiter):
+                    # Handed a slot just as we were cancelled: give it back
+                    self.release(waiter.granted_at)
+                raise
+            if not done and not self._abandon(waiter):
+                raise self._timeout()
+        self._record_wait(started)
+        return time.monotonic()
+
+    def release(self, admitted_at: float):
+        """Free a slot, handing it straight to the next live waiter if any"""
+        with self._lock:
+            held = time.monotonic() - admitted_at
+            self._service_time = 0.8 * self._service_time + 0.2 * held
+            while self._heap:
+                _, _, waiter = heapq.heappop(self._heap)
+                if waiter.cancelled:
+                    continue
+                waiter.granted = True
+                waiter.granted_at = time.monotonic()
+                self.queued -= 1
+                self.admitted += 1
+                waiter.wake()
+                return
+            self.in_flight -= 1
+
+    def has_capacity(self) -> bool:
+        """True if a call would be admitted without queueing"""
+        with self._lock:
+            return self.in_flight < self.max_in_flight and self.queued == 0
+
+    @contextmanager
+    def slot(self, priority: int = PRIORITY_NORMAL):
+        admitted_at = self.acquire(priority)
+        try:
+            yield
+        finally:
+            self.release(admitted_at)
+
+    @asynccontextmanager
+    async def slot_async(self, priority: int = PRIORITY_NORMAL):
+        admitted_at = await self.acquire_async(priority)
+        try:
+            yield
+        finally:
+            self.release(admitted_at)
+
+    def stats(self) -> Dict[str, float]:
+        """Queue depth, wait times and admission counters"""
+        with self._lock:
+            return {
+                "in_flight": self.in_flight,
+                "queued": self.queued,
+                "max_in_flight": self.max_in_flight,
+                "max_queue": self.max_queue,
+                "admitted": self.admitted,
+                "rejected": self.rejected,
+                "timed_out": self.timed_out,
+                "wait_seconds_total": round(self.wait_seconds_total, 3),
+                "wait_seconds_max": round(self.wait_seconds_max, 3),
+                "service_seconds_avg": round(self._service_time, 3),
+            }
@@ -1,347 +1,340 @@
+"""Flask serving mode for the chat and health endpoints.
+
+The chat service itself lives in service.py, shared with asgi.py.
+
+    python app.py
+"""
 import os
 import time
-from flask import Flask, request, jsonify, Response
-from groq import Groq
-from dotenv import load_dotenv
-from flask_cors import CORS
 import logging
+from flask import Flask, request, jsonify, Response, g
+from werkzeug.middleware.proxy_fix import ProxyFix
+from flask_cors import CORS
 from datetime import datetime
-import json
-from typing import List, Dict, Generator
-
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from admission import AdmissionRejected, PRIORITY_LOW
+from ratelimit import client_key
+from replay import StreamLog, coalesce, gzip_stream, parse_event_id
+from metrics import REGISTRY, BATCH_ITEMS_TOTAL, ERRORS_TOTAL, STREAMS_IN_FLIGHT, RequestTrace
+from service import (
+    ChatbotException,
+    BATCH_WORKERS,
+    EXPOSED_HEADERS,
+    METRICS_CONTENT_TYPE,
+    NDJSON_MIMETYPE,
+    PROFILE_SAMPLE_RATE,
+    RATE_LIMIT_API_KEYS,
+    SLOW_REQUEST_SECONDS,
+    SSE_COALESCE_BYTES,
+    SSE_FLUSH_INTERVAL,
+    SSE_HEADERS,
+    STREAM_MODE,
+    TRUSTED_PROXY_HOPS,
+    WARMUP,
+    batch_error,
+    batch_success,
+    build_context,
+    busy_error_message,
+    chat_events,
+    create_warmup,
+    get_ai_response,
+    knowledge_answer,
+    knowledge_stats,
+    model_router,
+    ndjson_line,
+    prepare_messages,
+    prompt_headers,
+    rate_limiter,
+    response_cache,
+    resume_position,
+    simulate_typing,
+    sse_event,
+    stream_ai_response,
+    stream_encoding,
+    stream_replay,
+    technical_error_message,
+    upstream_admission,
+    validate_batch_item,
+    validate_batch_request,
+    validate_chat_request,
+    warm_upstream,
 )
-logger = logging.getLogger(__name__)
 
-# Load environment variables
-load_dotenv()
+logger = logging.getLogger(__name__)
 
 # Initialize Flask app with CORS
 app = Flask(__name__)
-CORS(app, resources={r"/api/*": {"origins": "*"}})
+CORS(app, resources={r"/api/*": {"origins": "*"}}, expose_headers=EXPOSED_HEADERS)
+if TRUSTED_PROXY_HOPS:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=TRUSTED_PROXY_HOPS)
 
-# Rate limiting configuration
-RATE_LIMIT_WINDOW = 1  # seconds
-last_request_time = 0
+# Each worker warms up in the background while it already answers /api/health
+warmup = create_warmup(warm_upstream)
+if WARMUP:
+    warmup.start()
 
-class ChatbotException(Exception):
-    """Custom exception for chatbot errors"""
-    pass
-
-def initialize_groq_client() -> Groq:
-    """Initialize and return the Groq client with error handling"""
-    try:
-        GROQ_API_KEY = os.getenv("GROQ_API_KEY")
-        if not GROQ_API_KEY:
-            raise ValueError("GROQ_API_KEY environment variable is missing")
-        return Groq(api_key=GROQ_API_KEY)
-    except Exception as e:
-        logger.error(f"Failed to initialize Groq client: {str(e)}")
-        raise ChatbotException("Failed to initialize AI service")
-
-try:
-    client = initialize_groq_client()
-except ChatbotException:
-    # This will cause the app to fail fast if initialization fails
-    raise
-
-# System prompts with improved formatting instructions
-SYSTEM_PROMPTS = {
-    "en": (
-        "You are KrishiBot, an expert AI agricultural assistant for Indian farmers. Follow these guidelines:\n\n"
-        "**Response Format Rules**\n"
-        "1. Always begin with **Bold Title** (HH:MM)\n"
-        "2. Use ## Section Headers with relevant emojis\n"
-        "3. Present information in clear, organized sections\n"
-        "4. Use bullet points (- ✨) for key information\n"
-        "5. Include practical examples from Indian agriculture\n"
-        "6. Provide regional considerations when relevant\n"
-        "7. Use simple, clear language suitable for farmers\n\n"
-        "**Content Guidelines**\n"
-        "- Always explain concepts clearly before giving recommendations\n"
-        "- Provide multiple solutions when available (organic/chemical)\n"
-        "- Include implementation tips and precautions\n"
-        "- Mention government schemes when relevant\n"
-        "- Add 'Did You Know?' facts when appropriate\n\n"
-        "**Example Response**\n\n"
-        "**Cotton Cultivation Best Practices** (14:30)\n\n"
-        "## 🌱 Ideal Growing Conditions\n"
-        "- ✨ Soil: Well-drained black cotton soil (pH 6-7)\n"
-        "- ✨ Temperature: 21-30°C (optimal for growth)\n"
-        "- ✨ Rainfall: 50-100cm annually (drought-resistant varieties available)\n\n"
-        "## 🚜 Planting Recommendations\n"
-        "- ✨ Spacing: 90cm between rows, 60cm between plants\n"
-        "- ✨ Seed rate: 15-20kg/ha for hybrids\n"
-        "- ✨ Best time: June-July for kharif season\n\n"
-        "💡 **Pro Tip**: In Maharashtra, variety NH-615 performs well in rainfed conditions with 20% higher yield than traditional varieties."
-    ),
-    "hi": (
-        "आप कृषि बॉट हैं, भारतीय किसानों के लिए एक विशेषज्ञ कृषि सहायक। इन दिशानिर्देशों का पालन करें:\n\n"
-        "**प्रतिक्रिया प्रारूप नियम**\n"
-        "1. हमेशा **बोल्ड शीर्षक** (HH:MM) से शुरू करें\n"
-        "2. ## अनुभाग शीर्षक और संबंधित इमोजी का उपयोग करें\n"
-        "3. जानकारी को स्पष्ट, व्यवस्थित अनुभागों में प्रस्तुत करें\n"
-        "4. मुख्य जानकारी के लिए बुलेट पॉइंट (- ✨) का उपयोग करें\n"
-        "5. भारतीय कृषि से व्यावहारिक उदाहरण शामिल करें\n"
-        "6. प्रासंगिक होने पर क्षेत्रीय विचार प्रदान करें\n"
-        "7. किसानों के लिए उपयुक्त सरल, स्पष्ट भाषा का प्रयोग करें\n\n"
-        "**सामग्री दिशानिर्देश**\n"
-        "- सिफारिशें देने से पहले हमेशा अवधारणाओं को स्पष्ट रूप से समझाएं\n"
-        "- उपलब्ध होने पर कई समाधान प्रदान करें (जैविक/रासायनिक)\n"
-        "- कार्यान्वयन युक्तियों और सावधानियों को शामिल करें\n"
-        "- प्रासंगिक होने पर सरकारी योजनाओं का उल्लेख करें\n"
-        "- उचित होने पर 'क्या आप जानते हैं?' तथ्य जोड़ें\n\n"
-        "**उदाहरण प्रतिक्रिया**\n\n"
-        "**कपास की खेती की सर्वोत्तम प्रथाएं** (14:30)\n\n"
-        "## 🌱 आदर्श उगाने की स्थितियाँ\n"
-        "- ✨ मिट्टी: अच्छी जल निकासी वाली काली कपास मिट्टी (pH 6-7)\n"
-        "- ✨ तापमान: 21-30°C (विकास के लिए इष्टतम)\n"
-        "- ✨ वर्षा: वार्षिक 50-100 सेमी (सूखा-प्रतिरोधी किस्में उपलब्ध)\n\n"
-        "## 🚜 रोपण की सिफारिशें\n"
-        "- ✨ दूरी: पंक्तियों के बीच 90 सेमी, पौधों के बीच 60 सेमी\n"
-        "- ✨ बीज दर: संकर किस्मों के लिए 15-20 किग्रा/हेक्टेयर\n"
-        "- ✨ सर्वोत्तम समय: खरीफ मौसम के लिए जून-जुलाई\n\n"
-        "💡 **विशेषज्ञ सलाह**: महाराष्ट्र में, एनएच-615 किस्म वर्षा आधारित परिस्थितियों में पारंपरिक किस्मों की तुलना में 20% अधिक उपज देती है।"
-    )
-}
-def validate_chat_request(data: dict) -> tuple:
-    """Validate incoming chat request data"""
-    if not data:
-        return False, "Request data is empty"
-    
-    message = data.get('message', '').strip()
-    if not message:
-        return False, "Message cannot be empty"
-    
-    language = data.get('language', 'en')
-    if language not in SYSTEM_PROMPTS:
-        return False, "Unsupported language"
-    
-    return True, ""
-
-def simulate_typing(text: str, chunk_size: int = 5) -> Generator[str, None, None]:
-    """Generate text chunks for typing simulation"""
-    words = text.split(' ')
-    current_chunk = []
-    
-    for word in words:
-        current_chunk.append(word)
-        if len(current_chunk) >= chunk_size:
-            yield ' '.join(current_chunk)
-            current_chunk = []
-            time.sleep(0.05)  # Natural typing speed
-    
-    if current_chunk:
-        yield ' '.join(current_chunk)
-
-from datetime import datetime
-
-def get_section_emoji(header: str, language: str) -> str:
-    # Dummy emoji map — customize as needed
-    emoji_map = {
-        "Crop Insurance Schemes": "🌾",
-        "Soil Health Schemes": "🌿",
-        "Irrigation Schemes": "💧",
-        "Credit and Subsidy Schemes": "💸",
-        "Market Access Schemes": "📈",
-        "Organic and Sustainable Farming Schemes": "🌱"
-    }
-    return emoji_map.get(header.strip(), "📝")
-
-def enforce_response_format(text: str, language: str) -> str:
-    current_time = datetime.now().strftime("%H:%M")
-
-    lines = text.strip().splitlines()
-    
-    # Handle title
-    title_line = lines[0].strip()
-    if not title_line.startswith("**"):
-        title_line = f"**{title_line}** ({current_time})"
-    elif not title_line.endswith(")") and "(" not in title_line:
-        title_line = title_line.rstrip("*") + f"** ({current_time})"
-    
-    lines[0] = title_line
-    text = "\n".join(lines)
-    
-    sections = text.split('\n\n')
-    formatted_sections = []
-
-    for section in sections:
-        section = section.strip()
-        if not section:
-            continue
-
-        # Headings
-        if section.startswith("##"):
-            header_text = section.replace("##", "").strip()
-            emoji = get_section_emoji(header_text, language)
-            formatted_sections.append(f"## {emoji} {header_text}")
-            continue
-
-        # Tips
-        if section.startswith("Tip:") or section.startswith("Additional Tip:"):
-            tip_label = "💡 Pro Tip" if language == "en" else "💡 विशेषज्ञ सलाह"
-            formatted_sections.append(section.replace("Tip:", f"{tip_label}:").replace("Additional Tip:", f"{tip_label}:"))
-            continue
-
-        # Bullet points
-        lines = section.split('\n')
-        bullet_lines = []
-        for line in lines:
-            line = line.strip()
-            if line.startswith("-"):
-                # Remove extra stars or hashtags
-                content = line.lstrip("-*#").strip()
-                if not content.startswith("✨"):
-                    content = "✨  " + content
-                bullet_lines.append(f"- {content}")
-            else:
-                bullet_lines.append(line)
-        formatted_sections.append("\n".join(bullet_lines))
-
-    # Add dividers between sections
-    final_output = []
-    for i, sec in enumerate(formatted_sections):
-        final_output.append(sec)
-        if i < len(formatted_sections) - 1:
-            next_section = formatted_sections[i + 1]
-            if next_section.startswith("##") or "Pro Tip" in next_section:
-                final_output.append("---")
-
-    return "\n\n".join(final_output)
-
-
-def get_section_emoji(title: str, language: str) -> str:
-    """Returns appropriate emoji for section title"""
-    title = title.lower()
-    emoji_map = {
-        "en": {
-            "pest": "🐛",
-            "organic": "🌿",
-            "management": "🔄",
-            "control": "🛡️",
-            "natural": "🦋",
-            "chemical": "⚠️",
-            "monitor": "🔍",
-            "regional": "📍"
-        },
-        "hi": {
-            "कीट": "🐛",
-            "जैविक": "🌿",
-            "प्रबंधन": "🔄",
-            "नियंत्रण": "🛡️",
-            "प्राकृतिक": "🦋",
-            "रासायनिक": "⚠️",
-            "निगरानी": "🔍",
-            "क्षेत्रीय": "📍"
-        }
-    }
-    
-    for keyword, emoji in emoji_map.get(language, {}).items():
-        if keyword in title:
-            return emoji
-    return "ℹ️"
-
-def get_ai_response(messages: List[Dict[str, str]], language: str = "en") -> str:
-    """Get formatted response from Groq API"""
-    try:
-        messages_with_system = [
-            {"role": "system", "content": SYSTEM_PROMPTS[language]},
-            *messages[-6:]  # Maintain conversation context
-        ]
-        
-        response = client.chat.completions.create(
-            messages=messages_with_system,
-            model="llama3-70b-8192",
-            temperature=0.4,
-            max_tokens=1024,
-            top_p=0.9,
-            stream=False  # We handle streaming ourselves
-        )
-        
-        formatted_response = enforce_response_format(
-            response.choices[0].message.content,
-            language
-        )
-        return formatted_response
-    
-    except Exception as e:
-        logger.error(f"AI API Error: {str(e)}")
-        raise ChatbotException("Failed to generate response")
+@app.after_request
+def add_rate_limit_headers(response: Response) -> Response:
+    """Attach X-RateLimit-* (and Retry-After) headers for rate limited routes"""
+    limit = g.get("rate_limit")
+    if limit is not None:
+        response.headers.update(limit.headers())
+    return response
 
 @app.route('/api/chat', methods=['POST'])
 def chat_handler():
     """Handle chat requests with streaming response"""
-    global last_request_time
-    
+    # A client reconnecting after a dropped stream
+    last_event = parse_event_id(request.headers.get("Last-Event-ID"))
+    log = stream_replay.get(last_event[0]) if last_event else None
+    if log is not None:
+        return resume_stream(log, last_event[1])
+
+    trace = RequestTrace("chat", SLOW_REQUEST_SECONDS, PROFILE_SAMPLE_RATE)
     try:
         # Rate limiting check
-        current_time = time.time()
-        if current_time - last_request_time < RATE_LIMIT_WINDOW:
+        with trace.stage("rate_limit"):
+            g.rate_limit = rate_limiter.hit(client_key(request.headers, request.remote_addr, RATE_LIMIT_API_KEYS))
+        if not g.rate_limit.allowed:
+            trace.finish(429)
             return jsonify({
                 "error": "Please wait a moment before sending another message"
             }), 429
-        last_request_time = current_time
         
         # Validate request
-        data = request.get_json()
-        is_valid, error_msg = validate_chat_request(data)
+        with trace.stage("validate"):
+            data = request.get_json()
+            is_valid, error_msg = validate_chat_request(data)
         if not is_valid:
+            ERRORS_TOTAL.inc(type="invalid_request")
+            trace.finish(400)
             return jsonify({"error": error_msg}), 400
         
-        message = data['message'].strip()
         language = data.get('language', 'en')
-        history = data.get('history', [])
         
-        # Prepare conversation context
-        valid_messages = [
-            msg for msg in history[-6:] 
-            if isinstance(msg, dict) and msg.get("role") and msg.get("content")
-        ]
-        valid_messages.append({"role": "user", "content": message})
+        valid_messages = prepare_messages(data)
+
+        # Common questions are answered from the curated FAQs
+        with trace.stage("knowledge"):
+            faq_answer = knowledge_answer(valid_messages, language)
+
+        # Prepare conversation context, packed once for the headers, the
+        # cache key and the upstream request
+        if faq_answer is not None:
+            headers = {**SSE_HEADERS, "X-Answer-Source": "knowledge"}
+        else:
+            with trace.stage("context"):
+                context = build_context(valid_messages, language)
+                headers = {**SSE_HEADERS, **prompt_headers(context)}
         
         # Get AI response
-        full_response = get_ai_response(valid_messages, language)
+        if faq_answer is not None:
+            chunks = simulate_typing(faq_answer) if STREAM_MODE == "buffered" else iter([faq_answer])
+        elif STREAM_MODE == "buffered":
+            with trace.stage("answer"):
+                full_response = get_ai_response(valid_messages, language, context=context)
+            chunks = simulate_typing(full_response)
+        else:
+            with trace.stage("answer_open"):
+                chunks = stream_ai_response(valid_messages, language, context)
         
+        # Record the response so a dropped client can resume it
+        log = stream_replay.open()
+        headers["X-Stream-ID"] = log.token
+        events = log.lead(coalesce(chat_events(chunks), SSE_COALESCE_BYTES, SSE_FLUSH_INTERVAL))
+
         # Create streaming response
         def generate_stream():
+            STREAMS_IN_FLIGHT.inc()
+            started = time.perf_counter()
+            first_chunk = True
             try:
-                for chunk in simulate_typing(full_response):
-                    yield f"data: {json.dumps({'chunk': chunk})}\n\n"
-                yield "data: {}\n\n"  # End of stream marker
-            except Exception as e:
-                logger.error(f"Streaming error: {str(e)}")
-                yield f"data: {json.dumps({'error': 'Streaming failed'})}\n\n"
-        
-        return Response(
-            generate_stream(),
+                for event_id, data in events:
+                    if first_chunk:
+                        trace.record("first_chunk", trace.elapsed())
+                        first_chunk = False
+                    yield sse_event(event_id, data)
+            finally:
+                # If the client went away the answer keeps being recorded
+                events.close()
+                STREAMS_IN_FLIGHT.dec()
+                trace.record("sse_stream", time.perf_counter() - started)
+
+        body = generate_stream()
+        encoding = stream_encoding(request.headers.get("Accept-Encoding", ""))
+        if encoding:
+            body = gzip_stream(body)
+            headers.update(encoding)
+
+        response = Response(
+            body,
             mimetype="text/event-stream",
-            headers={
-                "Cache-Control": "no-cache",
-                "Connection": "keep-alive"
-            }
+            headers=headers
         )
+        # Runs once the stream has been sent or the client went away
+        response.call_on_close(lambda: trace.finish(200))
+        return response
         
+    except AdmissionRejected as e:
+        ERRORS_TOTAL.inc(type="admission_rejected")
+        trace.finish(503)
+        logger.warning(f"Upstream admission rejected: {str(e)}")
+        return (
+            jsonify({"error": busy_error_message(data.get('language', 'en'))}),
+            503,
+            {"Retry-After": str(e.retry_after)}
+        )
+
     except ChatbotException as e:
+        ERRORS_TOTAL.inc(type="chatbot")
+        trace.finish(500)
         logger.error(f"Chatbot error: {str(e)}")
-        error_msg = (
-            "Sorry, I'm having technical issues. Please try again later."
-            if data.get('language', 'en') == 'en' else
-            "क्षमा करें, तकनीकी समस्या हो रही है। कृपया बाद में प्रयास करें।"
-        )
-        return jsonify({"error": error_msg}), 500
+        return jsonify({"error": technical_error_message(data.get('language', 'en'))}), 500
         
     except Exception as e:
+        ERRORS_TOTAL.inc(type="unexpected")
+        trace.finish(500)
         logger.error(f"Unexpected error: {str(e)}")
         return jsonify({"error": "Internal server error"}), 500
 
+def resume_stream(log: StreamLog, after: int) -> Response:
+    """Replay a recorded stream from after event number `after` onwards"""
+    trace = RequestTrace("chat_resume")
+
+    def generate_stream():
+        STREAMS_IN_FLIGHT.inc()
+        try:
+            for event_id, data in log.subscribe(after, stream_replay.wait_timeout):
+                yield sse_event(event_id, data)
+        except TimeoutError as e:
+            logger.warning(f"Resumed stream stalled: {str(e)}")
+        finally:
+            STREAMS_IN_FLIGHT.dec()
+
+    headers = {**SSE_HEADERS, "X-Stream-ID": log.token}
+    body = generate_stream()
+    encoding = stream_encoding(request.headers.get("Accept-Encoding", ""))
+    if encoding:
+        body = gzip_stream(body)
+        headers.update(encoding)
+
+    response = Response(body, mimetype="text/event-stream", headers=headers)
+    response.call_on_close(lambda: trace.finish(200))
+    return response
+
+@app.route('/api/chat/stream/<token>', methods=['GET'])
+def chat_resume_handler(token: str):
+    """Resume a dropped /api/chat stream by its X-Stream-ID.
+
+    The position comes from Last-Event-ID, or the ?after= event number.
+    """
+    log = stream_replay.get(token)
+    if log is None:
+        return jsonify({"error": "Stream not found or expired"}), 404
+    after = resume_position(
+        token, request.headers.get("Last-Event-ID"), request.args.get("after", 0, type=int)
+    )
+    return resume_stream(log, after)
+
+@app.route('/api/chat/batch', methods=['POST'])
+def chat_batch_handler():
+    """Answer many questions concurrently, streaming NDJSON lines as each one finishes"""
+    trace = RequestTrace("chat_batch")
+    # A batch counts as one request against the client's rate limit
+    g.rate_limit = rate_limiter.hit(client_key(request.headers, request.remote_addr, RATE_LIMIT_API_KEYS))
+    if not g.rate_limit.allowed:
+        trace.finish(429)
+        return jsonify({
+            "error": "Please wait a moment before sending another message"
+        }), 429
+
+    data = request.get_json(silent=True)
+    is_valid, error_msg = validate_batch_request(data)
+    if not is_valid:
+        ERRORS_TOTAL.inc(type="invalid_request")
+        trace.finish(400)
+        return jsonify({"error": error_msg}), 400
+
+    items = data['items']
+
+    def answer(item: dict) -> str:
+        messages = prepare_messages(item)
+        language = item.get('language', 'en')
+        faq_answer = knowledge_answer(messages, language)
+        if faq_answer is not None:
+            return faq_answer
+        return get_ai_response(messages, language, PRIORITY_LOW)
+
+    def generate_results():
+        executor = ThreadPoolExecutor(
+            max_workers=min(BATCH_WORKERS, len(items)),
+            thread_name_prefix="batch"
+        )
+        failed = 0
+        try:
+            futures = {}
+            for index, item in enumerate(items):
+                try:
+                    is_valid, error_msg = validate_batch_item(item)
+                except Exception as e:
+                    # One bad item must not cut the stream short for the rest
+                    failed += 1
+                    yield ndjson_line(batch_error(index, item, e))
+                    continue
+                if is_valid:
+                    futures[executor.submit(answer, item)] = index
+                else:
+                    BATCH_ITEMS_TOTAL.inc(outcome="invalid")
+                    failed += 1
+                    yield ndjson_line({"index": index, "error": error_msg})
+
+            for future in as_completed(futures):
+                index = futures[future]
+                try:
+                    line = batch_success(index, future.result())
+                except Exception as e:
+                    line = batch_error(index, items[index], e)
+                    failed += 1
+                yield ndjson_line(line)
+
+            yield ndjson_line({"done": True, "total": len(items), "failed": failed})
+        finally:
+            # Drop queued items when the client goes away; running ones finish
+            # and still fill the cache
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    response = Response(
+        generate_results(),
+        mimetype=NDJSON_MIMETYPE,
+        headers=SSE_HEADERS
+    )
+    response.call_on_close(lambda: trace.finish(200))
+    return response
+
 @app.route('/api/health', methods=['GET'])
 def health_check():
     """Simple health check endpoint"""
-    return jsonify({"status": "healthy", "timestamp": datetime.now().isoformat()})
+    return jsonify({
+        "status": "healthy",
+        "timestamp": datetime.now().isoformat(),
+        "cache": response_cache.stats(),
+        "admission": upstream_admission.stats(),
+        "models": model_router.stats(),
+        "streams": stream_replay.stats(),
+        "knowledge": knowledge_stats(),
+        "ready": warmup.ready
+    })
+
+@app.route('/api/health/ready', methods=['GET'])
+def readiness_check():
+    """Readiness probe: 503 until the warm-up has finished (at once without WARMUP)"""
+    status = warmup.status()
+    return jsonify(status), 200 if status["ready"] else 503
+
+@app.route('/api/metrics', methods=['GET'])
+def metrics():
+    """Prometheus metrics for this process"""
+    return Response(REGISTRY.render(), content_type=METRICS_CONTENT_TYPE)
 
 if __name__ == '__main__':
     port = int(os.environ.get("PORT", 5000))
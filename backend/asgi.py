@@ -0,0 +1,600 @@
+"""Asyncio serving mode for the chat and health endpoints.
+
+One process can hold many open SSE streams because waiting on Groq does not
+tie up a thread. The request/response and SSE contract is the same as app.py;
+both serve the chat service in service.py.
+
+    uvicorn asgi:app --no-proxy-headers
+
+X-Forwarded-For is read here, trusting TRUSTED_PROXY_HOPS proxies (none by
+default) like the Flask app does, so leave uvicorn's own proxy header
+handling off.
+"""
+import asyncio
+import os
+import time
+import logging
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import TYPE_CHECKING, AsyncIterator, Dict, List, Optional
+
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Route
+
+from admission import AdmissionRejected, PRIORITY_LOW
+from context import PromptContext
+from formatter import ResponseFormatter, enforce_response_format
+from metrics import (
+    REGISTRY, BATCH_ITEMS_TOTAL, ERRORS_TOTAL, STAGE_SECONDS, STREAMS_IN_FLIGHT, RequestTrace, record_usage
+)
+from replay import StreamLog, coalesce_async, gzip_stream_async, parse_event_id
+from router import ModelsUnavailable, RoutedStream
+from startup import Lazy
+from service import (
+    ChatbotException,
+    BATCH_WORKERS,
+    METRICS_CONTENT_TYPE,
+    NDJSON_MIMETYPE,
+    PRIMARY_MODEL,
+    EXPOSED_HEADERS,
+    SSE_COALESCE_BYTES,
+    SSE_FLUSH_INTERVAL,
+    SSE_HEADERS,
+    SLOW_REQUEST_SECONDS,
+    STREAM_MODE,
+    RATE_LIMIT_API_KEYS,
+    TRUSTED_PROXY_HOPS,
+    WARMUP_CONNECTIONS,
+    batch_error,
+    batch_success,
+    build_context,
+    busy_error_message,
+    chunk_usage,
+    completion_request,
+    create_warmup,
+    groq_api_key,
+    knowledge_answer,
+    knowledge_stats,
+    model_router,
+    models_unavailable,
+    ndjson_line,
+    prepare_messages,
+    prompt_headers,
+    rate_limiter,
+    response_cache,
+    response_cache_key,
+    resume_position,
+    simulate_typing,
+    sse_event,
+    stream_encoding,
+    stream_replay,
+    technical_error_message,
+    upstream_admission,
+    upstream_http_options,
+    upstream_priority,
+    validate_batch_item,
+    validate_batch_request,
+    validate_chat_request,
+)
+from ratelimit import MemoryRateLimiter, RateLimitResult, client_key, forwarded_client
+
+if TYPE_CHECKING:
+    from groq import AsyncGroq
+
+logger = logging.getLogger(__name__)
+
+def initialize_async_groq_client() -> "AsyncGroq":
+    """Initialize and return the async Groq client with error handling"""
+    try:
+        import httpx
+        from groq import AsyncGroq
+
+        # No SDK retries: the model router fails over to the other model
+        # instead of hammering the one that just failed
+        return AsyncGroq(api_key=groq_api_key(), http_client=httpx.AsyncClient(**upstream_http_options()),
+                         max_retries=0)
+    except ChatbotException:
+        raise
+    except Exception as e:
+        logger.error(f"Failed to initialize Groq client: {str(e)}")
+        raise ChatbotException("Failed to initialize AI service")
+
+async_client = Lazy(initialize_async_groq_client)
+
+async def warm_upstream_async():
+    """Build the async Groq client and open keep-alive connections to the API"""
+    # Importing the SDK takes a while; keep the event loop free for health checks
+    groq = await asyncio.to_thread(async_client.get)
+    # Concurrent requests each open their own connection, which then stays
+    # in the pool for the first chats
+    await asyncio.gather(*(groq.models.list() for _ in range(WARMUP_CONNECTIONS)))
+
+warmup = create_warmup(warm_upstream_async)
+
+async def acquire_upstream_async(messages: List[Dict[str, str]], priority: Optional[int] = None) -> float:
+    """Wait for an upstream admission slot, recording how long that took"""
+    if priority is None:
+        priority = upstream_priority(messages)
+    started = time.perf_counter()
+    try:
+        return await upstream_admission.acquire_async(priority)
+    finally:
+        STAGE_SECONDS.observe(time.perf_counter() - started, stage="admission_wait")
+
+async def fetch_completion_async(messages: List[Dict[str, str]], context: PromptContext,
+                                 priority: Optional[int] = None, model: str = PRIMARY_MODEL) -> str:
+    """Get the raw, unformatted answer from Groq API in one response"""
+    admitted_at = await acquire_upstream_async(messages, priority)
+    try:
+        with STAGE_SECONDS.time(stage="upstream"):
+            response = await async_client.get().chat.completions.create(
+                **completion_request(context, model),
+                stream=False
+            )
+        record_usage(response.usage)
+        return response.choices[0].message.content
+    except Exception as e:
+        ERRORS_TOTAL.inc(type="upstream")
+        logger.error(f"AI API Error ({model}): {str(e)}")
+        raise ChatbotException("Failed to generate response")
+    finally:
+        upstream_admission.release(admitted_at)
+
+async def open_completion_stream_async(messages: List[Dict[str, str]], context: PromptContext,
+                                      model: str = PRIMARY_MODEL) -> AsyncIterator[str]:
+    """Open a streaming Groq completion and return an async generator of raw deltas"""
+    admitted_at = await acquire_upstream_async(messages)
+    started = time.perf_counter()
+    try:
+        stream = await async_client.get().chat.completions.create(
+            **completion_request(context, model),
+            stream=True
+        )
+    except BaseException as e:
+        upstream_admission.release(admitted_at)
+        if not isinstance(e, Exception):
+            raise
+        ERRORS_TOTAL.inc(type="upstream")
+        logger.error(f"AI API Error ({model}): {str(e)}")
+        raise ChatbotException("Failed to generate response")
+
+    async def generate() -> AsyncIterator[str]:
+        first_token = True
+        try:
+            async for chunk in stream:
+                record_usage(chunk_usage(chunk))
+                if chunk.choices and chunk.choices[0].delta.content:
+                    if first_token:
+                        STAGE_SECONDS.observe(time.perf_counter() - started, stage="upstream_first_token")
+                        first_token = False
+                    yield chunk.choices[0].delta.content
+        except Exception as e:
+            ERRORS_TOTAL.inc(type="upstream_stream")
+            logger.error(f"AI stream error: {str(e)}")
+            raise ChatbotException("Failed to generate response")
+        finally:
+            # Cancelling this generator (client disconnect) closes the upstream call
+            upstream_admission.release(admitted_at)
+            STAGE_SECONDS.observe(time.perf_counter() - started, stage="upstream")
+            await stream.close()
+
+    return generate()
+
+async def fetch_routed_completion_async(messages: List[Dict[str, str]], context: PromptContext, cache_key: str,
+                                       candidates: List[str], priority: Optional[int] = None) -> RoutedStream:
+    """Get the raw answer from the routed model, falling back to the other on failure"""
+    model_router.missed(cache_key, candidates)
+    try:
+        model, text = await model_router.call_async(
+            candidates, lambda model: fetch_completion_async(messages, context, priority, model)
+        )
+    except ModelsUnavailable as e:
+        raise models_unavailable(e)
+
+    async def once() -> AsyncIterator[str]:
+        yield text
+    return RoutedStream(once(), model)
+
+async def open_routed_stream_async(messages: List[Dict[str, str]], context: PromptContext,
+                                   cache_key: str, candidates: List[str]) -> RoutedStream:
+    """Stream the answer from the routed model, hedging a slow first token"""
+    model_router.missed(cache_key, candidates)
+    try:
+        return await model_router.stream_async(
+            candidates, lambda model: open_completion_stream_async(messages, context, model)
+        )
+    except ModelsUnavailable as e:
+        raise models_unavailable(e)
+
+async def get_ai_response_async(messages: List[Dict[str, str]], language: str = "en",
+                                priority: Optional[int] = None,
+                                context: Optional[PromptContext] = None) -> str:
+    """Get formatted response from Groq API, served from the cache when possible"""
+    if context is None:
+        # FAQ lookups behind the prompt read index files, so pack it off the loop
+        context = await asyncio.to_thread(build_context, messages, language)
+    key = response_cache_key(context, language)
+    candidates = model_router.route(messages, language, key)
+    chunks = await response_cache.get_or_stream_async(
+        key,
+        lambda: fetch_routed_completion_async(messages, context, key, candidates, priority),
+        store=model_router.cacheable
+    )
+    try:
+        text = "".join([chunk async for chunk in chunks])
+        with STAGE_SECONDS.time(stage="format"):
+            return enforce_response_format(text, language)
+    except (ChatbotException, AdmissionRejected):
+        raise
+    except Exception as e:
+        logger.error(f"AI API Error: {str(e)}")
+        raise ChatbotException("Failed to generate response")
+
+async def stream_ai_response_async(messages: List[Dict[str, str]], language: str = "en",
+                                   context: Optional[PromptContext] = None) -> AsyncIterator[str]:
+    """Return an async generator of formatted chunks as the answer is produced"""
+    if context is None:
+        context = await asyncio.to_thread(build_context, messages, language)
+    key = response_cache_key(context, language)
+    candidates = model_router.route(messages, language, key)
+    deltas = await response_cache.get_or_stream_async(
+        key,
+        lambda: open_routed_stream_async(messages, context, key, candidates),
+        store=model_router.cacheable
+    )
+
+    async def generate() -> AsyncIterator[str]:
+        formatter = ResponseFormatter(language)
+        formatting = 0.0
+        try:
+            async for delta in deltas:
+                started = time.perf_counter()
+                formatted = formatter.feed(delta)
+                formatting += time.perf_counter() - started
+                if formatted:
+                    yield formatted
+            tail = formatter.flush()
+            if tail:
+                yield tail
+        except ChatbotException:
+            raise
+        except Exception as e:
+            logger.error(f"AI stream error: {str(e)}")
+            raise ChatbotException("Failed to generate response")
+        finally:
+            STAGE_SECONDS.observe(formatting, stage="format")
+            await deltas.aclose()
+
+    return generate()
+
+async def simulate_typing_async(text: str, delay: float = 0.05) -> AsyncIterator[str]:
+    """Replay a buffered answer in chunks without blocking the event loop"""
+    for chunk in simulate_typing(text, delay=0):
+        yield chunk
+        await asyncio.sleep(delay)
+
+async def single_chunk_async(text: str) -> AsyncIterator[str]:
+    """A complete answer as a one-chunk stream"""
+    yield text
+
+async def chat_events_async(chunks: AsyncIterator[str]) -> AsyncIterator[dict]:
+    """SSE payloads for an answer: its chunks, then a done or error marker"""
+    try:
+        async for chunk in chunks:
+            yield {"chunk": chunk}
+        yield {"done": True}  # End of stream marker
+    except Exception as e:
+        ERRORS_TOTAL.inc(type="stream")
+        logger.error(f"Streaming error: {str(e)}")
+        yield {"error": "Streaming failed", "done": True}
+
+async def check_rate_limit(request: Request) -> RateLimitResult:
+    peer = request.client.host if request.client else ""
+    remote_addr = forwarded_client(request.headers.get("X-Forwarded-For", ""), peer, TRUSTED_PROXY_HOPS)
+    key = client_key(request.headers, remote_addr, RATE_LIMIT_API_KEYS)
+    if isinstance(rate_limiter, MemoryRateLimiter):
+        return rate_limiter.hit(key)
+    # Shared backends may block on a lock held by another worker
+    return await asyncio.to_thread(rate_limiter.hit, key)
+
+async def chat_handler(request: Request):
+    """Handle chat requests with streaming response"""
+    # A client reconnecting after a dropped stream
+    last_event = parse_event_id(request.headers.get("Last-Event-ID"))
+    log = stream_replay.get(last_event[0]) if last_event else None
+    if log is not None:
+        return resume_stream(request, log, last_event[1])
+
+    data = None
+    # cProfile cannot tell interleaved requests on the event loop apart,
+    # so only the slow request log is available here
+    trace = RequestTrace("chat", SLOW_REQUEST_SECONDS)
+    try:
+        # Rate limiting check
+        with trace.stage("rate_limit"):
+            limit = await check_rate_limit(request)
+        limit_headers = limit.headers()
+        if not limit.allowed:
+            trace.finish(429)
+            return JSONResponse({
+                "error": "Please wait a moment before sending another message"
+            }, status_code=429, headers=limit_headers)
+
+        # Validate request
+        with trace.stage("validate"):
+            try:
+                data = await request.json()
+            except ValueError:
+                data = None
+            is_valid, error_msg = validate_chat_request(data)
+        if not is_valid:
+            ERRORS_TOTAL.inc(type="invalid_request")
+            trace.finish(400)
+            return JSONResponse({"error": error_msg}, status_code=400, headers=limit_headers)
+
+        language = data.get('language', 'en')
+        valid_messages = prepare_messages(data)
+
+        # Common questions are answered from the curated FAQs. Index lookups
+        # (and the occasional refresh) read files, so they run off the loop
+        with trace.stage("knowledge"):
+            faq_answer = await asyncio.to_thread(knowledge_answer, valid_messages, language)
+
+        if faq_answer is not None:
+            headers = {**SSE_HEADERS, **limit_headers, "X-Answer-Source": "knowledge"}
+        else:
+            # Packed once, off the loop, for the headers, the cache key and
+            # the upstream request
+            with trace.stage("context"):
+                context = await asyncio.to_thread(build_context, valid_messages, language)
+                headers = {**SSE_HEADERS, **limit_headers, **prompt_headers(context)}
+
+        # Get AI response
+        if faq_answer is not None:
+            chunks = (
+                simulate_typing_async(faq_answer) if STREAM_MODE == "buffered"
+                else single_chunk_async(faq_answer)
+            )
+        elif STREAM_MODE == "buffered":
+            with trace.stage("answer"):
+                full_response = await get_ai_response_async(valid_messages, language, context=context)
+            chunks = simulate_typing_async(full_response)
+        else:
+            with trace.stage("answer_open"):
+                chunks = await stream_ai_response_async(valid_messages, language, context)
+
+        # Record the response in the background, so it completes for a
+        # client that reconnects after dropping
+        log = stream_replay.open()
+        headers["X-Stream-ID"] = log.token
+        log.task = asyncio.create_task(log.pump_async(
+            coalesce_async(chat_events_async(chunks), SSE_COALESCE_BYTES, SSE_FLUSH_INTERVAL)
+        ))
+
+        # Create streaming response
+        async def generate_stream() -> AsyncIterator[str]:
+            STREAMS_IN_FLIGHT.inc()
+            started = time.perf_counter()
+            first_chunk = True
+            try:
+                async for event_id, data in log.subscribe_async(0, stream_replay.wait_timeout):
+                    if first_chunk:
+                        trace.record("first_chunk", trace.elapsed())
+                        first_chunk = False
+                    yield sse_event(event_id, data)
+            except TimeoutError as e:
+                ERRORS_TOTAL.inc(type="stream")
+                logger.error(f"Streaming error: {str(e)}")
+            finally:
+                STREAMS_IN_FLIGHT.dec()
+                trace.record("sse_stream", time.perf_counter() - started)
+                trace.finish(200)
+
+        body = generate_stream()
+        encoding = stream_encoding(request.headers.get("Accept-Encoding", ""))
+        if encoding:
+            body = gzip_stream_async(body)
+            headers.update(encoding)
+
+        return StreamingResponse(
+            body,
+            media_type="text/event-stream",
+            headers=headers
+        )
+
+    except AdmissionRejected as e:
+        ERRORS_TOTAL.inc(type="admission_rejected")
+        trace.finish(503)
+        logger.warning(f"Upstream admission rejected: {str(e)}")
+        return JSONResponse(
+            {"error": busy_error_message(data.get('language', 'en'))},
+            status_code=503,
+            headers={"Retry-After": str(e.retry_after)}
+        )
+
+    except ChatbotException as e:
+        ERRORS_TOTAL.inc(type="chatbot")
+        trace.finish(500)
+        logger.error(f"Chatbot error: {str(e)}")
+        language = data.get('language', 'en') if isinstance(data, dict) else 'en'
+        return JSONResponse({"error": technical_error_message(language)}, status_code=500)
+
+    except Exception as e:
+        ERRORS_TOTAL.inc(type="unexpected")
+        trace.finish(500)
+        logger.error(f"Unexpected error: {str(e)}")
+        return JSONResponse({"error": "Internal server error"}, status_code=500)
+
+def resume_stream(request: Request, log: StreamLog, after: int) -> Response:
+    """Replay a recorded stream from after event number `after` onwards"""
+    trace = RequestTrace("chat_resume")
+
+    async def generate_stream() -> AsyncIterator[str]:
+        STREAMS_IN_FLIGHT.inc()
+        try:
+            async for event_id, data in log.subscribe_async(after, stream_replay.wait_timeout):
+                yield sse_event(event_id, data)
+        except TimeoutError as e:
+            logger.warning(f"Resumed stream stalled: {str(e)}")
+        finally:
+            STREAMS_IN_FLIGHT.dec()
+            trace.finish(200)
+
+    headers = {**SSE_HEADERS, "X-Stream-ID": log.token}
+    body = generate_stream()
+    encoding = stream_encoding(request.headers.get("Accept-Encoding", ""))
+    if encoding:
+        body = gzip_stream_async(body)
+        headers.update(encoding)
+
+    return StreamingResponse(body, media_type="text/event-stream", headers=headers)
+
+async def chat_resume_handler(request: Request):
+    """Resume a dropped /api/chat stream by its X-Stream-ID.
+
+    The position comes from Last-Event-ID, or the ?after= event number.
+    """
+    token = request.path_params["token"]
+    log = stream_replay.get(token)
+    if log is None:
+        return JSONResponse({"error": "Stream not found or expired"}, status_code=404)
+    try:
+        after = int(request.query_params.get("after", 0))
+    except ValueError:
+        after = 0
+    return resume_stream(request, log, resume_position(token, request.headers.get("Last-Event-ID"), after))
+
+async def chat_batch_handler(request: Request):
+    """Answer many questions concurrently, streaming NDJSON lines as each one finishes"""
+    trace = RequestTrace("chat_batch")
+    # A batch counts as one request against the client's rate limit
+    limit = await check_rate_limit(request)
+    limit_headers = limit.headers()
+    if not limit.allowed:
+        trace.finish(429)
+        return JSONResponse({
+            "error": "Please wait a moment before sending another message"
+        }, status_code=429, headers=limit_headers)
+
+    try:
+        data = await request.json()
+    except ValueError:
+        data = None
+    is_valid, error_msg = validate_batch_request(data)
+    if not is_valid:
+        ERRORS_TOTAL.inc(type="invalid_request")
+        trace.finish(400)
+        return JSONResponse({"error": error_msg}, status_code=400, headers=limit_headers)
+
+    items = data['items']
+    workers = asyncio.Semaphore(min(BATCH_WORKERS, len(items)))
+
+    async def answer(index: int, item: dict) -> dict:
+        async with workers:
+            try:
+                messages = prepare_messages(item)
+                language = item.get('language', 'en')
+                response = await asyncio.to_thread(knowledge_answer, messages, language)
+                if response is None:
+                    response = await get_ai_response_async(messages, language, PRIORITY_LOW)
+            except Exception as e:
+                return batch_error(index, item, e)
+        return batch_success(index, response)
+
+    async def generate_results() -> AsyncIterator[str]:
+        tasks = []
+        failed = 0
+        try:
+            for index, item in enumerate(items):
+                try:
+                    is_valid, error_msg = validate_batch_item(item)
+                except Exception as e:
+                    # One bad item must not cut the stream short for the rest
+                    failed += 1
+                    yield ndjson_line(batch_error(index, item, e))
+                    continue
+                if is_valid:
+                    tasks.append(asyncio.create_task(answer(index, item)))
+                else:
+                    BATCH_ITEMS_TOTAL.inc(outcome="invalid")
+                    failed += 1
+                    yield ndjson_line({"index": index, "error": error_msg})
+
+            for finished in asyncio.as_completed(tasks):
+                line = await finished
+                failed += "error" in line
+                yield ndjson_line(line)
+
+            yield ndjson_line({"done": True, "total": len(items), "failed": failed})
+        finally:
+            # The client went away: drop items that have not finished
+            for task in tasks:
+                task.cancel()
+            trace.finish(200)
+
+    return StreamingResponse(
+        generate_results(),
+        media_type=NDJSON_MIMETYPE,
+        headers={**SSE_HEADERS, **limit_headers}
+    )
+
+async def health_check(request: Request):
+    """Simple health check endpoint"""
+    return JSONResponse({
+        "status": "healthy",
+        "timestamp": datetime.now().isoformat(),
+        "cache": response_cache.stats(),
+        "admission": upstream_admission.stats(),
+        "models": model_router.stats(),
+        "streams": stream_replay.stats(),
+        "knowledge": knowledge_stats(),
+        "ready": warmup.ready
+    })
+
+async def readiness_check(request: Request):
+    """Readiness probe: 503 until the warm-up has finished (at once without WARMUP)"""
+    status = warmup.status()
+    return JSONResponse(status, status_code=200 if status["ready"] else 503)
+
+async def metrics(request: Request):
+    """Prometheus metrics for this process"""
+    return Response(REGISTRY.render(), media_type=METRICS_CONTENT_TYPE)
+
+@asynccontextmanager
+async def lifespan(app: Starlette):
+    # Warm up in the background so /api/health answers in the meantime
+    task = asyncio.create_task(warmup.run_async()) if warmup.enabled else None
+    yield
+    if task is not None:
+        task.cancel()
+
+app = Starlette(
+    lifespan=lifespan,
+    routes=[
+        Route("/api/chat", chat_handler, methods=["POST"]),
+        Route("/api/chat/stream/{token}", chat_resume_handler, methods=["GET"]),
+        Route("/api/chat/batch", chat_batch_handler, methods=["POST"]),
+        Route("/api/health", health_check, methods=["GET"]),
+        Route("/api/health/ready", readiness_check, methods=["GET"]),
+        Route("/api/metrics", metrics, methods=["GET"]),
+    ],
+    middleware=[
+        Middleware(
+            CORSMiddleware,
+            allow_origins=["*"],
+            allow_methods=["*"],
+            allow_headers=["*"],
+            expose_headers=EXPOSED_HEADERS,
+        )
+    ],
+)
+
+if __name__ == '__main__':
+    import uvicorn
+
+    port = int(os.environ.get("PORT", 5000))
+    uvicorn.run(app, host="0.0.0.0", port=port, proxy_headers=False)
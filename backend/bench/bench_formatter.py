@@ -0,0 +1,178 @@
+"""Micro-benchmark: single-pass ResponseFormatter vs the legacy formatter.
+
+Compares, on large English and Hindi responses:
+  legacy          the original multi-pass enforce_response_format (copied below)
+  legacy_growing  re-running the legacy formatter on the growing buffer per
+                  token, which is what streaming with it would cost
+  single_pass     enforce_response_format on the whole text
+  incremental     ResponseFormatter fed token-sized chunks
+
+    python backend/bench/bench_formatter.py [--sections 200] [--repeat 5]
+
+Prints one JSON object per case.
+"""
+import argparse
+import json
+import os
+import sys
+import timeit
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from formatter import ResponseFormatter, enforce_response_format  # noqa: E402
+
+
+# --- Legacy implementation, kept verbatim as the baseline -------------------
+
+def legacy_get_section_emoji(title: str, language: str) -> str:
+    title = title.lower()
+    emoji_map = {
+        "en": {
+            "pest": "🐛", "organic": "🌿", "management": "🔄", "control": "🛡️",
+            "natural": "🦋", "chemical": "⚠️", "monitor": "🔍", "regional": "📍"
+        },
+        "hi": {
+            "कीट": "🐛", "जैविक": "🌿", "प्रबंधन": "🔄", "नियंत्रण": "🛡️",
+            "प्राकृतिक": "🦋", "रासायनिक": "⚠️", "निगरानी": "🔍", "क्षेत्रीय": "📍"
+        }
+    }
+    for keyword, emoji in emoji_map.get(language, {}).items():
+        if keyword in title:
+            return emoji
+    return "ℹ️"
+
+
+def legacy_enforce_response_format(text: str, language: str) -> str:
+    current_time = datetime.now().strftime("%H:%M")
+    lines = text.strip().splitlines()
+    title_line = lines[0].strip()
+    if not title_line.startswith("**"):
+        title_line = f"**{title_line}** ({current_time})"
+    elif not title_line.endswith(")") and "(" not in title_line:
+        title_line = title_line.rstrip("*") + f"** ({current_time})"
+    lines[0] = title_line
+    text = "\n".join(lines)
+
+    sections = text.split('\n\n')
+    formatted_sections = []
+    for section in sections:
+        section = section.strip()
+        if not section:
+            continue
+        if section.startswith("##"):
+            header_text = section.replace("##", "").strip()
+            emoji = legacy_get_section_emoji(header_text, language)
+            formatted_sections.append(f"## {emoji} {header_text}")
+            continue
+        if section.startswith("Tip:") or section.startswith("Additional Tip:"):
+            tip_label = "💡 Pro Tip" if language == "en" else "💡 विशेषज्ञ सलाह"
+            formatted_sections.append(section.replace("Tip:", f"{tip_label}:").replace("Additional Tip:", f"{tip_label}:"))
+            continue
+        bullet_lines = []
+        for line in section.split('\n'):
+            line = line.strip()
+            if line.startswith("-"):
+                content = line.lstrip("-*#").strip()
+                if not content.startswith("✨"):
+                    content = "✨  " + content
+                bullet_lines.append(f"- {content}")
+            else:
+                bullet_lines.append(line)
+        formatted_sections.append("\n".join(bullet_lines))
+
+    final_output = []
+    for i, sec in enumerate(formatted_sections):
+        final_output.append(sec)
+        if i < len(formatted_sections) - 1:
+            next_section = formatted_sections[i + 1]
+            if next_section.startswith("##") or "Pro Tip" in next_section:
+                final_output.append("---")
+    return "\n\n".join(final_output)
+
+
+# --- Inputs -----------------------------------------------------------------
+
+SECTION_TEMPLATES = {
+    "en": (
+        "## Pest Management for Cotton {n}\n\n"
+        "- Spray neem oil (5 ml/litre) at 15 day intervals\n"
+        "- **Install** pheromone traps at 5 per acre for pink bollworm\n"
+        "- Remove and destroy infested bolls and rosette flowers\n\n"
+        "Regional notes: in Vidarbha, sow Bt hybrids by the first week of June.\n\n"
+        "Tip: Monitor the field twice a week during flowering.\n\n"
+    ),
+    "hi": (
+        "## कपास में कीट प्रबंधन {n}\n\n"
+        "- नीम का तेल (5 मिली/लीटर) 15 दिन के अंतराल पर छिड़कें\n"
+        "- **गुलाबी** सुंडी के लिए प्रति एकड़ 5 फेरोमोन ट्रैप लगाएं\n"
+        "- संक्रमित टिंडे और फूल नष्ट करें\n\n"
+        "क्षेत्रीय सलाह: विदर्भ में बीटी संकर जून के पहले सप्ताह तक बोएं।\n\n"
+        "Tip: फूल आने के समय सप्ताह में दो बार खेत की निगरानी करें।\n\n"
+    ),
+}
+
+
+def make_response(language: str, sections: int) -> str:
+    title = "Cotton Cultivation Guide" if language == "en" else "कपास की खेती मार्गदर्शिका"
+    body = "".join(SECTION_TEMPLATES[language].format(n=n) for n in range(sections))
+    return f"{title}\n\n{body}"
+
+
+def tokenize(text: str, size: int = 4):
+    """Split text into pieces roughly the size of model tokens"""
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+def run_incremental(chunks, language):
+    formatter = ResponseFormatter(language)
+    out = [formatter.feed(chunk) for chunk in chunks]
+    out.append(formatter.flush())
+    return "".join(out)
+
+
+def run_legacy_growing(chunks, language):
+    buffer = ""
+    for chunk in chunks:
+        buffer += chunk
+        legacy_enforce_response_format(buffer, language)
+
+
+def best_of(func, repeat: int) -> float:
+    return min(timeit.repeat(func, number=1, repeat=repeat))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sections", type=int, default=200)
+    parser.add_argument("--growing-sections", type=int, default=20,
+                        help="smaller input for the quadratic legacy_growing case")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    for language in ("en", "hi"):
+        text = make_response(language, args.sections)
+        chunks = tokenize(text)
+        small_chunks = tokenize(make_response(language, args.growing_sections))
+        cases = {
+            "legacy": lambda: legacy_enforce_response_format(text, language),
+            "single_pass": lambda: enforce_response_format(text, language),
+            "incremental": lambda: run_incremental(chunks, language),
+            "legacy_growing": lambda: run_legacy_growing(small_chunks, language),
+            "incremental_growing": lambda: run_incremental(small_chunks, language),
+        }
+        for name, func in cases.items():
+            size = len(small_chunks) if name.endswith("growing") else len(chunks)
+            seconds = best_of(func, args.repeat)
+            print(json.dumps({
+                "language": language,
+                "case": name,
+                "chunks": size,
+                "bytes": len(text.encode("utf-8")) if not name.endswith("growing") else None,
+                "seconds": round(seconds, 6),
+                "us_per_chunk": round(seconds / size * 1e6, 3),
+            }, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
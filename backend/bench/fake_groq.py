@@ -0,0 +1,247 @@
+"""Local stand-in for the Groq chat-completions API.
+
+Serves POST /openai/v1/chat/completions with a canned agricultural answer in
+English or Hindi (picked from the last user message), in streaming (SSE) or
+non-streaming form as the request asks. Point the backend at it with
+GROQ_BASE_URL=http://127.0.0.1:<port>.
+
+    python backend/bench/fake_groq.py --port 8600 --first-token-latency 0.4 \\
+        --tokens-per-sec 250 --error-rate 0.01
+
+--tail-rate/--tail-latency make a fraction of requests slow to start, and
+--fail-model makes every request for a model fail, to exercise hedging and
+the circuit breaker. --connect-latency delays the first response on every new
+connection, like a TLS handshake would, and GET /openai/v1/models lists the
+models for connection warm-up.
+"""
+import argparse
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEVANAGARI_RE = re.compile(r"[ऀ-ॿ]")
+
+ANSWERS = {
+    "en": (
+        "Wheat Sowing Guide\n\n"
+        "## Ideal Sowing Window\n"
+        "- Timely sowing: 1-20 November in north-west India\n"
+        "- Late sowing: up to 15 December with late varieties such as HD 3059\n"
+        "- Soil temperature of 20-22°C gives the best germination\n\n"
+        "## Seed and Spacing\n"
+        "- Seed rate: 100 kg/ha for timely sowing, 125 kg/ha when late\n"
+        "- Row spacing: 20 cm, sowing depth 5 cm\n"
+        "- Treat seed with Trichoderma at 4 g/kg against soil-borne disease\n\n"
+        "## Pest Management\n"
+        "- Watch for termites in light soils and aphids from January\n"
+        "- Use yellow sticky traps before any chemical spray\n\n"
+        "Tip: Give the first irrigation at crown root initiation, 20-25 days after sowing."
+    ),
+    "hi": (
+        "गेहूं बुवाई मार्गदर्शिका\n\n"
+        "## बुवाई का सही समय\n"
+        "- समय पर बुवाई: उत्तर-पश्चिम भारत में 1-20 नवंबर\n"
+        "- पछेती बुवाई: एचडी 3059 जैसी किस्मों के साथ 15 दिसंबर तक\n"
+        "- 20-22°C मिट्टी का तापमान अंकुरण के लिए सबसे अच्छा है\n\n"
+        "## बीज और दूरी\n"
+        "- बीज दर: समय पर बुवाई के लिए 100 किग्रा/हेक्टेयर\n"
+        "- पंक्ति से पंक्ति की दूरी 20 सेमी, गहराई 5 सेमी\n\n"
+        "## कीट प्रबंधन\n"
+        "- हल्की मिट्टी में दीमक और जनवरी से माहू पर नज़र रखें\n\n"
+        "Tip: पहली सिंचाई बुवाई के 20-25 दिन बाद ताजमूल अवस्था पर करें।"
+    ),
+}
+
+
+def split_tokens(text: str):
+    """Split text into word-sized pieces that keep their whitespace"""
+    return re.findall(r"\s*\S+|\s+", text)
+
+
+class FakeGroqServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, first_token_latency: float, tokens_per_sec: float,
+                 error_rate: float, error_status: int, seed: int = 0,
+                 tail_rate: float = 0.0, tail_latency: float = 0.0, failing_models=(),
+                 connect_latency: float = 0.0):
+        super().__init__(address, FakeGroqHandler)
+        self.first_token_latency = first_token_latency
+        self.tokens_per_sec = tokens_per_sec
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.tail_rate = tail_rate
+        self.tail_latency = tail_latency
+        self.failing_models = set(failing_models)
+        self.connect_latency = connect_latency
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+        self.models = {}
+        self.connections = 0
+
+    def should_fail(self, model: str) -> bool:
+        with self.lock:
+            self.requests += 1
+            self.models[model] = self.models.get(model, 0) + 1
+            failed = model in self.failing_models or self.random.random() < self.error_rate
+            self.errors += failed
+            return failed
+
+    def first_token_delay(self) -> float:
+        with self.lock:
+            slow = self.random.random() < self.tail_rate
+        return self.tail_latency if slow else self.first_token_latency
+
+
+class FakeGroqHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: FakeGroqServer
+
+    def log_message(self, format, *args):
+        pass
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.connections += 1
+        # Paid once per connection, so reused keep-alive connections skip it
+        time.sleep(self.server.connect_latency)
+
+    def do_GET(self):
+        if self.path == "/stats":
+            self._send_json(200, {
+                "requests": self.server.requests,
+                "errors": self.server.errors,
+                "models": self.server.models,
+                "connections": self.server.connections,
+            })
+        elif self.path.endswith("/models"):
+            self._send_json(200, {"object": "list", "data": [
+                {"id": model, "object": "model", "created": 0, "owned_by": "fake"}
+                for model in ("llama3-70b-8192", "llama3-8b-8192")
+            ]})
+        else:
+            self._send_json(404, {"error": {"message": "Not found"}})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        body = json.loads(self.rfile.read(length) or b"{}")
+        if not self.path.endswith("/chat/completions"):
+            self._send_json(404, {"error": {"message": "Not found"}})
+            return
+        if self.server.should_fail(body.get("model", "")):
+            time.sleep(self.server.first_token_latency / 2)
+            self._send_json(self.server.error_status, {
+                "error": {"message": "Injected failure", "type": "internal_server_error"}
+            })
+            return
+
+        messages = body.get("messages") or [{}]
+        language = "hi" if DEVANAGARI_RE.search(messages[-1].get("content", "")) else "en"
+        tokens = split_tokens(ANSWERS[language])
+        prompt_tokens = sum(len(m.get("content", "")) for m in messages) // 4
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": len(tokens),
+            "total_tokens": prompt_tokens + len(tokens),
+        }
+        meta = {
+            "id": f"chatcmpl-{uuid.uuid4().hex[:24]}",
+            "created": int(time.time()),
+            "model": body.get("model", "llama3-70b-8192"),
+        }
+        time.sleep(self.server.first_token_delay())
+        if body.get("stream"):
+            self._stream(meta, tokens, usage)
+        else:
+            time.sleep(len(tokens) / self.server.tokens_per_sec)
+            self._send_json(200, {
+                **meta,
+                "object": "chat.completion",
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": "".join(tokens)},
+                    "finish_reason": "stop",
+                }],
+                "usage": usage,
+            })
+
+    def _stream(self, meta: dict, tokens, usage: dict):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        interval = 1 / self.server.tokens_per_sec
+        try:
+            for index, token in enumerate(tokens):
+                delta = {"content": token}
+                if index == 0:
+                    delta["role"] = "assistant"
+                self._event({**meta, "object": "chat.completion.chunk", "choices": [
+                    {"index": 0, "delta": delta, "finish_reason": None}
+                ]})
+                time.sleep(interval)
+            self._event({**meta, "object": "chat.completion.chunk", "choices": [
+                {"index": 0, "delta": {}, "finish_reason": "stop"}
+            ], "x_groq": {"id": meta["id"], "usage": usage}})
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # The backend cancelled the call
+        self.close_connection = True
+
+    def _event(self, payload: dict):
+        self.wfile.write(f"data: {json.dumps(payload, ensure_ascii=False)}\n\n".encode("utf-8"))
+        self.wfile.flush()
+
+    def _send_json(self, status: int, payload: dict):
+        data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def serve(port: int, first_token_latency: float, tokens_per_sec: float,
+          error_rate: float, error_status: int = 500, **options) -> FakeGroqServer:
+    """Start the fake server on a background thread and return it"""
+    server = FakeGroqServer(("127.0.0.1", port), first_token_latency, tokens_per_sec,
+                            error_rate, error_status, **options)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake Groq chat-completions server")
+    parser.add_argument("--port", type=int, default=8600)
+    parser.add_argument("--first-token-latency", type=float, default=0.4, help="seconds")
+    parser.add_argument("--tokens-per-sec", type=float, default=250)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests that fail")
+    parser.add_argument("--error-status", type=int, default=500, help="status code for injected failures")
+    parser.add_argument("--tail-rate", type=float, default=0.0, help="fraction of requests that start slowly")
+    parser.add_argument("--tail-latency", type=float, default=5.0, help="first token latency of slow requests")
+    parser.add_argument("--fail-model", action="append", default=[], help="model whose requests always fail")
+    parser.add_argument("--connect-latency", type=float, default=0.0, help="setup time of each new connection")
+    args = parser.parse_args()
+
+    server = FakeGroqServer(("127.0.0.1", args.port), args.first_token_latency,
+                            args.tokens_per_sec, args.error_rate, args.error_status,
+                            tail_rate=args.tail_rate, tail_latency=args.tail_latency,
+                            failing_models=args.fail_model, connect_latency=args.connect_latency)
+    print(f"Fake Groq listening on http://127.0.0.1:{args.port}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,192 @@
+"""Concurrent SSE load generator for /api/chat.
+
+Opens --concurrency clients that send --requests chats in total and read the
+SSE stream to the end. Reports time to first chunk, total latency
+percentiles, throughput, status code rates and (with --server-pid) the
+server's peak RSS as one JSON object.
+
+    python backend/bench/loadgen.py --url http://127.0.0.1:5000 \\
+        --concurrency 100 --requests 1000 --unique 0.2 --output run.json
+"""
+import argparse
+import asyncio
+import json
+import random
+import sys
+import time
+from collections import Counter
+from typing import Dict, List, Optional
+
+import httpx
+
+QUESTIONS = {
+    "en": [
+        "Best time to sow wheat",
+        "PM-KISAN eligibility",
+        "Cotton pink bollworm control",
+        "How much urea for paddy per acre",
+        "Drip irrigation subsidy for sugarcane",
+    ],
+    "hi": [
+        "गेहूं बोने का सही समय",
+        "पीएम-किसान के लिए पात्रता",
+        "कपास में गुलाबी सुंडी नियंत्रण",
+    ],
+}
+
+
+def percentile(values: List[float], pct: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return round(ordered[index], 4)
+
+
+def summarize(values: List[float]) -> Dict[str, Optional[float]]:
+    return {
+        "p50": percentile(values, 50),
+        "p90": percentile(values, 90),
+        "p99": percentile(values, 99),
+        "max": round(max(values), 4) if values else None,
+        "mean": round(sum(values) / len(values), 4) if values else None,
+    }
+
+
+def read_rss_kb(pid: int) -> Optional[int]:
+    """Resident set size of a process (and its children are not included)"""
+    try:
+        with open(f"/proc/{pid}/status") as status:
+            for line in status:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])
+    except OSError:
+        return None
+    return None
+
+
+def make_payload(rng: random.Random, unique: float, index: int) -> dict:
+    language = rng.choice(["en", "en", "hi"])
+    question = rng.choice(QUESTIONS[language])
+    if rng.random() < unique:
+        question = f"{question} (variant {index})"
+    return {"message": question, "language": language, "history": []}
+
+
+async def one_chat(client: httpx.AsyncClient, payload: dict, client_ip: str) -> dict:
+    started = time.perf_counter()
+    result = {"status": None, "ttfc": None, "latency": None, "bytes": 0, "error": None}
+    try:
+        async with client.stream("POST", "/api/chat", json=payload,
+                                 headers={"X-Forwarded-For": client_ip}) as response:
+            result["status"] = response.status_code
+            async for line in response.aiter_lines():
+                result["bytes"] += len(line) + 1
+                if not line.startswith("data: "):
+                    continue
+                event = json.loads(line[6:])
+                if event.get("chunk") and result["ttfc"] is None:
+                    result["ttfc"] = time.perf_counter() - started
+                if event.get("error"):
+                    result["error"] = event["error"]
+                if event.get("done"):
+                    break
+    except (httpx.HTTPError, json.JSONDecodeError) as e:
+        result["error"] = type(e).__name__
+    result["latency"] = time.perf_counter() - started
+    return result
+
+
+async def run(args) -> dict:
+    rng = random.Random(args.seed)
+    payloads = [make_payload(rng, args.unique, i) for i in range(args.requests)]
+    queue: asyncio.Queue = asyncio.Queue()
+    for item in enumerate(payloads):
+        queue.put_nowait(item)
+    results: List[dict] = []
+    rss_samples: List[int] = []
+
+    async def worker(client: httpx.AsyncClient):
+        while not queue.empty():
+            index, payload = queue.get_nowait()
+            # Every chat comes from a different farmer, as far as the
+            # per-client rate limiter is concerned: run the backend with
+            # TRUSTED_PROXY_HOPS=1 (run.py does) and the load generator plays
+            # that proxy
+            client_ip = f"10.{index >> 16 & 255}.{index >> 8 & 255}.{index & 255}"
+            results.append(await one_chat(client, payload, client_ip))
+
+    async def sample_rss():
+        while True:
+            rss = read_rss_kb(args.server_pid)
+            if rss:
+                rss_samples.append(rss)
+            await asyncio.sleep(0.2)
+
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    timeout = httpx.Timeout(args.timeout)
+    sampler = asyncio.create_task(sample_rss()) if args.server_pid else None
+    started = time.perf_counter()
+    async with httpx.AsyncClient(base_url=args.url, limits=limits, timeout=timeout) as client:
+        await asyncio.gather(*(worker(client) for _ in range(args.concurrency)))
+    elapsed = time.perf_counter() - started
+    if sampler:
+        sampler.cancel()
+
+    statuses = Counter(r["status"] for r in results)
+    ok = [r for r in results if r["status"] == 200 and not r["error"]]
+    total = len(results)
+    return {
+        "label": args.label,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "config": {
+            "url": args.url,
+            "concurrency": args.concurrency,
+            "requests": args.requests,
+            "unique": args.unique,
+        },
+        "duration_s": round(elapsed, 3),
+        "throughput_rps": round(len(ok) / elapsed, 3) if elapsed else None,
+        "completed": len(ok),
+        "status_counts": {str(k): v for k, v in sorted(statuses.items(), key=str)},
+        "rate_429": round(statuses.get(429, 0) / total, 4) if total else 0,
+        "rate_5xx": round(sum(v for k, v in statuses.items() if k and k >= 500) / total, 4) if total else 0,
+        "stream_errors": sum(1 for r in results if r["error"]),
+        "ttfc_s": summarize([r["ttfc"] for r in ok if r["ttfc"] is not None]),
+        "latency_s": summarize([r["latency"] for r in ok]),
+        "bytes_received": sum(r["bytes"] for r in results),
+        "server_rss_kb": {
+            "peak": max(rss_samples) if rss_samples else None,
+            "last": rss_samples[-1] if rss_samples else None,
+        },
+    }
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Load generator for /api/chat")
+    parser.add_argument("--url", default="http://127.0.0.1:5000")
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--unique", type=float, default=1.0,
+                        help="fraction of questions made unique (0 = all repeats)")
+    parser.add_argument("--timeout", type=float, default=120)
+    parser.add_argument("--server-pid", type=int, default=0, help="sample this process's RSS")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--label", default="")
+    parser.add_argument("--output", help="write the JSON report here as well as stdout")
+    return parser
+
+
+def main(argv=None) -> dict:
+    args = build_parser().parse_args(argv)
+    report = asyncio.run(run(args))
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    print(text)
+    if args.output:
+        with open(args.output, "w") as output:
+            output.write(text + "\n")
+    return report
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,135 @@
+"""Offline end-to-end benchmark of /api/chat.
+
+Starts the fake Groq server, starts the backend (Flask or ASGI) pointed at
+it, runs the load generator and prints one JSON report with the load results,
+the fake upstream's request counts and the backend's /api/health stats.
+
+    python backend/bench/run.py --server flask --concurrency 50 --requests 500
+    python backend/bench/run.py --server asgi --env STREAM_MODE=buffered \\
+        --label buffered-asgi --output results/buffered-asgi.json
+
+Use --env KEY=VALUE (repeatable) to try backend configuration changes.
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+import fake_groq  # noqa: E402
+import loadgen  # noqa: E402
+
+SERVER_SCRIPTS = {"flask": "app.py", "asgi": "asgi.py"}
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def get_json(url: str) -> dict:
+    with urllib.request.urlopen(url, timeout=5) as response:
+        return json.loads(response.read())
+
+
+def wait_for(url: str, timeout: float = 30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            return get_json(url)
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"Backend did not become healthy at {url}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline /api/chat benchmark")
+    parser.add_argument("--server", choices=sorted(SERVER_SCRIPTS), default="flask")
+    parser.add_argument("--env", action="append", default=[], metavar="KEY=VALUE",
+                        help="extra environment for the backend")
+    parser.add_argument("--first-token-latency", type=float, default=0.4)
+    parser.add_argument("--tokens-per-sec", type=float, default=250)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--tail-rate", type=float, default=0.0)
+    parser.add_argument("--tail-latency", type=float, default=5.0)
+    parser.add_argument("--fail-model", action="append", default=[])
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--unique", type=float, default=1.0)
+    parser.add_argument("--label", default="")
+    parser.add_argument("--output")
+    args = parser.parse_args()
+
+    upstream = fake_groq.serve(free_port(), args.first_token_latency,
+                               args.tokens_per_sec, args.error_rate,
+                               tail_rate=args.tail_rate, tail_latency=args.tail_latency,
+                               failing_models=args.fail_model)
+    port = free_port()
+    env = {
+        **os.environ,
+        "GROQ_API_KEY": "bench",
+        "GROQ_BASE_URL": f"http://127.0.0.1:{upstream.server_port}",
+        "PORT": str(port),
+        # The load generator plays a reverse proxy that appends the client address
+        "TRUSTED_PROXY_HOPS": "1",
+    }
+    env.update(item.split("=", 1) for item in args.env)
+
+    backend = subprocess.Popen(
+        [sys.executable, SERVER_SCRIPTS[args.server]],
+        cwd=BACKEND_DIR, env=env,
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        wait_for(f"{base_url}/api/health")
+        report = run_loadgen(args, base_url, backend.pid)
+        report["server"] = args.server
+        report["backend_env"] = args.env
+        report["upstream"] = {
+            "first_token_latency": args.first_token_latency,
+            "tokens_per_sec": args.tokens_per_sec,
+            "error_rate": args.error_rate,
+            "tail_rate": args.tail_rate,
+            "tail_latency": args.tail_latency,
+            "requests": upstream.requests,
+            "errors": upstream.errors,
+            "models": upstream.models,
+        }
+        report["backend_health"] = get_json(f"{base_url}/api/health")
+    finally:
+        backend.terminate()
+        backend.wait(timeout=10)
+        upstream.shutdown()
+
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    print(text)
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w") as output:
+            output.write(text + "\n")
+
+
+def run_loadgen(args, base_url: str, pid: int) -> dict:
+    loadgen_args = loadgen.build_parser().parse_args([
+        "--url", base_url,
+        "--concurrency", str(args.concurrency),
+        "--requests", str(args.requests),
+        "--unique", str(args.unique),
+        "--server-pid", str(pid),
+        "--label", args.label,
+    ])
+    return asyncio.run(loadgen.run(loadgen_args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,228 @@
+"""Offline cold start benchmark.
+
+Breaks the import time of the server module down by top-level package
+(python -X importtime), then starts the backend against the fake Groq server
+--runs times and measures, from process start:
+
+- live: first answer from /api/health
+- ready: first 200 from /api/health/ready (the end of the warm-up, if any)
+- first_chunk / first_response: first SSE chunk and done marker of the first
+  /api/chat, sent as soon as the backend is ready
+- the same for a second, different question, which the warm process answers
+
+    python backend/bench/startup.py --server flask --runs 5
+    python backend/bench/startup.py --server asgi --env WARMUP=true \\
+        --connect-latency 0.3 --max-import-ms 300 --max-first-response-ms 3000
+
+Exits with status 1 when a --max-* threshold is exceeded by the median, so a
+CI job can catch start-up regressions.
+"""
+import argparse
+import http.client
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+from typing import Dict, List, Tuple
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+import fake_groq  # noqa: E402
+from run import SERVER_SCRIPTS, free_port  # noqa: E402
+
+IMPORTTIME_RE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)$")
+
+# Neither matches a curated FAQ entry, so both go to the model
+QUESTIONS = [
+    "How do I control whitefly in cotton without harming bees?",
+    "Which intercrop works well with sugarcane in the first 90 days?",
+]
+
+
+def import_profile(module: str, env: Dict[str, str]) -> Tuple[float, List[Tuple[str, float]]]:
+    """Total import time of module and the self time per top-level package, in ms"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=BACKEND_DIR, env=env, capture_output=True, text=True, check=True
+    )
+    total = 0.0
+    packages: Dict[str, float] = {}
+    for line in result.stderr.splitlines():
+        match = IMPORTTIME_RE.match(line)
+        if not match:
+            continue
+        self_us, cumulative_us, _, name = match.groups()
+        package = name.split(".")[0]
+        packages[package] = packages.get(package, 0.0) + int(self_us) / 1000
+        if name == module:
+            total = int(cumulative_us) / 1000
+    return total, sorted(packages.items(), key=lambda item: item[1], reverse=True)
+
+
+def poll(url: str, started: float, timeout: float, status: int = 200) -> float:
+    """Seconds from started until url answers with status"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with urllib.request.urlopen(url, timeout=5) as response:
+                if response.status == status:
+                    return time.monotonic() - started
+        except urllib.error.HTTPError as e:
+            if e.code == status:
+                return time.monotonic() - started
+        except OSError:
+            pass
+        time.sleep(0.01)
+    raise RuntimeError(f"No {status} from {url} within {timeout}s")
+
+
+def chat(port: int, question: str, started: float) -> Tuple[float, float]:
+    """Seconds from started to the first chunk and to the done marker of one chat"""
+    connection = http.client.HTTPConnection("127.0.0.1", port, timeout=60)
+    try:
+        connection.request("POST", "/api/chat", json.dumps({"message": question, "language": "en"}),
+                           {"Content-Type": "application/json"})
+        response = connection.getresponse()
+        if response.status != 200:
+            raise RuntimeError(f"/api/chat answered {response.status}: {response.read()[:200]!r}")
+        first_chunk = None
+        for line in response:
+            if not line.startswith(b"data: "):
+                continue
+            payload = json.loads(line[6:])
+            if "error" in payload:
+                raise RuntimeError(f"/api/chat stream failed: {payload['error']}")
+            if first_chunk is None and "chunk" in payload:
+                first_chunk = time.monotonic() - started
+            if payload.get("done"):
+                return first_chunk, time.monotonic() - started
+        raise RuntimeError("/api/chat stream ended without a done marker")
+    finally:
+        connection.close()
+
+
+def measure_start(args, env: Dict[str, str]) -> Dict[str, float]:
+    """Start one backend process and time its way to the first answers"""
+    port = free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    started = time.monotonic()
+    backend = subprocess.Popen(
+        [sys.executable, SERVER_SCRIPTS[args.server]],
+        cwd=BACKEND_DIR, env={**env, "PORT": str(port)},
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        live = poll(f"{base_url}/api/health", started, args.timeout)
+        ready = poll(f"{base_url}/api/health/ready", started, args.timeout)
+        first_chunk, first_response = chat(port, QUESTIONS[0], started)
+        second_started = time.monotonic()
+        second_chunk, second_response = chat(port, QUESTIONS[1], second_started)
+    finally:
+        backend.terminate()
+        backend.wait(timeout=10)
+    return {
+        "live": live,
+        "ready": ready,
+        "first_chunk": first_chunk,
+        "first_response": first_response,
+        "first_chat": first_response - ready,
+        "second_chunk": second_chunk,
+        "second_response": second_response,
+    }
+
+
+def summarize(runs: List[Dict[str, float]]) -> Dict[str, Dict[str, float]]:
+    return {
+        name: {
+            "median_ms": round(statistics.median(run[name] for run in runs) * 1000, 1),
+            "max_ms": round(max(run[name] for run in runs) * 1000, 1),
+        }
+        for name in runs[0]
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline cold start benchmark")
+    parser.add_argument("--server", choices=sorted(SERVER_SCRIPTS), default="flask")
+    parser.add_argument("--env", action="append", default=[], metavar="KEY=VALUE",
+                        help="extra environment for the backend")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--first-token-latency", type=float, default=0.4)
+    parser.add_argument("--tokens-per-sec", type=float, default=250)
+    parser.add_argument("--connect-latency", type=float, default=0.0,
+                        help="setup time of each new upstream connection (TLS stand-in)")
+    parser.add_argument("--top", type=int, default=12, help="packages to list in the import breakdown")
+    parser.add_argument("--timeout", type=float, default=30)
+    parser.add_argument("--max-import-ms", type=float)
+    parser.add_argument("--max-ready-ms", type=float)
+    parser.add_argument("--max-first-response-ms", type=float)
+    parser.add_argument("--label", default="")
+    parser.add_argument("--output")
+    args = parser.parse_args()
+
+    upstream = fake_groq.serve(free_port(), args.first_token_latency, args.tokens_per_sec, 0.0,
+                               connect_latency=args.connect_latency)
+    env = {
+        **os.environ,
+        "GROQ_API_KEY": "bench",
+        "GROQ_BASE_URL": f"http://127.0.0.1:{upstream.server_port}",
+        # Every question must reach the fresh process's upstream path
+        "CACHE_MAX_ENTRIES": "0",
+    }
+    env.update(item.split("=", 1) for item in args.env)
+
+    module = os.path.splitext(SERVER_SCRIPTS[args.server])[0]
+    try:
+        imports = [import_profile(module, env) for _ in range(args.runs)]
+        runs = [measure_start(args, env) for _ in range(args.runs)]
+    finally:
+        upstream.shutdown()
+
+    import_ms = statistics.median(total for total, _ in imports)
+    report = {
+        "label": args.label,
+        "server": args.server,
+        "backend_env": args.env,
+        "runs": args.runs,
+        "import": {
+            "median_ms": round(import_ms, 1),
+            "packages_ms": {package: round(ms, 1) for package, ms in imports[0][1][:args.top]},
+        },
+        "startup": summarize(runs),
+        "upstream": {
+            "first_token_latency": args.first_token_latency,
+            "connect_latency": args.connect_latency,
+            "requests": upstream.requests,
+            "connections": upstream.connections,
+        },
+    }
+
+    failures = []
+    for name, limit, value in (
+        ("import", args.max_import_ms, import_ms),
+        ("ready", args.max_ready_ms, report["startup"]["ready"]["median_ms"]),
+        ("first_response", args.max_first_response_ms, report["startup"]["first_response"]["median_ms"]),
+    ):
+        if limit is not None and value > limit:
+            failures.append(f"{name} {value:.1f}ms > {limit:.1f}ms")
+    report["failures"] = failures
+
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    print(text)
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w") as output:
+            output.write(text + "\n")
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,359 @@
+import asyncio
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import AsyncIterator, Awaitable, Callable, Dict, Iterator, List, Optional, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+# Whether to cache a new answer, or a predicate deciding it from the finished source
+Store = Union[bool, Callable[[object], bool]]
+
+# Trailing punctuation that does not change the meaning of a question
+TRAILING_PUNCTUATION = "?.!।॥ "
+
+def normalize_message(message: str) -> str:
+    """Normalize a user message so trivially different questions share a key"""
+    return " ".join(message.casefold().split()).rstrip(TRAILING_PUNCTUATION)
+
+def make_cache_key(language: str, message: str, history: List[Dict[str, str]]) -> str:
+    """Build a cache key from the language, normalized message and history hash"""
+    history_blob = json.dumps(
+        [[msg.get("role"), msg.get("content")] for msg in history],
+        ensure_ascii=False
+    )
+    history_hash = hashlib.sha256(history_blob.encode("utf-8")).hexdigest()[:16]
+    return f"{language}:{history_hash}:{normalize_message(message)}"
+
+
+class _Flight:
+    """An upstream call in progress that several requests can subscribe to.
+
+    Subscribers may be threads (subscribe) or asyncio tasks (subscribe_async).
+    """
+
+    def __init__(self, store: Store = True):
+        self.store = store
+        self.chunks: List[str] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.cond = threading.Condition()
+        self.updated = time.monotonic()
+        self.subscribers = 0
+        self.task: Optional[asyncio.Task] = None
+        self._waiters: List[Tuple[asyncio.AbstractEventLoop, asyncio.Event]] = []
+
+    def stalled(self, timeout: float) -> bool:
+        """True if the flight made no progress for timeout seconds"""
+        return time.monotonic() - self.updated > timeout
+
+    def append(self, chunk: str):
+        with self.cond:
+            self.chunks.append(chunk)
+            self.updated = time.monotonic()
+            self._notify()
+
+    def finish(self):
+        with self.cond:
+            self.done = True
+            self._notify()
+
+    def fail(self, error: BaseException):
+        with self.cond:
+            self.error = error
+            self._notify()
+
+    def _notify(self):
+        # Called with self.cond held
+        self.cond.notify_all()
+        for loop, event in self._waiters:
+            loop.call_soon_threadsafe(event.set)
+        self._waiters.clear()
+
+    def _unsubscribe(self) -> int:
+        with self.cond:
+            self.subscribers -= 1
+            return self.subscribers
+
+    def subscribe(self, timeout: float) -> Iterator[str]:
+        """Yield chunks as they are produced, raising the leader's error if any"""
+        index = 0
+        with self.cond:
+            self.subscribers += 1
+        try:
+            while True:
+                with self.cond:
+                    deadline = time.monotonic() + timeout
+                    while index >= len(self.chunks) and not self.done and self.error is None:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            raise TimeoutError("Timed out waiting for shared upstream response")
+                        self.cond.wait(remaining)
+                    pending = self.chunks[index:]
+                    done, error = self.done, self.error
+                index += len(pending)
+                yield from pending
+                if error is not None:
+                    raise error
+                if done:
+                    return
+        finally:
+            self._unsubscribe()
+
+    async def subscribe_async(self, timeout: float) -> AsyncIterator[str]:
+        """Async variant of subscribe; cancels the upstream task when the
+        last subscriber leaves before the answer is complete"""
+        index = 0
+        with self.cond:
+            self.subscribers += 1
+        try:
+            while True:
+                event = None
+                with self.cond:
+                    if index >= len(self.chunks) and not self.done and self.error is None:
+                        event = asyncio.Event()
+                        self._waiters.append((asyncio.get_running_loop(), event))
+                    pending = self.chunks[index:]
+                    done, error = self.done, self.error
+                if event is not None:
+                    try:
+                        await asyncio.wait_for(event.wait(), timeout)
+                    except asyncio.TimeoutError:
+                        raise TimeoutError("Timed out waiting for shared upstream response")
+                    continue
+                index += len(pending)
+                for chunk in pending:
+                    yield chunk
+                if error is not None:
+                    raise error
+                if done:
+                    return
+        finally:
+            if self._unsubscribe() == 0 and self.task is not None and not self.task.done():
+                self.task.cancel()
+
+
+async def _aiter_once(text: str) -> AsyncIterator[str]:
+    yield text
+
+
+class _Entry:
+    __slots__ = ("text", "size", "expires_at")
+
+    def __init__(self, text: str, size: int, expires_at: float):
+        self.text = text
+        self.size = size
+        self.expires_at = expires_at
+
+
+class ResponseCache:
+    """LRU cache of upstream answers with a TTL, a memory limit and
+    single-flight coalescing of identical concurrent requests.
+
+    Cached values are the raw upstream text; callers format on the way out.
+    """
+
+    def __init__(self, max_entries: int = 512, max_bytes: int = 16 * 1024 * 1024,
+                 ttl: float = 6 * 60 * 60, wait_timeout: float = 120):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.wait_timeout = wait_timeout
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._flights: Dict[str, _Flight] = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0 and self.max_bytes > 0
+
+    def get_or_stream(self, key: str, open_stream: Callable[[], Iterator[str]],
+                      store: Store = True) -> Iterator[str]:
+        """Return an iterator over the answer for key.
+
+        Cache hits return the stored text. If an identical request is already
+        in flight the caller subscribes to it; otherwise open_stream is called
+        and its chunks are shared with any request that arrives meanwhile.
+        With store=False a new answer is shared that way but not cached; a
+        callable store is asked with the source once it has completed.
+        Errors raised by open_stream propagate to the caller.
+        """
+        if not self.enabled:
+            return open_stream()
+
+        kind, value = self._acquire(key, store)
+        if kind == "hit":
+            return iter([value])
+        if kind == "follow":
+            return value.subscribe(self.wait_timeout)
+
+        flight = value
+        try:
+            source = open_stream()
+        except BaseException as e:
+            flight.fail(e)
+            self._end_flight(key, flight)
+            raise
+
+        return self._lead(key, flight, source)
+
+    async def get_or_stream_async(self, key: str,
+                                  open_stream: Callable[[], Awaitable[AsyncIterator[str]]],
+                                  store: Store = True) -> AsyncIterator[str]:
+        """Async variant of get_or_stream for the ASGI app.
+
+        The upstream stream is read by a background task, so it keeps going
+        while any subscriber is connected and is cancelled when none are left.
+        """
+        if not self.enabled:
+            return await open_stream()
+
+        kind, value = self._acquire(key, store)
+        if kind == "hit":
+            return _aiter_once(value)
+        if kind == "follow":
+            return value.subscribe_async(self.wait_timeout)
+
+        flight = value
+        try:
+            source = await open_stream()
+        except BaseException as e:
+            flight.fail(e)
+            self._end_flight(key, flight)
+            raise
+
+        flight.task = asyncio.get_running_loop().create_task(self._pump_async(key, flight, source))
+        return flight.subscribe_async(self.wait_timeout)
+
+    def _acquire(self, key: str, store: Store = True) -> Tuple[str, object]:
+        """Look up key: ("hit", text), ("follow", flight) or ("lead", new flight)"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry.expires_at > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return "hit", entry.text
+                self._remove(key)
+                self.expirations += 1
+
+            flight = self._flights.get(key)
+            if flight is not None and flight.stalled(self.wait_timeout):
+                # The leader was abandoned before it started; take over
+                flight.fail(TimeoutError("Shared upstream response was abandoned"))
+                flight = None
+            if flight is not None:
+                self.coalesced += 1
+                return "follow", flight
+
+            self.misses += 1
+            flight = _Flight(store)
+            self._flights[key] = flight
+            return "lead", flight
+
+    async def _pump_async(self, key: str, flight: _Flight, source: AsyncIterator[str]):
+        try:
+            async for chunk in source:
+                flight.append(chunk)
+        except asyncio.CancelledError:
+            flight.fail(ConnectionAbortedError("All clients disconnected"))
+            self._end_flight(key, flight)
+            raise
+        except Exception as e:
+            flight.fail(e)
+            self._end_flight(key, flight)
+        else:
+            self._complete(key, flight, source)
+        finally:
+            aclose = getattr(source, "aclose", None)
+            if aclose:
+                await aclose()
+
+    def _lead(self, key: str, flight: _Flight, source: Iterator[str]) -> Iterator[str]:
+        """Relay chunks from source to the caller and to all subscribers"""
+        try:
+            for chunk in source:
+                flight.append(chunk)
+                yield chunk
+        except Exception as e:
+            flight.fail(e)
+            self._end_flight(key, flight)
+            raise
+        else:
+            self._complete(key, flight, source)
+        finally:
+            if not flight.done and flight.error is None:
+                # The leading client went away; finish the upstream call in the
+                # background so subscribers and later requests still get it
+                threading.Thread(
+                    target=self._drain, args=(key, flight, source), daemon=True
+                ).start()
+
+    def _drain(self, key: str, flight: _Flight, source: Iterator[str]):
+        try:
+            for chunk in source:
+                flight.append(chunk)
+        except Exception as e:
+            logger.error(f"Background upstream drain failed: {str(e)}")
+            flight.fail(e)
+            self._end_flight(key, flight)
+        else:
+            self._complete(key, flight, source)
+
+    def _complete(self, key: str, flight: _Flight, source):
+        store = flight.store(source) if callable(flight.store) else flight.store
+        if store:
+            self._store(key, "".join(flight.chunks))
+        flight.finish()
+        self._end_flight(key, flight)
+
+    def _end_flight(self, key: str, flight: _Flight):
+        with self._lock:
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+
+    def _store(self, key: str, text: str):
+        size = len(text.encode("utf-8"))
+        if not text or size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = _Entry(text, size, time.monotonic() + self.ttl)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def _remove(self, key: str):
+        entry = self._entries.pop(key)
+        self._bytes -= entry.size
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, int]:
+        """Return counters used to size the cache"""
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "in_flight": len(self._flights),
+                "hits": self.hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
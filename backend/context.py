@@ -0,0 +1,163 @@
+import math
+import re
+from functools import lru_cache
+from typing import Dict, List, NamedTuple
+
+# Rough shape of the Llama 3 tokenizer: short English words are one token,
+# numbers split into groups of three digits and non-Latin scripts cost about
+# one token per two characters (Devanagari is 3 bytes per character in UTF-8)
+_PIECE_RE = re.compile(r"[A-Za-z]+|\d+|[^\x00-\x7f]+|\S")
+
+# Markdown emphasis/heading marks and the "(HH:MM)" stamp on answer titles
+_MARKUP_RE = re.compile(r"[*#]+|\(\d{1,2}:\d{2}\)\s*$")
+
+# Chat template overhead per message (role header and end-of-turn markers)
+MESSAGE_OVERHEAD = 4
+
+# Longest excerpt of an old turn kept in the summary slot
+SUMMARY_EXCERPT_CHARS = 120
+
+
+@lru_cache(maxsize=8192)
+def estimate_tokens(text: str) -> int:
+    """Fast local approximation of the Llama 3 token count of text"""
+    tokens = 0
+    for piece in _PIECE_RE.findall(text):
+        first = piece[0]
+        if first.isascii() and first.isalpha():
+            tokens += 1 + len(piece) // 8
+        elif first.isdigit():
+            tokens += math.ceil(len(piece) / 3)
+        elif not first.isascii():
+            tokens += math.ceil(len(piece.encode("utf-8")) / 6)
+        else:
+            tokens += 1
+    return tokens
+
+
+def message_tokens(message: Dict[str, str]) -> int:
+    return estimate_tokens(message["content"]) + MESSAGE_OVERHEAD
+
+
+class PromptTooLong(Exception):
+    """Raised when the system prompt leaves no room for the question"""
+    pass
+
+
+class PromptContext(NamedTuple):
+    """Messages to send upstream and how they were packed"""
+    messages: List[Dict[str, str]]
+    prompt_tokens: int
+    turns_included: int
+    turns_summarized: int
+
+
+def _excerpt(message: Dict[str, str]) -> str:
+    # Bot answers open with a bold title line, which names the topic
+    first_line = message["content"].strip().split("\n", 1)[0]
+    first_line = _MARKUP_RE.sub("", first_line).strip()
+    if len(first_line) > SUMMARY_EXCERPT_CHARS:
+        first_line = first_line[:SUMMARY_EXCERPT_CHARS].rstrip() + "…"
+    speaker = "Farmer" if message["role"] == "user" else "KrishiBot"
+    return f"- {speaker}: {first_line}"
+
+
+class ContextBuilder:
+    """Pack the system prompt and as many recent turns as fit the token budget.
+
+    The budget is the model's context window minus the completion allowance.
+    The latest turn comes first, cut down only if it cannot fit on its own.
+    Grounding text for the system prompt gets the room left after it, whole
+    lines at a time. Turns that no longer fit are collapsed into one compact
+    summary message holding the opening line of each, newest first, within
+    summary_tokens.
+    """
+
+    def __init__(self, context_window: int = 8192, max_completion_tokens: int = 1024,
+                 summary_tokens: int = 200, safety_margin: float = 0.05):
+        self.context_window = context_window
+        self.max_completion_tokens = max_completion_tokens
+        self.summary_tokens = summary_tokens
+        self.prompt_budget = int((context_window - max_completion_tokens) * (1 - safety_margin))
+
+    def build(self, system_prompt: str, messages: List[Dict[str, str]],
+              grounding: str = "") -> PromptContext:
+        system = {"role": "system", "content": system_prompt}
+        used = message_tokens(system)
+        if not messages:
+            system["content"] += self._fit(grounding, self.prompt_budget - used)
+            return PromptContext([system], message_tokens(system), 0, 0)
+
+        latest = messages[-1]
+        latest_tokens = message_tokens(latest)
+        if used + latest_tokens > self.prompt_budget:
+            latest = self._truncate(latest, self.prompt_budget - used)
+            latest_tokens = message_tokens(latest)
+        used += latest_tokens
+
+        if grounding:
+            system["content"] += self._fit(grounding, self.prompt_budget - used)
+            used += estimate_tokens(system["content"]) - estimate_tokens(system_prompt)
+
+        history = messages[:-1]
+        index = 0
+        history_tokens = sum(message_tokens(message) for message in history)
+        if used + history_tokens <= self.prompt_budget:
+            used += history_tokens
+        else:
+            # Walk back from the newest turn, keeping room for the summary slot
+            index = len(history)
+            while index > 0:
+                cost = message_tokens(history[index - 1])
+                if used + cost + self.summary_tokens > self.prompt_budget:
+                    break
+                used += cost
+                index -= 1
+        kept = history[index:]
+
+        packed = [system]
+        dropped = history[:index]
+        if dropped:
+            summary = self._summarize(dropped, self.prompt_budget - used)
+            if summary is not None:
+                used += message_tokens(summary)
+                packed.append(summary)
+        packed.extend(kept)
+        packed.append(latest)
+        return PromptContext(packed, used, len(kept), len(dropped))
+
+    def _summarize(self, dropped: List[Dict[str, str]], room: int):
+        budget = min(self.summary_tokens, room) - MESSAGE_OVERHEAD
+        header = "Earlier in this conversation:"
+        lines = [header]
+        used = estimate_tokens(header)
+        for message in reversed(dropped):
+            line = _excerpt(message)
+            cost = estimate_tokens(line)
+            if used + cost > budget:
+                break
+            lines.insert(1, line)
+            used += cost
+        if len(lines) == 1:
+            return None
+        return {"role": "system", "content": "\n".join(lines)}
+
+    def _fit(self, text: str, room: int) -> str:
+        """The leading whole lines of text that fit in room tokens"""
+        if estimate_tokens(text) <= room:
+            return text
+        lines = text.split("\n")
+        while lines and estimate_tokens("\n".join(lines)) > room:
+            lines.pop()
+        return "\n".join(lines).rstrip()
+
+    def _truncate(self, message: Dict[str, str], room: int) -> Dict[str, str]:
+        """Cut an oversized message down to roughly room tokens, keeping its start"""
+        if room <= MESSAGE_OVERHEAD:
+            raise PromptTooLong(f"System prompt leaves {room} tokens for the question")
+        content = message["content"]
+        tokens = max(1, message_tokens(message))
+        keep = max(0, int(len(content) * (room - MESSAGE_OVERHEAD) / tokens))
+        while keep and message_tokens({"content": content[:keep]}) > room:
+            keep = int(keep * 0.9)
+        return {**message, "content": content[:keep]}
@@ -0,0 +1,169 @@
+import re
+from datetime import datetime
+from typing import Dict, Optional
+
+# Section header keywords per language, in priority order: when a header
+# contains several keywords the one listed first wins
+SECTION_EMOJIS = {
+    "en": {
+        "pest": "🐛",
+        "organic": "🌿",
+        "management": "🔄",
+        "control": "🛡️",
+        "natural": "🦋",
+        "chemical": "⚠️",
+        "monitor": "🔍",
+        "regional": "📍",
+        "crop insurance": "🌾",
+        "soil health": "🌿",
+        "irrigation": "💧",
+        "credit": "💸",
+        "subsidy": "💸",
+        "market": "📈",
+        "sustainable": "🌱",
+    },
+    "hi": {
+        "कीट": "🐛",
+        "जैविक": "🌿",
+        "प्रबंधन": "🔄",
+        "नियंत्रण": "🛡️",
+        "प्राकृतिक": "🦋",
+        "रासायनिक": "⚠️",
+        "निगरानी": "🔍",
+        "क्षेत्रीय": "📍",
+        "फसल बीमा": "🌾",
+        "मृदा स्वास्थ्य": "🌿",
+        "सिंचाई": "💧",
+        "ऋण": "💸",
+        "सब्सिडी": "💸",
+        "बाजार": "📈",
+        "टिकाऊ": "🌱",
+    },
+}
+DEFAULT_SECTION_EMOJI = "ℹ️"
+
+TIP_LABELS = {"en": "💡 Pro Tip", "hi": "💡 विशेषज्ञ सलाह"}
+TIP_PREFIXES = ("Additional Tip:", "Tip:")
+
+
+class KeywordMatcher:
+    """Find the highest priority keyword in a text with one compiled regex"""
+
+    def __init__(self, table: Dict[str, str], default: str):
+        self.default = default
+        self._values = list(table.values())
+        self._priority = {keyword: index for index, keyword in enumerate(table)}
+        # Longest first, so a phrase wins over a keyword it starts with
+        alternation = "|".join(re.escape(keyword) for keyword in sorted(table, key=len, reverse=True))
+        self._pattern = re.compile(alternation) if table else None
+
+    def match(self, text: str) -> str:
+        if self._pattern is None:
+            return self.default
+        best: Optional[int] = None
+        for found in self._pattern.finditer(text):
+            priority = self._priority[found.group()]
+            if best is None or priority < best:
+                best = priority
+                if best == 0:
+                    break
+        return self.default if best is None else self._values[best]
+
+
+_SECTION_MATCHERS = {
+    language: KeywordMatcher(table, DEFAULT_SECTION_EMOJI)
+    for language, table in SECTION_EMOJIS.items()
+}
+_EMPTY_MATCHER = KeywordMatcher({}, DEFAULT_SECTION_EMOJI)
+
+
+def get_section_emoji(title: str, language: str) -> str:
+    """Returns appropriate emoji for section title"""
+    return _SECTION_MATCHERS.get(language, _EMPTY_MATCHER).match(title.lower())
+
+
+def format_title(line: str) -> str:
+    """Ensure the title line is bold and carries the current time"""
+    current_time = datetime.now().strftime("%H:%M")
+    title_line = line.strip()
+    if not title_line.startswith("**"):
+        title_line = f"**{title_line}** ({current_time})"
+    elif not title_line.endswith(")") and "(" not in title_line:
+        title_line = title_line.rstrip("*") + f"** ({current_time})"
+    return title_line
+
+
+class ResponseFormatter:
+    """Single-pass formatter for responses that arrive in chunks.
+
+    Each complete line is formatted and returned as soon as it is seen;
+    only the trailing partial line is buffered, so earlier text is never
+    scanned again. Blank lines separate sections. A section is a heading
+    ("## ..."), a tip ("Tip: ...") or body text with "-" bullets, and a
+    "---" divider goes before headings and Pro Tips.
+    """
+
+    def __init__(self, language: str):
+        self.language = language
+        self.tip_label = TIP_LABELS["en"] if language == "en" else TIP_LABELS["hi"]
+        self._partial = ""
+        self._title_done = False
+        self._in_section = False
+        self._sections = 0
+
+    def feed(self, text: str) -> str:
+        """Add text and return the formatted output for any completed lines"""
+        lines = text.split("\n")
+        if len(lines) == 1:
+            self._partial += text
+            return ""
+        lines[0] = self._partial + lines[0]
+        self._partial = lines.pop()
+        return "".join(self._line(line) for line in lines)
+
+    def flush(self) -> str:
+        """Format whatever is left at end of stream"""
+        line, self._partial = self._partial, ""
+        return self._line(line)
+
+    def _line(self, line: str) -> str:
+        line = line.strip()
+        if not line:
+            self._in_section = False
+            return ""
+
+        if not self._title_done:
+            self._title_done = True
+            formatted = format_title(line)
+        elif not self._in_section and line.startswith("##"):
+            header_text = line.lstrip("#").strip()
+            formatted = f"## {get_section_emoji(header_text, self.language)} {header_text}"
+        elif not self._in_section and line.startswith(TIP_PREFIXES):
+            rest = line.split(":", 1)[1]
+            formatted = f"{self.tip_label}:{rest}"
+        elif line.startswith("-"):
+            # Remove extra stars or hashtags
+            content = line.lstrip("-*#").strip()
+            if not content.startswith("✨"):
+                content = "✨  " + content
+            formatted = f"- {content}"
+        else:
+            formatted = line
+
+        if self._in_section:
+            return "\n" + formatted
+
+        self._in_section = True
+        self._sections += 1
+        if self._sections == 1:
+            return formatted
+        if formatted.startswith("##") or "Pro Tip" in formatted:
+            return "\n\n---\n\n" + formatted
+        return "\n\n" + formatted
+
+
+def enforce_response_format(text: str, language: str) -> str:
+    """Format a complete response"""
+    formatter = ResponseFormatter(language)
+    return formatter.feed(text) + formatter.flush()
+
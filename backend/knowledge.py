@@ -0,0 +1,428 @@
+"""Local retrieval index over curated agriculture FAQs.
+
+Answers written by agronomists live in KNOWLEDGE_DIR as one directory per
+language (en/, hi/) of *.md files, each holding entries like:
+
+    Q: Who is eligible for PM-KISAN?
+    Q: PM-KISAN eligibility
+    A:
+    PM-KISAN Eligibility
+    ## Who Can Apply
+    - ...
+
+Every "Q:" line is an alternative phrasing; the answer runs until the next
+entry. The question phrasings are indexed as L2-normalized TF-IDF vectors,
+so a query's score against an entry is a cosine similarity between 0 and 1
+that thresholds can be set on.
+
+The index is written as .npy arrays in term-major (CSR) layout and opened
+with mmap, so worker processes on one host share the pages. A rebuild only
+re-parses files whose size or mtime changed, writes a new generation next to
+the old one and switches a CURRENT pointer; other workers pick it up on
+their next refresh.
+"""
+import json
+import logging
+import math
+import os
+import re
+import shutil
+import threading
+import time
+import unicodedata
+from collections import Counter
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Not on POSIX: rebuilds are only serialized within a process
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+LANGUAGES = ("en", "hi")
+
+# Latin words and numbers, or runs of Devanagari letters and signs
+# (danda and double danda are punctuation)
+_TOKEN_RE = re.compile(r"[a-z0-9]+|[ऀ-ॣ०-ॿ]+")
+
+# Spelling variants that should meet: nukta forms (ज़ -> ज), chandrabindu
+# vs anusvara, zero-width joiners
+_HINDI_FOLD = str.maketrans({"़": None, "ँ": "ं", "‌": None, "‍": None})
+
+# Light inflectional stemming, longest suffix first (after Ramanathan & Rao)
+_HINDI_SUFFIXES = sorted([
+    "ाएंगी", "ाएंगे", "ाऊंगी", "ाऊंगा", "ाइयां", "ाइयों", "ाएगी", "ाएगा", "ाओगी", "ाओगे",
+    "एंगी", "ेंगी", "एंगे", "ेंगे", "ूंगी", "ूंगा", "ातीं", "नाओं", "नाएं", "ताओं", "ताएं",
+    "ियां", "ियों", "ाकर", "ाइए", "ाईं", "ाया", "ेगी", "ेगा", "ोगी", "ोगे", "ाने", "ाना",
+    "ाते", "ाती", "ाता", "तीं", "ाओं", "ाएं", "ुओं", "ुएं", "ुआं", "ाओ", "िए", "ाई", "ाए",
+    "ीं", "ां", "ों", "ें", "ो", "े", "ू", "ु", "ी", "ि", "ा",
+], key=len, reverse=True)
+
+_STOPWORDS = {
+    "a", "an", "the", "is", "are", "was", "be", "what", "how", "when", "which", "who",
+    "whom", "why", "for", "of", "in", "on", "to", "do", "does", "did", "i", "my", "me",
+    "we", "our", "you", "your", "can", "could", "should", "would", "will", "and", "or",
+    "with", "about", "it", "its", "this", "that", "there", "any", "some", "tell", "please",
+    "know", "want", "need", "get", "give", "from", "by", "at", "as", "much", "many", "per",
+    "का", "के", "की", "है", "हैं", "था", "थे", "में", "से", "को", "और", "या", "पर", "यह",
+    "वह", "ये", "वे", "क्या", "कैसे", "कब", "कौन", "किस", "किसे", "कितना", "कितनी", "कितने",
+    "लिए", "भी", "तो", "एक", "मैं", "हम", "आप", "मेरा", "मेरे", "मेरी", "मुझे", "हमें",
+    "बताएं", "बताइए", "बताओ", "कृपया", "चाहिए", "करें", "करे", "करना", "करूं", "जाता", "जाती", "होता", "होती", "होते",
+}
+
+
+def _stem(token: str) -> str:
+    if token.isascii():
+        if len(token) > 4 and token.endswith("ies"):
+            return token[:-3] + "y"
+        if len(token) > 5 and token.endswith("ing"):
+            return token[:-3]
+        if len(token) > 4 and token.endswith("ed"):
+            return token[:-2]
+        if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+            return token[:-1]
+        return token
+    for suffix in _HINDI_SUFFIXES:
+        if token.endswith(suffix) and len(token) - len(suffix) >= 2:
+            return token[:-len(suffix)]
+    return token
+
+
+def tokenize(text: str) -> List[str]:
+    """Lower-case, fold Hindi spelling variants, drop stopwords and stem"""
+    text = unicodedata.normalize("NFC", text).casefold().translate(_HINDI_FOLD)
+    return [_stem(token) for token in _TOKEN_RE.findall(text) if token not in _STOPWORDS]
+
+
+class KnowledgeMatch(NamedTuple):
+    """Best FAQ entry for a query.
+
+    margin is how far the score is ahead of the best other entry, coverage
+    the fraction of the query's terms that the matched phrasing contains.
+    """
+    score: float
+    question: str
+    answer: str
+    language: str
+    source: str
+    margin: float
+    coverage: float
+
+
+class _Snapshot(NamedTuple):
+    """One loaded index generation; replaced as a whole, never modified"""
+    generation: str
+    files: Dict[str, dict]
+    entries: List[dict]
+    vocab: Dict[str, int]
+    idf: np.ndarray
+    term_ptr: np.ndarray
+    post_rows: np.ndarray
+    post_weights: np.ndarray
+    row_entry: np.ndarray
+    row_lang: np.ndarray
+
+
+_EMPTY = _Snapshot(
+    generation="",
+    files={},
+    entries=[],
+    vocab={},
+    idf=np.zeros(0, dtype=np.float32),
+    term_ptr=np.zeros(1, dtype=np.int64),
+    post_rows=np.zeros(0, dtype=np.int32),
+    post_weights=np.zeros(0, dtype=np.float32),
+    row_entry=np.zeros(0, dtype=np.int32),
+    row_lang=np.zeros(0, dtype=np.int8),
+)
+
+
+def parse_entries(text: str) -> List[Dict[str, object]]:
+    """Split an FAQ document into {questions, answer} entries"""
+    entries = []
+    questions: List[str] = []
+    answer: Optional[List[str]] = None
+
+    def flush():
+        if questions and answer is not None and "\n".join(answer).strip():
+            entries.append({"questions": list(questions), "answer": "\n".join(answer).strip()})
+
+    for line in text.splitlines():
+        if line.startswith("Q:"):
+            if answer is not None:
+                flush()
+                questions, answer = [], None
+            questions.append(line[2:].strip())
+        elif line.startswith("A:") and answer is None and questions:
+            answer = [line[2:].strip()]
+        elif answer is not None:
+            answer.append(line)
+    flush()
+    return entries
+
+
+class KnowledgeIndex:
+    """Memory-mapped TF-IDF index over curated Q&A documents.
+
+    The loaded generation is one immutable snapshot, so searches running
+    while a refresh switches generations see either the old or the new index
+    as a whole.
+    """
+
+    def __init__(self, source_dir: str, index_dir: str, refresh_interval: float = 30):
+        self.source_dir = source_dir
+        self.index_dir = index_dir
+        self.refresh_interval = refresh_interval
+        self._lock = threading.Lock()
+        self._checked = 0.0
+        self.searches = 0
+        self._snapshot = _EMPTY
+
+    @property
+    def generation(self) -> str:
+        return self._snapshot.generation
+
+    # --- Source scanning -------------------------------------------------
+
+    def _scan(self) -> Dict[str, Tuple[int, int]]:
+        """(mtime_ns, size) of every source document, keyed by relative path"""
+        found = {}
+        for language in LANGUAGES:
+            directory = os.path.join(self.source_dir, language)
+            if not os.path.isdir(directory):
+                continue
+            for name in sorted(os.listdir(directory)):
+                if name.endswith(".md"):
+                    path = os.path.join(directory, name)
+                    stat = os.stat(path)
+                    found[f"{language}/{name}"] = (stat.st_mtime_ns, stat.st_size)
+        return found
+
+    def _stale(self, found: Dict[str, Tuple[int, int]]) -> bool:
+        files = self._snapshot.files
+        if set(found) != set(files):
+            return True
+        return any(
+            (files[path]["mtime_ns"], files[path]["size"]) != stamp
+            for path, stamp in found.items()
+        )
+
+    # --- Loading ---------------------------------------------------------
+
+    def _current(self) -> str:
+        try:
+            with open(os.path.join(self.index_dir, "CURRENT")) as pointer:
+                return pointer.read().strip()
+        except OSError:
+            return ""
+
+    def _load(self, generation: str):
+        directory = os.path.join(self.index_dir, generation)
+        with open(os.path.join(directory, "meta.json"), encoding="utf-8") as meta_file:
+            meta = json.load(meta_file)
+
+        def array(name: str) -> np.ndarray:
+            return np.load(os.path.join(directory, f"{name}.npy"), mmap_mode="r")
+
+        self._snapshot = _Snapshot(
+            generation=generation,
+            files=meta["files"],
+            entries=meta["entries"],
+            vocab={term: index for index, term in enumerate(meta["terms"])},
+            idf=array("idf"),
+            term_ptr=array("term_ptr"),
+            post_rows=array("post_rows"),
+            post_weights=array("post_weights"),
+            row_entry=array("row_entry"),
+            row_lang=array("row_lang"),
+        )
+
+    def refresh(self, force: bool = False) -> bool:
+        """Pick up a newer index or rebuild when the documents changed.
+
+        Checks at most every refresh_interval seconds unless forced. Returns
+        True if a different index generation was loaded.
+        """
+        now = time.monotonic()
+        if not force and now - self._checked < self.refresh_interval:
+            return False
+        with self._lock:
+            if not force and now - self._checked < self.refresh_interval:
+                return False
+            self._checked = now
+            loaded = self.generation
+            current = self._current()
+            if current and current != self.generation:
+                self._load(current)
+            found = self._scan()
+            if self._stale(found):
+                self._rebuild(found)
+            return self.generation != loaded
+
+    def _rebuild(self, found: Dict[str, Tuple[int, int]]):
+        os.makedirs(self.index_dir, exist_ok=True)
+        with open(os.path.join(self.index_dir, ".lock"), "w") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            # Another worker may have rebuilt while we waited for the lock
+            current = self._current()
+            if current and current != self.generation:
+                self._load(current)
+                if not self._stale(found):
+                    return
+            started = time.perf_counter()
+            files = self._parse(found)
+            generation = self._write(files)
+            self._load(generation)
+            self._cleanup(generation)
+            logger.info(
+                f"Knowledge index {generation}: {len(self._snapshot.entries)} entries, "
+                f"{len(self._snapshot.vocab)} terms in {time.perf_counter() - started:.3f}s"
+            )
+
+    # --- Building --------------------------------------------------------
+
+    def _parse(self, found: Dict[str, Tuple[int, int]]) -> Dict[str, dict]:
+        """Parsed and tokenized documents, reusing unchanged ones"""
+        files = {}
+        reparsed = 0
+        for path, (mtime_ns, size) in found.items():
+            previous = self._snapshot.files.get(path)
+            if previous and (previous["mtime_ns"], previous["size"]) == (mtime_ns, size):
+                files[path] = previous
+                continue
+            with open(os.path.join(self.source_dir, path), encoding="utf-8") as document:
+                entries = parse_entries(document.read())
+            for entry in entries:
+                entry["tokens"] = [tokenize(question) for question in entry["questions"]]
+            files[path] = {"mtime_ns": mtime_ns, "size": size, "entries": entries}
+            reparsed += 1
+        logger.info(f"Knowledge index: re-parsed {reparsed} of {len(found)} documents")
+        return files
+
+    def _write(self, files: Dict[str, dict]) -> str:
+        entries = []
+        row_entry: List[int] = []
+        row_lang: List[int] = []
+        row_terms: List[Counter] = []
+        for path, document in sorted(files.items()):
+            language = path.split("/", 1)[0]
+            for entry in document["entries"]:
+                for tokens in entry["tokens"]:
+                    if tokens:
+                        row_entry.append(len(entries))
+                        row_lang.append(LANGUAGES.index(language))
+                        row_terms.append(Counter(tokens))
+                entries.append({
+                    "question": entry["questions"][0],
+                    "answer": entry["answer"],
+                    "language": language,
+                    "source": path,
+                })
+
+        terms = sorted({term for counts in row_terms for term in counts})
+        vocab = {term: index for index, term in enumerate(terms)}
+        term_ids = np.array([vocab[t] for counts in row_terms for t in counts], dtype=np.int32)
+        tfs = np.array([tf for counts in row_terms for tf in counts.values()], dtype=np.float32)
+        rows = np.repeat(np.arange(len(row_terms), dtype=np.int32),
+                         [len(counts) for counts in row_terms]).astype(np.int32)
+
+        # Smoothed idf and sublinear tf, then L2-normalize every row
+        df = np.bincount(term_ids, minlength=len(terms)).astype(np.float32)
+        idf = (np.log((1 + len(row_terms)) / (1 + df)) + 1).astype(np.float32)
+        weights = (1 + np.log(tfs)) * idf[term_ids]
+        norms = np.sqrt(np.bincount(rows, weights * weights, minlength=len(row_terms)))
+        weights = (weights / norms[rows]).astype(np.float32)
+
+        # Term-major order so a query term's postings are one contiguous slice
+        order = np.lexsort((rows, term_ids))
+        term_ptr = np.zeros(len(terms) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(term_ids, minlength=len(terms)), out=term_ptr[1:])
+
+        generation = f"gen-{time.time_ns()}"
+        staging = os.path.join(self.index_dir, f".{generation}.tmp")
+        os.makedirs(staging)
+        np.save(os.path.join(staging, "idf.npy"), idf)
+        np.save(os.path.join(staging, "term_ptr.npy"), term_ptr)
+        np.save(os.path.join(staging, "post_rows.npy"), rows[order])
+        np.save(os.path.join(staging, "post_weights.npy"), weights[order])
+        np.save(os.path.join(staging, "row_entry.npy"), np.array(row_entry, dtype=np.int32))
+        np.save(os.path.join(staging, "row_lang.npy"), np.array(row_lang, dtype=np.int8))
+        with open(os.path.join(staging, "meta.json"), "w", encoding="utf-8") as meta_file:
+            json.dump({"files": files, "entries": entries, "terms": terms}, meta_file, ensure_ascii=False)
+        os.rename(staging, os.path.join(self.index_dir, generation))
+
+        pointer = os.path.join(self.index_dir, "CURRENT.tmp")
+        with open(pointer, "w") as pointer_file:
+            pointer_file.write(generation)
+        os.replace(pointer, os.path.join(self.index_dir, "CURRENT"))
+        return generation
+
+    def _cleanup(self, keep: str):
+        """Remove all but the current generation (open mmaps stay valid)"""
+        for name in os.listdir(self.index_dir):
+            if name.startswith("gen-") and name != keep:
+                shutil.rmtree(os.path.join(self.index_dir, name), ignore_errors=True)
+
+    # --- Querying --------------------------------------------------------
+
+    def search(self, text: str, language: str) -> Optional[KnowledgeMatch]:
+        """Best matching entry in language, or None if nothing shares a term"""
+        self.refresh()
+        self.searches += 1
+        index = self._snapshot
+        counts = Counter(tokenize(text))
+        known = [term for term in counts if term in index.vocab]
+        if not known or language not in LANGUAGES:
+            return None
+
+        term_ids = np.array([index.vocab[term] for term in known], dtype=np.int64)
+        query = (1 + np.log(np.array([counts[term] for term in known], dtype=np.float32))) * index.idf[term_ids]
+        # Words no entry uses still count against the match, at the rarest
+        # term's weight, so "sow wheat in punjab" is not a perfect match for
+        # "sow wheat"
+        unknown = [1 + math.log(tf) for term, tf in counts.items() if term not in index.vocab]
+        rarest = float(np.max(index.idf))
+        norm = math.sqrt(float(np.dot(query, query)) + sum((w * rarest) ** 2 for w in unknown))
+        query /= norm
+
+        starts = index.term_ptr[term_ids]
+        ends = index.term_ptr[term_ids + 1]
+        rows = np.concatenate([index.post_rows[s:e] for s, e in zip(starts, ends)])
+        weights = np.concatenate([
+            index.post_weights[s:e] * q for s, e, q in zip(starts, ends, query)
+        ])
+        scores = np.bincount(rows, weights, minlength=len(index.row_entry))
+        scores[index.row_lang != LANGUAGES.index(language)] = 0
+        best = int(np.argmax(scores))
+        if scores[best] <= 0:
+            return None
+
+        entry_id = index.row_entry[best]
+        others = scores[index.row_entry != entry_id]
+        runner_up = float(np.max(others)) if len(others) else 0.0
+        # A term has at most one posting per row
+        covered = int(np.count_nonzero(rows == best))
+        entry = index.entries[entry_id]
+        return KnowledgeMatch(
+            score=float(scores[best]),
+            question=entry["question"],
+            answer=entry["answer"],
+            language=entry["language"],
+            source=entry["source"],
+            margin=float(scores[best]) - runner_up,
+            coverage=covered / len(counts),
+        )
+
+    def stats(self) -> Dict[str, object]:
+        index = self._snapshot
+        return {
+            "generation": index.generation,
+            "documents": len(index.files),
+            "entries": len(index.entries),
+            "terms": len(index.vocab),
+            "searches": self.searches,
+        }
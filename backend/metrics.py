@@ -0,0 +1,284 @@
+import bisect
+import cProfile
+import io
+import logging
+import pstats
+import random
+import threading
+import time
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+Sample = Tuple[str, Dict[str, str], float]
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    body = ",".join(f'{key}="{_escape(str(value))}"' for key, value in labels.items())
+    return "{" + body + "}"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric(ABC):
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def _labels(self, key: Tuple[str, ...]) -> Dict[str, str]:
+        return dict(zip(self.labelnames, key))
+
+    @abstractmethod
+    def samples(self) -> Iterable[Sample]:
+        """(name, labels, value) for every series of this metric"""
+
+
+class Counter(_Metric):
+    """Monotonically increasing count"""
+    kind = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self) -> Iterable[Sample]:
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            yield self.name, self._labels(key), value
+
+
+class Gauge(_Metric):
+    """Value that can go up and down"""
+    kind = "gauge"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def samples(self) -> Iterable[Sample]:
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            yield self.name, self._labels(key), value
+
+
+class Histogram(_Metric):
+    """Distribution of observations in cumulative buckets"""
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: bucket counts (last one is +Inf), sum
+        self._values: Dict[Tuple[str, ...], Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts, total = self._values.setdefault(
+                key, ([0] * (len(self.buckets) + 1), [0.0])
+            )
+            counts[index] += 1
+            total[0] += value
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def samples(self) -> Iterable[Sample]:
+        with self._lock:
+            items = [(key, list(counts), total[0]) for key, (counts, total) in self._values.items()]
+        for key, counts, total in items:
+            labels = self._labels(key)
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                yield f"{self.name}_bucket", {**labels, "le": _format_value(bound)}, cumulative
+            yield f"{self.name}_sum", labels, total
+            yield f"{self.name}_count", labels, cumulative
+
+
+class Registry:
+    """Holds metrics and renders them in the Prometheus text format"""
+
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+        self._collectors: List[Callable[[], Iterable[Tuple[str, str, str, Iterable[Sample]]]]] = []
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._add(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._add(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._add(Histogram(name, documentation, labelnames, buckets))
+
+    def _add(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def register_collector(self, collector: Callable[[], Iterable[Tuple[str, str, str, Iterable[Sample]]]]):
+        """Add a callback yielding (name, kind, help, samples) at scrape time"""
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        lines: List[str] = []
+        families = [(m.name, m.kind, m.documentation, m.samples()) for m in self._metrics]
+        for collector in self._collectors:
+            families.extend(collector())
+        for name, kind, documentation, samples in families:
+            lines.append(f"# HELP {name} {documentation}")
+            lines.append(f"# TYPE {name} {kind}")
+            for sample_name, labels, value in samples:
+                lines.append(f"{sample_name}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+def stats_collector(prefix: str, stats: Callable[[], Dict[str, float]],
+                    counters: Sequence[str]) -> Callable:
+    """Expose a component's stats() dict, typing the named keys as counters"""
+    def collect():
+        for key, value in stats().items():
+            if key in counters:
+                name = f"{prefix}_{key}" if key.endswith("_total") else f"{prefix}_{key}_total"
+                kind = "counter"
+            else:
+                name = f"{prefix}_{key}"
+                kind = "gauge"
+            yield name, kind, f"{prefix} {key.replace('_', ' ')}", [(name, {}, value)]
+    return collect
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.histogram(
+    "krishibot_stage_seconds", "Time spent in each stage of a chat request", ["stage"]
+)
+REQUEST_SECONDS = REGISTRY.histogram(
+    "krishibot_request_seconds", "Total request time including the SSE stream", ["endpoint"]
+)
+REQUESTS_TOTAL = REGISTRY.counter(
+    "krishibot_requests_total", "Requests by endpoint and status code", ["endpoint", "status"]
+)
+ERRORS_TOTAL = REGISTRY.counter(
+    "krishibot_errors_total", "Errors by type", ["type"]
+)
+UPSTREAM_TOKENS_TOTAL = REGISTRY.counter(
+    "krishibot_upstream_tokens_total", "Tokens reported by Groq usage", ["kind"]
+)
+STREAMS_IN_FLIGHT = REGISTRY.gauge(
+    "krishibot_streams_in_flight", "Open SSE response streams"
+)
+BATCH_ITEMS_TOTAL = REGISTRY.counter(
+    "krishibot_batch_items_total", "Batch advisory items by outcome", ["outcome"]
+)
+KNOWLEDGE_LOOKUPS_TOTAL = REGISTRY.counter(
+    "krishibot_knowledge_lookups_total", "FAQ index lookups by outcome (answered, grounded, miss)", ["outcome"]
+)
+
+
+def record_usage(usage):
+    """Count prompt and completion tokens from a Groq usage object, if any"""
+    if usage is None:
+        return
+    UPSTREAM_TOKENS_TOTAL.inc(getattr(usage, "prompt_tokens", 0) or 0, kind="prompt")
+    UPSTREAM_TOKENS_TOTAL.inc(getattr(usage, "completion_tokens", 0) or 0, kind="completion")
+
+
+class RequestTrace:
+    """Stage timings for one request.
+
+    Stages are recorded into STAGE_SECONDS as they finish. finish() records
+    the total, and logs the breakdown when the request took longer than
+    slow_seconds. A sampled fraction (profile_rate) of requests is run under
+    cProfile, and the profile of slow ones is logged. Profiling is per thread,
+    so it is only meaningful where a request stays on one thread (WSGI).
+    """
+
+    def __init__(self, endpoint: str, slow_seconds: float = 0, profile_rate: float = 0):
+        self.endpoint = endpoint
+        self.slow_seconds = slow_seconds
+        self.started = time.perf_counter()
+        self.stages: Dict[str, float] = {}
+        self.profiler: Optional[cProfile.Profile] = None
+        if profile_rate and random.random() < profile_rate:
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+
+    @contextmanager
+    def stage(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - started)
+
+    def record(self, name: str, seconds: float):
+        self.stages[name] = self.stages.get(name, 0) + seconds
+        STAGE_SECONDS.observe(seconds, stage=name)
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+    def finish(self, status: int):
+        total = self.elapsed()
+        if self.profiler is not None:
+            self.profiler.disable()
+        REQUEST_SECONDS.observe(total, endpoint=self.endpoint)
+        REQUESTS_TOTAL.inc(endpoint=self.endpoint, status=status)
+        if self.slow_seconds and total >= self.slow_seconds:
+            breakdown = ", ".join(f"{name}={seconds:.3f}s" for name, seconds in self.stages.items())
+            logger.warning(f"Slow {self.endpoint} request: {total:.3f}s ({breakdown})")
+            if self.profiler is not None:
+                out = io.StringIO()
+                pstats.Stats(self.profiler, stream=out).sort_stats("cumulative").print_stats(25)
+                logger.warning(f"Profile of slow {self.endpoint} request:\n{out.getvalue()}")
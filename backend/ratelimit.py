@@ -0,0 +1,188 @@
+import logging
+import math
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Collection, Dict, Mapping, NamedTuple, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+def client_key(headers: Mapping[str, str], remote_addr: str, api_keys: Collection[str] = ()) -> str:
+    """Identify the client by a configured API key, else by IP address.
+
+    Anything else in the request is chosen by the client, so it cannot pick
+    its own bucket: unknown API keys and session headers are ignored.
+    """
+    api_key = headers.get("X-API-Key")
+    if api_key and api_key in api_keys:
+        return f"key:{api_key}"
+    return f"ip:{remote_addr}"
+
+
+def forwarded_client(forwarded_for: str, peer: str, trusted_hops: int) -> str:
+    """Client address behind trusted_hops reverse proxies.
+
+    Each proxy appends the address it received the request from to
+    X-Forwarded-For, so only the last trusted_hops entries can be believed;
+    whatever the client sent itself is further left. Like werkzeug's ProxyFix.
+    """
+    if trusted_hops <= 0:
+        return peer
+    hops = [hop.strip() for hop in forwarded_for.split(",") if hop.strip()]
+    if len(hops) < trusted_hops:
+        return peer
+    return hops[-trusted_hops]
+
+
+class RateLimitResult(NamedTuple):
+    """Outcome of a rate limit check for one request"""
+    allowed: bool
+    limit: int
+    remaining: int
+    reset_after: float  # seconds until the bucket is full again
+    retry_after: float  # seconds until the next request is allowed
+
+    def headers(self) -> Dict[str, str]:
+        """HTTP headers describing the client's current limit"""
+        headers = {
+            "X-RateLimit-Limit": str(self.limit),
+            "X-RateLimit-Remaining": str(self.remaining),
+            "X-RateLimit-Reset": str(math.ceil(self.reset_after)),
+        }
+        if not self.allowed:
+            headers["Retry-After"] = str(max(1, math.ceil(self.retry_after)))
+        return headers
+
+
+class TokenBucketLimiter(ABC):
+    """Per-key token bucket: `burst` requests at once, refilled at `refill_rate` per second"""
+
+    def __init__(self, burst: int, refill_rate: float):
+        if burst < 1 or refill_rate <= 0:
+            raise ValueError("burst must be >= 1 and refill_rate must be > 0")
+        self.burst = burst
+        self.refill_rate = refill_rate
+        # A bucket untouched this long is full again and can be forgotten
+        self.idle_after = burst / refill_rate
+        self.rejected = 0
+        self._lock = threading.Lock()
+
+    def _take(self, tokens: float, updated: float, now: float) -> Tuple[float, RateLimitResult]:
+        """Refill a bucket up to now and try to take one token from it"""
+        tokens = min(self.burst, tokens + (now - updated) * self.refill_rate)
+        allowed = tokens >= 1
+        if allowed:
+            tokens -= 1
+        result = RateLimitResult(
+            allowed=allowed,
+            limit=self.burst,
+            remaining=int(tokens),
+            reset_after=(self.burst - tokens) / self.refill_rate,
+            retry_after=0.0 if allowed else (1 - tokens) / self.refill_rate,
+        )
+        return tokens, result
+
+    @abstractmethod
+    def hit(self, key: str) -> RateLimitResult:
+        """Take one token from key's bucket"""
+
+
+class MemoryRateLimiter(TokenBucketLimiter):
+    """Token buckets held in this process, bounded to max_keys buckets"""
+
+    def __init__(self, burst: int, refill_rate: float, max_keys: int = 10000):
+        super().__init__(burst, refill_rate)
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+
+    def hit(self, key: str) -> RateLimitResult:
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.pop(key, (self.burst, now))
+            tokens, result = self._take(tokens, updated, now)
+            self._buckets[key] = (tokens, now)
+            self._evict(now)
+            if not result.allowed:
+                self.rejected += 1
+        return result
+
+    def _evict(self, now: float):
+        # Buckets are kept in last-used order, so idle ones are at the front
+        while self._buckets:
+            key, (_, updated) = next(iter(self._buckets.items()))
+            if len(self._buckets) <= self.max_keys and now - updated < self.idle_after:
+                break
+            del self._buckets[key]
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+
+class SQLiteRateLimiter(TokenBucketLimiter):
+    """Token buckets in a SQLite file, shared by every worker process on the host"""
+
+    PURGE_EVERY = 500  # hits between deletions of idle buckets
+
+    def __init__(self, burst: int, refill_rate: float, path: str):
+        super().__init__(burst, refill_rate)
+        self.path = path
+        self._local = threading.local()
+        self._hits = 0
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS buckets ("
+                "key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)"
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def hit(self, key: str) -> RateLimitResult:
+        now = time.time()  # wall clock, since buckets are shared between processes
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT tokens, updated FROM buckets WHERE key = ?", (key,)
+            ).fetchone()
+            tokens, updated = row if row else (self.burst, now)
+            tokens, result = self._take(tokens, min(updated, now), now)
+            conn.execute(
+                "INSERT OR REPLACE INTO buckets (key, tokens, updated) VALUES (?, ?, ?)",
+                (key, tokens, now)
+            )
+            # The database serializes the buckets; the counters are per process
+            with self._lock:
+                self._hits += 1
+                purge = self._hits % self.PURGE_EVERY == 0
+                if not result.allowed:
+                    self.rejected += 1
+            if purge:
+                conn.execute("DELETE FROM buckets WHERE updated < ?", (now - self.idle_after,))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return result
+
+
+def create_rate_limiter(backend: str, burst: int, refill_rate: float,
+                        max_keys: int = 10000, path: str = "") -> TokenBucketLimiter:
+    """Build the limiter for the configured backend ("memory" or "sqlite")"""
+    if backend == "sqlite":
+        path = path or os.path.join(tempfile.gettempdir(), "krishibot-ratelimit.sqlite3")
+        return SQLiteRateLimiter(burst, refill_rate, path)
+    if backend != "memory":
+        logger.warning(f"Unknown rate limit backend '{backend}', using memory")
+    return MemoryRateLimiter(burst, refill_rate, max_keys)
@@ -0,0 +1,379 @@
+"""Resumable server-sent event streams.
+
+Every /api/chat response is recorded as a StreamLog of numbered events whose
+SSE ids are "<token>:<n>". A client that loses its connection reconnects with
+the last id it saw and is replayed the rest of the answer from the log, which
+keeps filling while nobody is listening, so no second model call is needed.
+Finished logs are kept for a TTL in a bounded ReplayBuffer.
+"""
+import asyncio
+import json
+import logging
+import queue
+import secrets
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from typing import AsyncIterator, Dict, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+Event = Tuple[str, str]  # (SSE id, JSON data)
+
+
+def parse_event_id(value: Optional[str]) -> Optional[Tuple[str, int]]:
+    """Split a Last-Event-ID of the form "<token>:<n>" into (token, n)"""
+    if not value:
+        return None
+    token, _, number = value.strip().rpartition(":")
+    if not token or not number.isdigit():
+        return None
+    return token, int(number)
+
+
+def _is_chunk(payload: dict) -> bool:
+    return len(payload) == 1 and "chunk" in payload
+
+
+_END = object()
+
+
+def coalesce(payloads: Iterator[dict], max_bytes: int, interval: float) -> Iterator[dict]:
+    """Merge consecutive {"chunk": ...} payloads into fewer events.
+
+    The first chunk goes out at once. Later text is held back until
+    max_bytes have collected or interval seconds have passed since the last
+    event went out, also when the upstream stalls meanwhile; any other
+    payload flushes first. payloads is read on a pump thread so the flush
+    deadline does not wait for the next payload.
+    """
+    items: "queue.Queue" = queue.Queue()
+    stop = threading.Event()
+
+    def pump():
+        error = None
+        try:
+            for payload in payloads:
+                if stop.is_set():
+                    break
+                items.put((payload, None))
+        except Exception as e:
+            error = e
+        finally:
+            close = getattr(payloads, "close", None)
+            if close:
+                close()
+            items.put((_END, error))
+
+    threading.Thread(target=pump, daemon=True, name="sse-coalesce").start()
+    pending: List[str] = []
+    size = 0
+    flushed = float("-inf")
+    try:
+        while True:
+            timeout = max(0.0, flushed + interval - time.monotonic()) if pending else None
+            try:
+                item, error = items.get(timeout=timeout)
+            except queue.Empty:
+                yield {"chunk": "".join(pending)}
+                pending, size, flushed = [], 0, time.monotonic()
+                continue
+            if item is _END:
+                if pending:
+                    yield {"chunk": "".join(pending)}
+                if error is not None:
+                    raise error
+                return
+            if _is_chunk(item):
+                pending.append(item["chunk"])
+                size += len(item["chunk"].encode("utf-8"))
+                if size < max_bytes and time.monotonic() - flushed < interval:
+                    continue
+            if pending:
+                yield {"chunk": "".join(pending)}
+                pending, size, flushed = [], 0, time.monotonic()
+            if not _is_chunk(item):
+                yield item
+    finally:
+        # Stops the pump at the next payload if the reader went away
+        stop.set()
+
+
+async def coalesce_async(payloads: AsyncIterator[dict], max_bytes: int, interval: float) -> AsyncIterator[dict]:
+    """Async variant of coalesce; payloads is read by a pump task"""
+    items: asyncio.Queue = asyncio.Queue()
+
+    async def pump():
+        error = None
+        try:
+            async for payload in payloads:
+                items.put_nowait((payload, None))
+        except Exception as e:
+            error = e
+        finally:
+            aclose = getattr(payloads, "aclose", None)
+            if aclose:
+                await aclose()
+            items.put_nowait((_END, error))
+
+    task = asyncio.create_task(pump())
+    pending: List[str] = []
+    size = 0
+    flushed = float("-inf")
+    try:
+        while True:
+            timeout = max(0.0, flushed + interval - time.monotonic()) if pending else None
+            try:
+                item, error = await asyncio.wait_for(items.get(), timeout)
+            except asyncio.TimeoutError:
+                yield {"chunk": "".join(pending)}
+                pending, size, flushed = [], 0, time.monotonic()
+                continue
+            if item is _END:
+                if pending:
+                    yield {"chunk": "".join(pending)}
+                if error is not None:
+                    raise error
+                return
+            if _is_chunk(item):
+                pending.append(item["chunk"])
+                size += len(item["chunk"].encode("utf-8"))
+                if size < max_bytes and time.monotonic() - flushed < interval:
+                    continue
+            if pending:
+                yield {"chunk": "".join(pending)}
+                pending, size, flushed = [], 0, time.monotonic()
+            if not _is_chunk(item):
+                yield item
+    finally:
+        if not task.done():
+            task.cancel()
+
+
+def gzip_stream(frames: Iterator[str], level: int = 6) -> Iterator[bytes]:
+    """gzip a streamed body incrementally.
+
+    Every frame is sync-flushed so the client can decode it right away, while
+    the compression window is shared across frames.
+    """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    try:
+        for frame in frames:
+            yield compressor.compress(frame.encode("utf-8")) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        yield compressor.flush()
+    finally:
+        close = getattr(frames, "close", None)
+        if close:
+            close()
+
+
+async def gzip_stream_async(frames: AsyncIterator[str], level: int = 6) -> AsyncIterator[bytes]:
+    """Async variant of gzip_stream"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    try:
+        async for frame in frames:
+            yield compressor.compress(frame.encode("utf-8")) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        yield compressor.flush()
+    finally:
+        aclose = getattr(frames, "aclose", None)
+        if aclose:
+            await aclose()
+
+
+class StreamLog:
+    """Events of one response, readable from any point by threads or tasks"""
+
+    def __init__(self, token: str):
+        self.token = token
+        self.events: List[str] = []
+        self.size = 0
+        self.done = False
+        self.created = time.monotonic()
+        self.updated = self.created
+        self.finished_at: Optional[float] = None
+        self.cond = threading.Condition()
+        self.task: Optional[asyncio.Task] = None
+        self._waiters: List[Tuple[asyncio.AbstractEventLoop, asyncio.Event]] = []
+
+    def event_id(self, number: int) -> str:
+        return f"{self.token}:{number}"
+
+    def append(self, payload: dict) -> Event:
+        data = json.dumps(payload, ensure_ascii=False)
+        with self.cond:
+            self.events.append(data)
+            self.size += len(data.encode("utf-8"))
+            self.updated = time.monotonic()
+            number = len(self.events)
+            self._notify()
+        return self.event_id(number), data
+
+    def finish(self):
+        with self.cond:
+            if not self.done:
+                self.done = True
+                self.finished_at = time.monotonic()
+            self._notify()
+
+    def _notify(self):
+        # Called with self.cond held
+        self.cond.notify_all()
+        for loop, event in self._waiters:
+            loop.call_soon_threadsafe(event.set)
+        self._waiters.clear()
+
+    def lead(self, payloads: Iterator[dict]) -> Iterator[Event]:
+        """Record payloads and yield them as events to the first client.
+
+        If that client goes away first, the rest is recorded by a background
+        thread so a reconnecting client can pick it up.
+        """
+        try:
+            for payload in payloads:
+                yield self.append(payload)
+        except GeneratorExit:
+            threading.Thread(target=self._drain, args=(payloads,), daemon=True).start()
+            raise
+        except BaseException:
+            self.finish()
+            raise
+        self.finish()
+
+    def _drain(self, payloads: Iterator[dict]):
+        try:
+            for payload in payloads:
+                self.append(payload)
+        except Exception as e:
+            logger.error(f"Background stream drain failed: {str(e)}")
+        finally:
+            self.finish()
+
+    async def pump_async(self, payloads: AsyncIterator[dict]):
+        """Record payloads until they run out, whoever is listening"""
+        try:
+            async for payload in payloads:
+                self.append(payload)
+        except Exception as e:
+            logger.error(f"Stream recording failed: {str(e)}")
+        finally:
+            self.finish()
+
+    def subscribe(self, after: int, timeout: float) -> Iterator[Event]:
+        """Yield the events after number `after`, waiting for new ones"""
+        index = after
+        while True:
+            with self.cond:
+                deadline = time.monotonic() + timeout
+                while index >= len(self.events) and not self.done:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise TimeoutError("Timed out waiting for stream events")
+                    self.cond.wait(remaining)
+                pending = self.events[index:]
+                done = self.done
+            for data in pending:
+                index += 1
+                yield self.event_id(index), data
+            if done and index >= len(self.events):
+                return
+
+    async def subscribe_async(self, after: int, timeout: float) -> AsyncIterator[Event]:
+        """Async variant of subscribe"""
+        index = after
+        while True:
+            event = None
+            with self.cond:
+                if index >= len(self.events) and not self.done:
+                    event = asyncio.Event()
+                    self._waiters.append((asyncio.get_running_loop(), event))
+                pending = self.events[index:]
+                done = self.done
+            if event is not None:
+                try:
+                    await asyncio.wait_for(event.wait(), timeout)
+                except asyncio.TimeoutError:
+                    raise TimeoutError("Timed out waiting for stream events")
+                continue
+            for data in pending:
+                index += 1
+                yield self.event_id(index), data
+            if done and index >= len(self.events):
+                return
+
+
+class ReplayBuffer:
+    """Recent response streams by token, bounded by count and bytes.
+
+    Finished streams expire ttl seconds after they end. When the buffer is
+    full the oldest finished streams go first; streams still in progress keep
+    running for their client but can no longer be resumed once evicted.
+    """
+
+    def __init__(self, max_streams: int = 1000, max_bytes: int = 32 * 1024 * 1024,
+                 ttl: float = 300, wait_timeout: float = 120):
+        self.max_streams = max_streams
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.wait_timeout = wait_timeout
+        self._logs: "OrderedDict[str, StreamLog]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.opened = 0
+        self.resumed = 0
+        self.missed = 0
+        self.evictions = 0
+
+    def open(self) -> StreamLog:
+        log = StreamLog(secrets.token_urlsafe(16))
+        with self._lock:
+            self._logs[log.token] = log
+            self.opened += 1
+            self._evict()
+        return log
+
+    def get(self, token: str) -> Optional[StreamLog]:
+        """The log for token, counting the lookup as a resume attempt"""
+        with self._lock:
+            log = self._logs.get(token)
+            if log is not None and self._expired(log, time.monotonic()):
+                del self._logs[token]
+                log = None
+            if log is None:
+                self.missed += 1
+            else:
+                self.resumed += 1
+            return log
+
+    def _expired(self, log: StreamLog, now: float) -> bool:
+        if log.done:
+            return now - log.finished_at > self.ttl
+        # Nothing was recorded for a long time: the producer is gone
+        return now - log.updated > self.wait_timeout + self.ttl
+
+    def _evict(self):
+        # Called with self._lock held
+        now = time.monotonic()
+        for token in [t for t, log in self._logs.items() if self._expired(log, now)]:
+            del self._logs[token]
+        size = sum(log.size for log in self._logs.values())
+        for finished_only in (True, False):
+            for token in list(self._logs):
+                if len(self._logs) <= self.max_streams and size <= self.max_bytes:
+                    return
+                log = self._logs[token]
+                if finished_only and not log.done:
+                    continue
+                del self._logs[token]
+                size -= log.size
+                self.evictions += 1
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "streams": len(self._logs),
+                "bytes": sum(log.size for log in self._logs.values()),
+                "opened": self.opened,
+                "resumed": self.resumed,
+                "missed": self.missed,
+                "evictions": self.evictions,
+            }
@@ -0,0 +1,545 @@
+import asyncio
+import logging
+import queue
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import AsyncIterator, Awaitable, Callable, Dict, Iterator, List, Optional, Sequence, Tuple, TypeVar
+
+from admission import AdmissionRejected
+
+logger = logging.getLogger(__name__)
+
+# Breaker states
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class ModelsUnavailable(Exception):
+    """Raised when every candidate model's circuit breaker is open"""
+    pass
+
+
+class CircuitBreaker:
+    """Stop sending traffic to a model that keeps failing.
+
+    After failure_threshold consecutive failures the breaker opens and
+    rejects calls for cooldown seconds. Then one trial call is let through
+    per cooldown period (half open) until one succeeds and closes it again.
+    """
+
+    def __init__(self, failure_threshold: int = 5, cooldown: float = 30):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self._lock = threading.Lock()
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.opened = 0
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            if time.monotonic() - self.opened_at < self.cooldown:
+                return False
+            # Let one trial through and restart the cooldown for the others
+            self.state = HALF_OPEN
+            self.opened_at = time.monotonic()
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self.state = CLOSED
+            self.failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != OPEN:
+                    self.opened += 1
+                self.state = OPEN
+                self.opened_at = time.monotonic()
+
+
+class ModelStats:
+    """Per-model counters and a window of first-token latencies"""
+
+    def __init__(self, window: int = 500):
+        self.first_token = deque(maxlen=window)
+        self.routed = 0
+        self.requests = 0
+        self.failures = 0
+        self.hedges = 0
+        self.wins = 0
+        self.losses = 0
+
+    def percentile(self, pct: float) -> Optional[float]:
+        if not self.first_token:
+            return None
+        ordered = sorted(self.first_token)
+        return ordered[min(len(ordered) - 1, int(pct / 100 * len(ordered)))]
+
+
+class _Attempt:
+    """One upstream request taking part in a (possibly hedged) race"""
+
+    def __init__(self, model: str, hedge: bool):
+        self.model = model
+        self.hedge = hedge
+        self.started = time.monotonic()
+        self.stream = None
+        self.task: Optional[asyncio.Task] = None
+        self.cancelled = False
+        self.finished = False
+
+    def cancel(self):
+        """Stop this attempt; safe to call from any thread"""
+        self.cancelled = True
+        if self.task is not None:
+            self.task.cancel()
+            return
+        abort = getattr(self.stream, "abort", None)
+        if abort is not None:
+            abort()
+
+
+_END = object()
+
+T = TypeVar("T")
+
+
+class RoutedStream:
+    """Deltas of a routed answer together with the model that won the race.
+
+    Wraps a sync or async iterator; iterate it the same way as the wrapped one.
+    """
+
+    def __init__(self, deltas, model: str):
+        self.deltas = deltas
+        self.model = model
+
+    def __iter__(self) -> Iterator[str]:
+        return self
+
+    def __next__(self) -> str:
+        return next(self.deltas)
+
+    def __aiter__(self) -> AsyncIterator[str]:
+        return self
+
+    async def __anext__(self) -> str:
+        return await self.deltas.__anext__()
+
+    def close(self):
+        close = getattr(self.deltas, "close", None)
+        if close:
+            close()
+
+    async def aclose(self):
+        aclose = getattr(self.deltas, "aclose", None)
+        if aclose:
+            await aclose()
+
+
+class _Race:
+    """Decisions for one routed request, shared by the thread and asyncio drivers.
+
+    The first candidate is tried first. If it has not produced a token when
+    its hedge delay expires, the next candidate is started as well and the
+    first one to produce a token wins; the others are cancelled. A candidate
+    that fails before its first token is replaced by the next one.
+    """
+
+    def __init__(self, router: "ModelRouter", candidates: Sequence[str]):
+        self.router = router
+        self.candidates = list(candidates)
+        self.attempts: List[_Attempt] = []
+        self.winner: Optional[_Attempt] = None
+        self.hedge_at: Optional[float] = None
+        delay = router.hedge_delay(self.candidates[0]) if len(self.candidates) > 1 else None
+        if delay is not None:
+            self.hedge_at = time.monotonic() + delay
+
+    def start(self, hedge: bool = False) -> Optional[_Attempt]:
+        """Create the next attempt whose breaker lets it through"""
+        while len(self.attempts) < len(self.candidates):
+            model = self.candidates[len(self.attempts)]
+            attempt = _Attempt(model, hedge)
+            self.attempts.append(attempt)
+            if self.router.breakers[model].allow():
+                self.router._count(model, "requests")
+                if hedge:
+                    self.router._count(model, "hedges")
+                return attempt
+            attempt.finished = True
+        return None
+
+    def timeout(self) -> Optional[float]:
+        """Seconds to wait for the next event before hedging, None to wait indefinitely"""
+        if self.winner is not None or self.hedge_at is None:
+            return None
+        return max(0.0, self.hedge_at - time.monotonic())
+
+    def on_timeout(self) -> Optional[_Attempt]:
+        """The hedge delay expired without a token: maybe start a backup"""
+        self.hedge_at = None
+        if not self.router.can_hedge():
+            return None
+        return self.start(hedge=True)
+
+    def on_token(self, attempt: _Attempt) -> List[_Attempt]:
+        """First token of the race: returns the losing attempts to cancel"""
+        self.winner = attempt
+        self.hedge_at = None
+        self.router._record_first_token(attempt.model, time.monotonic() - attempt.started)
+        self.router.breakers[attempt.model].record_success()
+        losers = [other for other in self.attempts if other is not attempt and not other.finished]
+        if losers:
+            self.router._count(attempt.model, "wins")
+            for loser in losers:
+                self.router._count(loser.model, "losses")
+        return losers
+
+    def on_failure(self, attempt: _Attempt, error: BaseException) -> Optional[_Attempt]:
+        """An attempt failed. Returns a replacement attempt or raises the error"""
+        attempt.finished = True
+        if not isinstance(error, AdmissionRejected):
+            self.router._record_failure(attempt.model)
+        if attempt is self.winner:
+            raise error
+        if any(not other.finished for other in self.attempts):
+            return None  # Another attempt is still racing
+        replacement = None if isinstance(error, AdmissionRejected) else self.start()
+        if replacement is None:
+            raise error
+        logger.warning(f"Model {attempt.model} failed, falling back to {replacement.model}: {str(error)}")
+        return replacement
+
+    def on_end(self, attempt: _Attempt) -> List[_Attempt]:
+        """A stream completed; an answer without tokens still wins"""
+        losers = self.on_token(attempt) if self.winner is None else []
+        self.on_success(attempt)
+        return losers
+
+    def on_success(self, attempt: _Attempt):
+        attempt.finished = True
+        self.router.breakers[attempt.model].record_success()
+
+    def cancel_all(self):
+        for attempt in self.attempts:
+            if not attempt.finished:
+                attempt.cancel()
+
+
+class ModelRouter:
+    """Choose a model per request, hedge slow first tokens and fail over.
+
+    route() picks the fast model for short questions without history in the
+    configured languages, unless the same prompt has missed the cache
+    before: a repeated question is worth the primary model's answer since it
+    will be served from the cache many times. Only answers the primary
+    model won are cached (see cacheable), so the repeat does reach it even
+    when a hedge or a failover answered from the fast model before.
+    """
+
+    def __init__(self, primary: str, fast: str = "", fast_max_chars: int = 60,
+                 fast_languages: Sequence[str] = ("en",), fast_max_history: int = 0,
+                 hedge: bool = True, hedge_percentile: float = 95,
+                 hedge_min_delay: float = 0.5, hedge_default_delay: float = 2.0,
+                 hedge_min_samples: int = 20, failure_threshold: int = 5,
+                 cooldown: float = 30, can_hedge: Callable[[], bool] = lambda: True,
+                 remember_misses: int = 4096):
+        self.primary = primary
+        self.fast = fast
+        self.fast_max_chars = fast_max_chars
+        self.fast_languages = set(fast_languages)
+        self.fast_max_history = fast_max_history
+        self.hedge = hedge
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_delay = hedge_min_delay
+        self.hedge_default_delay = hedge_default_delay
+        self.hedge_min_samples = hedge_min_samples
+        self.can_hedge = can_hedge
+        self.remember_misses = remember_misses
+        self._lock = threading.Lock()
+        self._misses: "OrderedDict[str, None]" = OrderedDict()
+        models = [primary] + ([fast] if fast and fast != primary else [])
+        self.breakers: Dict[str, CircuitBreaker] = {
+            model: CircuitBreaker(failure_threshold, cooldown) for model in models
+        }
+        self._stats: Dict[str, ModelStats] = {model: ModelStats() for model in models}
+
+    def route(self, messages: List[Dict[str, str]], language: str, cache_key: str) -> List[str]:
+        """Models to try for an upstream call, in order.
+
+        messages ends with the current question, without a copy of it in the
+        history before it.
+        """
+        with self._lock:
+            repeat = cache_key in self._misses
+        prior_turns = len(messages) - 1
+        use_fast = (
+            bool(self.fast)
+            and not repeat
+            and language in self.fast_languages
+            and prior_turns <= self.fast_max_history
+            and len(messages[-1]["content"]) <= self.fast_max_chars
+        )
+        chosen = self.fast if use_fast else self.primary
+        # The backup is the other model, or a second request to the same one
+        backup = self.primary if use_fast else (self.fast or self.primary)
+        return [chosen, backup]
+
+    def missed(self, cache_key: str, candidates: Sequence[str]):
+        """Record that cache_key missed the cache and goes upstream to candidates"""
+        with self._lock:
+            self._misses[cache_key] = None
+            self._misses.move_to_end(cache_key)
+            while len(self._misses) > self.remember_misses:
+                self._misses.popitem(last=False)
+        self._count(candidates[0], "routed")
+
+    def cacheable(self, answer: RoutedStream) -> bool:
+        """Whether a finished routed answer may be cached: only the primary
+        model's, whichever model the request was routed to"""
+        return answer.model == self.primary
+
+    def hedge_delay(self, model: str) -> Optional[float]:
+        """How long to wait for a first token before hedging"""
+        if not self.hedge:
+            return None
+        with self._lock:
+            stats = self._stats[model]
+            if len(stats.first_token) < self.hedge_min_samples:
+                return self.hedge_default_delay
+            return max(self.hedge_min_delay, stats.percentile(self.hedge_percentile))
+
+    def _count(self, model: str, field: str):
+        with self._lock:
+            stats = self._stats[model]
+            setattr(stats, field, getattr(stats, field) + 1)
+
+    def _record_first_token(self, model: str, seconds: float):
+        with self._lock:
+            self._stats[model].first_token.append(seconds)
+
+    def _record_failure(self, model: str):
+        self._count(model, "failures")
+        self.breakers[model].record_failure()
+
+    def _check(self, race: _Race, attempt: Optional[_Attempt]) -> _Attempt:
+        if attempt is None:
+            raise ModelsUnavailable(f"No model available among {', '.join(race.candidates)}")
+        return attempt
+
+    def call(self, candidates: Sequence[str], fetch: Callable[[str], T]) -> Tuple[str, T]:
+        """Buffered call: try the candidates in order until one succeeds.
+
+        Returns the model that answered and the result of fetch for it.
+        """
+        race = _Race(self, candidates)
+        attempt = self._check(race, race.start())
+        while True:
+            try:
+                result = fetch(attempt.model)
+            except Exception as e:
+                attempt = race.on_failure(attempt, e)
+                continue
+            race.on_success(attempt)
+            return attempt.model, result
+
+    async def call_async(self, candidates: Sequence[str],
+                         fetch: Callable[[str], Awaitable[T]]) -> Tuple[str, T]:
+        """Async variant of call"""
+        race = _Race(self, candidates)
+        attempt = self._check(race, race.start())
+        while True:
+            try:
+                result = await fetch(attempt.model)
+            except Exception as e:
+                attempt = race.on_failure(attempt, e)
+                continue
+            race.on_success(attempt)
+            return attempt.model, result
+
+    def stream(self, candidates: Sequence[str], open_stream: Callable[[str], Iterator[str]]) -> RoutedStream:
+        """Hedged streaming call; returns once the first token has arrived.
+
+        open_stream(model) runs on a worker thread per attempt. If the iterator
+        it returns has an abort() method, losing attempts are cut off with it;
+        otherwise they stop at their next token. Failures before the first
+        token are raised from here, failures after it from the iterator.
+        The returned stream's model is the attempt that won.
+        """
+        race = _Race(self, candidates)
+        events: "queue.Queue" = queue.Queue()
+
+        def run(attempt: _Attempt):
+            deltas = None
+            try:
+                deltas = open_stream(attempt.model)
+                attempt.stream = deltas
+                if attempt.cancelled:
+                    return
+                for delta in deltas:
+                    if attempt.cancelled:
+                        return
+                    events.put((attempt, delta))
+                events.put((attempt, _END))
+            except Exception as e:
+                if not attempt.cancelled:
+                    events.put((attempt, e))
+            finally:
+                close = getattr(deltas, "close", None)
+                if close:
+                    close()
+
+        def launch(attempt: Optional[_Attempt]):
+            if attempt is not None:
+                threading.Thread(target=run, args=(attempt,), daemon=True, name="model-attempt").start()
+
+        def next_event():
+            """Next (attempt, item) of the race, starting hedges and fallbacks as needed"""
+            while True:
+                try:
+                    attempt, item = events.get(timeout=race.timeout())
+                except queue.Empty:
+                    launch(race.on_timeout())
+                    continue
+                if attempt.cancelled:
+                    continue
+                if isinstance(item, Exception):
+                    launch(race.on_failure(attempt, item))
+                    continue
+                return attempt, item
+
+        launch(self._check(race, race.start()))
+        try:
+            attempt, first = next_event()
+        except BaseException:
+            race.cancel_all()
+            raise
+        losers = race.on_end(attempt) if first is _END else race.on_token(attempt)
+        for loser in losers:
+            loser.cancel()
+
+        def generate() -> Iterator[str]:
+            try:
+                if first is _END:
+                    return
+                yield first
+                while True:
+                    attempt, item = next_event()
+                    if item is _END:
+                        race.on_end(attempt)
+                        return
+                    yield item
+            finally:
+                race.cancel_all()
+
+        return RoutedStream(generate(), race.winner.model)
+
+    async def stream_async(self, candidates: Sequence[str],
+                           open_stream: Callable[[str], Awaitable[AsyncIterator[str]]]) -> RoutedStream:
+        """Async variant of stream; attempts are tasks and losers are cancelled"""
+        race = _Race(self, candidates)
+        events: asyncio.Queue = asyncio.Queue()
+
+        async def run(attempt: _Attempt):
+            try:
+                deltas = await open_stream(attempt.model)
+                try:
+                    async for delta in deltas:
+                        events.put_nowait((attempt, delta))
+                    events.put_nowait((attempt, _END))
+                finally:
+                    await deltas.aclose()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                events.put_nowait((attempt, e))
+
+        def launch(attempt: Optional[_Attempt]):
+            if attempt is not None:
+                attempt.task = asyncio.create_task(run(attempt))
+
+        async def next_event():
+            while True:
+                try:
+                    attempt, item = await asyncio.wait_for(events.get(), race.timeout())
+                except asyncio.TimeoutError:
+                    launch(race.on_timeout())
+                    continue
+                if attempt.cancelled:
+                    continue
+                if isinstance(item, Exception):
+                    launch(race.on_failure(attempt, item))
+                    continue
+                return attempt, item
+
+        launch(self._check(race, race.start()))
+        try:
+            attempt, first = await next_event()
+        except BaseException:
+            race.cancel_all()
+            raise
+        losers = race.on_end(attempt) if first is _END else race.on_token(attempt)
+        for loser in losers:
+            loser.cancel()
+
+        async def generate() -> AsyncIterator[str]:
+            try:
+                if first is _END:
+                    return
+                yield first
+                while True:
+                    attempt, item = await next_event()
+                    if item is _END:
+                        race.on_end(attempt)
+                        return
+                    yield item
+            finally:
+                race.cancel_all()
+
+        return RoutedStream(generate(), race.winner.model)
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        """Per-model routing, latency, hedge and breaker stats"""
+        with self._lock:
+            result = {}
+            for model, stats in self._stats.items():
+                p50 = stats.percentile(50)
+                p95 = stats.percentile(95)
+                result[model] = {
+                    "routed": stats.routed,
+                    "requests": stats.requests,
+                    "failures": stats.failures,
+                    "hedges": stats.hedges,
+                    "wins": stats.wins,
+                    "losses": stats.losses,
+                    "first_token_p50": round(p50, 3) if p50 is not None else None,
+                    "first_token_p95": round(p95, 3) if p95 is not None else None,
+                    "breaker": self.breakers[model].state,
+                    "breaker_opened": self.breakers[model].opened,
+                }
+            return result
+
+    def collect(self):
+        """Metrics collector yielding per-model families for the registry"""
+        stats = self.stats()
+        counters = ["routed", "requests", "failures", "hedges", "wins", "losses", "breaker_opened"]
+        for field in counters:
+            name = f"krishibot_model_{field}_total"
+            samples = [(name, {"model": model}, values[field]) for model, values in stats.items()]
+            yield name, "counter", f"Per-model {field.replace('_', ' ')}", samples
+        for field in ("first_token_p50", "first_token_p95"):
+            name = f"krishibot_model_{field}_seconds"
+            samples = [(name, {"model": model}, values[field])
+                       for model, values in stats.items() if values[field] is not None]
+            yield name, "gauge", f"Per-model {field.replace('_', ' ')} latency", samples
+        name = "krishibot_model_breaker_open"
+        samples = [(name, {"model": model}, int(values["breaker"] != CLOSED)) for model, values in stats.items()]
+        yield name, "gauge", "1 while the model's circuit breaker is open or half open", samples
@@ -0,0 +1,839 @@
+"""Chat service shared by the Flask (app.py) and ASGI (asgi.py) servers.
+
+Configuration, the Groq client, caching, admission control, model routing,
+the FAQ index and the SSE/NDJSON framing live here, free of any web
+framework. The Groq SDK and the FAQ index are loaded on first use (or by the
+warm-up phase), not at import, to keep cold starts short.
+"""
+import os
+import time
+from dotenv import load_dotenv
+import logging
+import json
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import TYPE_CHECKING, List, Dict, Generator, Iterator, Optional
+from cache import ResponseCache, make_cache_key
+from ratelimit import create_rate_limiter
+from admission import AdmissionController, AdmissionRejected, PRIORITY_HIGH, PRIORITY_NORMAL
+from context import ContextBuilder, PromptContext, PromptTooLong
+from formatter import ResponseFormatter, enforce_response_format
+from router import ModelRouter, ModelsUnavailable, RoutedStream
+from replay import ReplayBuffer, parse_event_id
+from startup import Lazy, WarmUp
+from metrics import (
+    REGISTRY, BATCH_ITEMS_TOTAL, ERRORS_TOTAL, KNOWLEDGE_LOOKUPS_TOTAL, STAGE_SECONDS,
+    record_usage, stats_collector
+)
+
+if TYPE_CHECKING:
+    from groq import Groq
+    from knowledge import KnowledgeIndex, KnowledgeMatch
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+# Load environment variables
+load_dotenv()
+
+# Rate limiting configuration: each client gets a token bucket of
+# RATE_LIMIT_BURST requests, refilled at RATE_LIMIT_REFILL tokens per second.
+# Use RATE_LIMIT_BACKEND=sqlite to share the limit between worker processes.
+RATE_LIMIT_BURST = int(os.getenv("RATE_LIMIT_BURST", 5))
+RATE_LIMIT_REFILL = float(os.getenv("RATE_LIMIT_REFILL", 0.5))
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "memory").lower()
+RATE_LIMIT_DB = os.getenv("RATE_LIMIT_DB", "")
+RATE_LIMIT_MAX_CLIENTS = int(os.getenv("RATE_LIMIT_MAX_CLIENTS", 10000))
+# Clients are limited per IP address. Partners given a key in RATE_LIMIT_API_KEYS
+# (comma-separated) and sending it as X-API-Key get a bucket of their own.
+RATE_LIMIT_API_KEYS = frozenset(key for key in os.getenv("RATE_LIMIT_API_KEYS", "").split(",") if key)
+# Number of reverse proxies in front of the app that append X-Forwarded-For;
+# the client address is the entry the outermost of them appended. Without a
+# proxy the client writes that header itself, so it is ignored unless a
+# proxied deployment opts in (e.g. TRUSTED_PROXY_HOPS=1 behind one nginx).
+TRUSTED_PROXY_HOPS = int(os.getenv("TRUSTED_PROXY_HOPS", 0))
+
+RATE_LIMIT_HEADERS = ["Retry-After", "X-RateLimit-Limit", "X-RateLimit-Remaining", "X-RateLimit-Reset"]
+# Response headers the browser client may read
+EXPOSED_HEADERS = RATE_LIMIT_HEADERS + ["X-Stream-ID"]
+
+SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    "Connection": "keep-alive",
+    "X-Accel-Buffering": "no"  # Stop proxies from buffering the stream
+}
+
+rate_limiter = create_rate_limiter(
+    RATE_LIMIT_BACKEND,
+    burst=RATE_LIMIT_BURST,
+    refill_rate=RATE_LIMIT_REFILL,
+    max_keys=RATE_LIMIT_MAX_CLIENTS,
+    path=RATE_LIMIT_DB
+)
+
+# Response mode: "stream" relays upstream tokens as they arrive,
+# "buffered" waits for the full answer and replays it with simulate_typing
+STREAM_MODE = os.getenv("STREAM_MODE", "stream").lower()
+
+# Resumable streams: every SSE event carries an id, and responses stay
+# available for STREAM_REPLAY_TTL seconds after they finish (within
+# STREAM_REPLAY_MAX_STREAMS / STREAM_REPLAY_MAX_BYTES), so a client that
+# reconnects with Last-Event-ID gets the rest without a new model call.
+# Answer chunks after the first are coalesced into events of
+# SSE_COALESCE_BYTES, or whatever arrived within SSE_FLUSH_INTERVAL seconds,
+# flushed on time even if the upstream stalls. SSE_COMPRESSION=gzip compresses
+# streams for clients that accept it.
+STREAM_REPLAY_TTL = float(os.getenv("STREAM_REPLAY_TTL", 300))  # seconds
+STREAM_REPLAY_MAX_STREAMS = int(os.getenv("STREAM_REPLAY_MAX_STREAMS", 1000))
+STREAM_REPLAY_MAX_BYTES = int(os.getenv("STREAM_REPLAY_MAX_BYTES", 32 * 1024 * 1024))
+SSE_COALESCE_BYTES = int(os.getenv("SSE_COALESCE_BYTES", 512))
+SSE_FLUSH_INTERVAL = float(os.getenv("SSE_FLUSH_INTERVAL", 0.1))  # seconds
+SSE_COMPRESSION = os.getenv("SSE_COMPRESSION", "").lower() == "gzip"
+
+stream_replay = ReplayBuffer(
+    max_streams=STREAM_REPLAY_MAX_STREAMS,
+    max_bytes=STREAM_REPLAY_MAX_BYTES,
+    ttl=STREAM_REPLAY_TTL
+)
+
+# Prompt budget: the model's context window is shared between the prompt and
+# up to MAX_COMPLETION_TOKENS of answer. Older turns that do not fit are
+# summarized; at most MAX_HISTORY_MESSAGES are considered at all.
+CONTEXT_WINDOW = int(os.getenv("CONTEXT_WINDOW", 8192))
+MAX_COMPLETION_TOKENS = int(os.getenv("MAX_COMPLETION_TOKENS", 1024))
+MAX_HISTORY_MESSAGES = int(os.getenv("MAX_HISTORY_MESSAGES", 40))
+
+context_builder = ContextBuilder(
+    context_window=CONTEXT_WINDOW,
+    max_completion_tokens=MAX_COMPLETION_TOKENS
+)
+
+# Answer cache configuration (set CACHE_MAX_ENTRIES=0 to disable)
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", 512))
+CACHE_MAX_BYTES = int(os.getenv("CACHE_MAX_BYTES", 16 * 1024 * 1024))
+CACHE_TTL = float(os.getenv("CACHE_TTL", 6 * 60 * 60))  # seconds
+
+# Upstream admission control: at most UPSTREAM_MAX_IN_FLIGHT Groq calls at once,
+# up to UPSTREAM_MAX_QUEUE more waiting UPSTREAM_QUEUE_TIMEOUT seconds for a slot.
+# Follow-up questions up to SHORT_FOLLOWUP_CHARS long are served first.
+UPSTREAM_MAX_IN_FLIGHT = int(os.getenv("UPSTREAM_MAX_IN_FLIGHT", 8))
+UPSTREAM_MAX_QUEUE = int(os.getenv("UPSTREAM_MAX_QUEUE", 64))
+UPSTREAM_QUEUE_TIMEOUT = float(os.getenv("UPSTREAM_QUEUE_TIMEOUT", 10))  # seconds
+SHORT_FOLLOWUP_CHARS = int(os.getenv("SHORT_FOLLOWUP_CHARS", 80))
+
+def upstream_http_options() -> dict:
+    """httpx client arguments: one keep-alive connection pool sized to the admission cap"""
+    import httpx
+
+    return {
+        "limits": httpx.Limits(
+            max_connections=UPSTREAM_MAX_IN_FLIGHT,
+            max_keepalive_connections=UPSTREAM_MAX_IN_FLIGHT,
+            keepalive_expiry=120
+        ),
+        "timeout": httpx.Timeout(60.0, connect=5.0),
+    }
+
+upstream_admission = AdmissionController(
+    max_in_flight=UPSTREAM_MAX_IN_FLIGHT,
+    max_queue=UPSTREAM_MAX_QUEUE,
+    queue_timeout=UPSTREAM_QUEUE_TIMEOUT
+)
+
+response_cache = ResponseCache(
+    max_entries=CACHE_MAX_ENTRIES,
+    max_bytes=CACHE_MAX_BYTES,
+    ttl=CACHE_TTL
+)
+
+# Model routing: short first questions in FAST_ROUTE_LANGUAGES go to FAST_MODEL
+# (set it empty to always use PRIMARY_MODEL). If no token has arrived after the
+# model's HEDGE_PERCENTILE first-token latency, a backup request is sent to the
+# other model and the first to answer wins. BREAKER_FAILURES consecutive
+# failures take a model out of rotation for BREAKER_COOLDOWN seconds.
+PRIMARY_MODEL = os.getenv("PRIMARY_MODEL", "llama3-70b-8192")
+FAST_MODEL = os.getenv("FAST_MODEL", "llama3-8b-8192")
+FAST_ROUTE_MAX_CHARS = int(os.getenv("FAST_ROUTE_MAX_CHARS", 60))
+FAST_ROUTE_LANGUAGES = os.getenv("FAST_ROUTE_LANGUAGES", "en").split(",")
+FAST_ROUTE_MAX_HISTORY = int(os.getenv("FAST_ROUTE_MAX_HISTORY", 0))  # messages
+HEDGE_ENABLED = os.getenv("HEDGE_ENABLED", "true").lower() == "true"
+HEDGE_PERCENTILE = float(os.getenv("HEDGE_PERCENTILE", 95))
+HEDGE_MIN_DELAY = float(os.getenv("HEDGE_MIN_DELAY", 0.5))  # seconds
+HEDGE_DEFAULT_DELAY = float(os.getenv("HEDGE_DEFAULT_DELAY", 2.0))  # until latencies are known
+BREAKER_FAILURES = int(os.getenv("BREAKER_FAILURES", 5))
+BREAKER_COOLDOWN = float(os.getenv("BREAKER_COOLDOWN", 30))  # seconds
+
+model_router = ModelRouter(
+    primary=PRIMARY_MODEL,
+    fast=FAST_MODEL,
+    fast_max_chars=FAST_ROUTE_MAX_CHARS,
+    fast_languages=FAST_ROUTE_LANGUAGES,
+    fast_max_history=FAST_ROUTE_MAX_HISTORY,
+    hedge=HEDGE_ENABLED,
+    hedge_percentile=HEDGE_PERCENTILE,
+    hedge_min_delay=HEDGE_MIN_DELAY,
+    hedge_default_delay=HEDGE_DEFAULT_DELAY,
+    failure_threshold=BREAKER_FAILURES,
+    cooldown=BREAKER_COOLDOWN,
+    # Hedging only uses spare capacity, it never queues behind real requests
+    can_hedge=upstream_admission.has_capacity
+)
+
+# Instrumentation: chat requests slower than SLOW_REQUEST_SECONDS are logged
+# with their per-stage timings. PROFILE_SAMPLE_RATE of requests (0 to 1) also
+# run under cProfile, and the profiles of slow ones are logged.
+SLOW_REQUEST_SECONDS = float(os.getenv("SLOW_REQUEST_SECONDS", 10))
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", 0))
+
+REGISTRY.register_collector(stats_collector(
+    "krishibot_cache", response_cache.stats,
+    counters=["hits", "misses", "coalesced", "evictions", "expirations"]
+))
+REGISTRY.register_collector(stats_collector(
+    "krishibot_admission", upstream_admission.stats,
+    counters=["admitted", "rejected", "timed_out", "wait_seconds_total"]
+))
+REGISTRY.register_collector(stats_collector(
+    "krishibot_rate_limit", lambda: {"rejected": rate_limiter.rejected},
+    counters=["rejected"]
+))
+REGISTRY.register_collector(stats_collector(
+    "krishibot_stream_replay", stream_replay.stats,
+    counters=["opened", "resumed", "missed", "evictions"]
+))
+REGISTRY.register_collector(model_router.collect)
+
+METRICS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Batch advisories: /api/chat/batch answers up to BATCH_MAX_ITEMS questions per
+# request, BATCH_WORKERS at a time, queued behind interactive chats upstream
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", 500))
+BATCH_WORKERS = max(1, int(os.getenv("BATCH_WORKERS", 4)))
+
+NDJSON_MIMETYPE = "application/x-ndjson"
+
+# Curated FAQ answers (KNOWLEDGE_DIR/en, KNOWLEDGE_DIR/hi; set it empty to
+# disable). A question is answered from an entry without calling Groq only
+# when it scores KNOWLEDGE_ANSWER_SCORE or more, leads the next entry by
+# KNOWLEDGE_ANSWER_MARGIN and has at least KNOWLEDGE_ANSWER_COVERAGE of its
+# words in the entry's phrasing; otherwise, from KNOWLEDGE_GROUNDING_SCORE,
+# the entry is added to the prompt as reference material. Scores are cosine
+# similarities between 0 and 1. The index lives in KNOWLEDGE_INDEX_DIR, shared
+# by the workers on a host, and is rebuilt when the documents change.
+KNOWLEDGE_DIR = os.getenv("KNOWLEDGE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "faq"))
+KNOWLEDGE_INDEX_DIR = os.getenv(
+    "KNOWLEDGE_INDEX_DIR", os.path.join(tempfile.gettempdir(), "krishibot-knowledge")
+)
+KNOWLEDGE_ANSWER_SCORE = float(os.getenv("KNOWLEDGE_ANSWER_SCORE", 0.9))
+KNOWLEDGE_ANSWER_MARGIN = float(os.getenv("KNOWLEDGE_ANSWER_MARGIN", 0.2))
+KNOWLEDGE_ANSWER_COVERAGE = float(os.getenv("KNOWLEDGE_ANSWER_COVERAGE", 1.0))
+KNOWLEDGE_GROUNDING_SCORE = float(os.getenv("KNOWLEDGE_GROUNDING_SCORE", 0.45))
+KNOWLEDGE_REFRESH_SECONDS = float(os.getenv("KNOWLEDGE_REFRESH_SECONDS", 30))
+
+def load_knowledge_index() -> Optional["KnowledgeIndex"]:
+    """Open (building it if needed) the FAQ index, or None when disabled"""
+    if not KNOWLEDGE_DIR:
+        return None
+    from knowledge import KnowledgeIndex
+
+    index = KnowledgeIndex(KNOWLEDGE_DIR, KNOWLEDGE_INDEX_DIR, KNOWLEDGE_REFRESH_SECONDS)
+    try:
+        index.refresh(force=True)
+    except OSError as e:
+        logger.error(f"Failed to load the knowledge index: {str(e)}")
+    return index
+
+# Loaded by the first chat or the warm-up; numpy is not imported before that
+knowledge_index = Lazy(load_knowledge_index)
+
+# Warm-up for scale-to-zero deployments: with WARMUP=true a fresh process
+# loads the Groq SDK, opens WARMUP_CONNECTIONS upstream connections, loads the
+# FAQ index and primes the per-language prompt and formatter caches before
+# /api/health/ready reports ready. /api/health answers as soon as the server
+# is up either way.
+WARMUP = os.getenv("WARMUP", "false").lower() == "true"
+WARMUP_CONNECTIONS = max(1, min(int(os.getenv("WARMUP_CONNECTIONS", 2)), UPSTREAM_MAX_IN_FLIGHT))
+
+GROUNDING_HEADERS = {
+    "en": "\n\n**Reference Answer**\nA vetted answer to a similar question. Use it where it applies, keeping the response format:\n\n",
+    "hi": "\n\n**संदर्भ उत्तर**\nमिलते-जुलते प्रश्न का जांचा हुआ उत्तर। जहां लागू हो इसका उपयोग करें और प्रतिक्रिया प्रारूप बनाए रखें:\n\n",
+}
+
+class ChatbotException(Exception):
+    """Custom exception for chatbot errors"""
+    pass
+
+def groq_api_key() -> str:
+    """The Groq API key, failing fast when it is not configured"""
+    try:
+        GROQ_API_KEY = os.getenv("GROQ_API_KEY")
+        if not GROQ_API_KEY:
+            raise ValueError("GROQ_API_KEY environment variable is missing")
+        return GROQ_API_KEY
+    except Exception as e:
+        logger.error(f"Failed to initialize Groq client: {str(e)}")
+        raise ChatbotException("Failed to initialize AI service")
+
+def initialize_groq_client() -> "Groq":
+    """Initialize and return the Groq client with error handling"""
+    try:
+        import httpx
+        from groq import Groq
+
+        # No SDK retries: the model router fails over to the other model
+        # instead of hammering the one that just failed
+        return Groq(api_key=groq_api_key(), http_client=httpx.Client(**upstream_http_options()),
+                    max_retries=0)
+    except ChatbotException:
+        raise
+    except Exception as e:
+        logger.error(f"Failed to initialize Groq client: {str(e)}")
+        raise ChatbotException("Failed to initialize AI service")
+
+# The app still fails fast without a key, but importing the SDK and building
+# the client wait for the first chat or the warm-up
+groq_api_key()
+client = Lazy(initialize_groq_client)
+
+# System prompts with improved formatting instructions
+SYSTEM_PROMPTS = {
+    "en": (
+        "You are KrishiBot, an expert AI agricultural assistant for Indian farmers. Follow these guidelines:\n\n"
+        "**Response Format Rules**\n"
+        "1. Always begin with **Bold Title** (HH:MM)\n"
+        "2. Use ## Section Headers with relevant emojis\n"
+        "3. Present information in clear, organized sections\n"
+        "4. Use bullet points (- ✨) for key information\n"
+        "5. Include practical examples from Indian agriculture\n"
+        "6. Provide regional considerations when relevant\n"
+        "7. Use simple, clear language suitable for farmers\n\n"
+        "**Content Guidelines**\n"
+        "- Always explain concepts clearly before giving recommendations\n"
+        "- Provide multiple solutions when available (organic/chemical)\n"
+        "- Include implementation tips and precautions\n"
+        "- Mention government schemes when relevant\n"
+        "- Add 'Did You Know?' facts when appropriate\n\n"
+        "**Example Response**\n\n"
+        "**Cotton Cultivation Best Practices** (14:30)\n\n"
+        "## 🌱 Ideal Growing Conditions\n"
+        "- ✨ Soil: Well-drained black cotton soil (pH 6-7)\n"
+        "- ✨ Temperature: 21-30°C (optimal for growth)\n"
+        "- ✨ Rainfall: 50-100cm annually (drought-resistant varieties available)\n\n"
+        "## 🚜 Planting Recommendations\n"
+        "- ✨ Spacing: 90cm between rows, 60cm between plants\n"
+        "- ✨ Seed rate: 15-20kg/ha for hybrids\n"
+        "- ✨ Best time: June-July for kharif season\n\n"
+        "💡 **Pro Tip**: In Maharashtra, variety NH-615 performs well in rainfed conditions with 20% higher yield than traditional varieties."
+    ),
+    "hi": (
+        "आप कृषि बॉट हैं, भारतीय किसानों के लिए एक विशेषज्ञ कृषि सहायक। इन दिशानिर्देशों का पालन करें:\n\n"
+        "**प्रतिक्रिया प्रारूप नियम**\n"
+        "1. हमेशा **बोल्ड शीर्षक** (HH:MM) से शुरू करें\n"
+        "2. ## अनुभाग शीर्षक और संबंधित इमोजी का उपयोग करें\n"
+        "3. जानकारी को स्पष्ट, व्यवस्थित अनुभागों में प्रस्तुत करें\n"
+        "4. मुख्य जानकारी के लिए बुलेट पॉइंट (- ✨) का उपयोग करें\n"
+        "5. भारतीय कृषि से व्यावहारिक उदाहरण शामिल करें\n"
+        "6. प्रासंगिक होने पर क्षेत्रीय विचार प्रदान करें\n"
+        "7. किसानों के लिए उपयुक्त सरल, स्पष्ट भाषा का प्रयोग करें\n\n"
+        "**सामग्री दिशानिर्देश**\n"
+        "- सिफारिशें देने से पहले हमेशा अवधारणाओं को स्पष्ट रूप से समझाएं\n"
+        "- उपलब्ध होने पर कई समाधान प्रदान करें (जैविक/रासायनिक)\n"
+        "- कार्यान्वयन युक्तियों और सावधानियों को शामिल करें\n"
+        "- प्रासंगिक होने पर सरकारी योजनाओं का उल्लेख करें\n"
+        "- उचित होने पर 'क्या आप जानते हैं?' तथ्य जोड़ें\n\n"
+        "**उदाहरण प्रतिक्रिया**\n\n"
+        "**कपास की खेती की सर्वोत्तम प्रथाएं** (14:30)\n\n"
+        "## 🌱 आदर्श उगाने की स्थितियाँ\n"
+        "- ✨ मिट्टी: अच्छी जल निकासी वाली काली कपास मिट्टी (pH 6-7)\n"
+        "- ✨ तापमान: 21-30°C (विकास के लिए इष्टतम)\n"
+        "- ✨ वर्षा: वार्षिक 50-100 सेमी (सूखा-प्रतिरोधी किस्में उपलब्ध)\n\n"
+        "## 🚜 रोपण की सिफारिशें\n"
+        "- ✨ दूरी: पंक्तियों के बीच 90 सेमी, पौधों के बीच 60 सेमी\n"
+        "- ✨ बीज दर: संकर किस्मों के लिए 15-20 किग्रा/हेक्टेयर\n"
+        "- ✨ सर्वोत्तम समय: खरीफ मौसम के लिए जून-जुलाई\n\n"
+        "💡 **विशेषज्ञ सलाह**: महाराष्ट्र में, एनएच-615 किस्म वर्षा आधारित परिस्थितियों में पारंपरिक किस्मों की तुलना में 20% अधिक उपज देती है।"
+    )
+}
+def validate_chat_request(data: dict) -> tuple:
+    """Validate incoming chat request data"""
+    if not isinstance(data, dict) or not data:
+        return False, "Request data is empty"
+    
+    message = data.get('message', '')
+    if not isinstance(message, str):
+        return False, "Message must be text"
+    if not message.strip():
+        return False, "Message cannot be empty"
+
+    if not isinstance(data.get('history', []), list):
+        return False, "History must be a list"
+    
+    language = data.get('language', 'en')
+    if language not in SYSTEM_PROMPTS:
+        return False, "Unsupported language"
+    
+    return True, ""
+
+def simulate_typing(text: str, chunk_size: int = 5, delay: float = 0.05) -> Generator[str, None, None]:
+    """Generate text chunks for typing simulation"""
+    words = text.split(' ')
+    current_chunk = []
+    
+    for word in words:
+        current_chunk.append(word)
+        if len(current_chunk) >= chunk_size:
+            # Keep the separator so chunks concatenate back to the original text
+            yield ' '.join(current_chunk) + ' '
+            current_chunk = []
+            if delay:
+                time.sleep(delay)  # Natural typing speed
+    
+    if current_chunk:
+        yield ' '.join(current_chunk)
+
+@lru_cache(maxsize=1024)
+def search_knowledge(text: str, language: str, generation: str) -> Optional["KnowledgeMatch"]:
+    """Memoized index search; generation keys out results from older indexes"""
+    return knowledge_index.get().search(text, language)
+
+def lookup_knowledge(messages: List[Dict[str, str]], language: str) -> Optional["KnowledgeMatch"]:
+    """Curated FAQ entry for the latest question, if it is close enough to use"""
+    index = knowledge_index.get()
+    if index is None:
+        return None
+    try:
+        index.refresh()
+        match = search_knowledge(messages[-1]["content"], language, index.generation)
+    except OSError as e:
+        logger.error(f"Knowledge index error: {str(e)}")
+        return None
+    if match is None or match.score < KNOWLEDGE_GROUNDING_SCORE:
+        return None
+    return match
+
+def knowledge_answer(messages: List[Dict[str, str]], language: str) -> Optional[str]:
+    """Formatted curated answer when the question closely matches an FAQ entry"""
+    match = lookup_knowledge(messages, language)
+    if match is None:
+        KNOWLEDGE_LOOKUPS_TOTAL.inc(outcome="miss")
+        return None
+    # A curated answer is returned word for word, so "best time to sow wheat
+    # in kerala" or a bare "wheat" only ground the model's answer
+    if (match.score < KNOWLEDGE_ANSWER_SCORE or match.margin < KNOWLEDGE_ANSWER_MARGIN
+            or match.coverage < KNOWLEDGE_ANSWER_COVERAGE):
+        KNOWLEDGE_LOOKUPS_TOTAL.inc(outcome="grounded")
+        return None
+    KNOWLEDGE_LOOKUPS_TOTAL.inc(outcome="answered")
+    logger.info(f"Answered from {match.source} ({match.score:.2f}): {match.question}")
+    with STAGE_SECONDS.time(stage="format"):
+        return enforce_response_format(match.answer, language)
+
+def build_context(messages: List[Dict[str, str]], language: str) -> PromptContext:
+    """Pack the system prompt and conversation into the prompt token budget.
+
+    A related curated FAQ answer, if there is one, is appended to the system
+    prompt for the model to draw on, as far as it fits after the question.
+    """
+    match = lookup_knowledge(messages, language)
+    grounding = GROUNDING_HEADERS[language] + match.answer if match is not None else ""
+    try:
+        return context_builder.build(SYSTEM_PROMPTS[language], messages, grounding)
+    except PromptTooLong as e:
+        ERRORS_TOTAL.inc(type="prompt_too_long")
+        logger.error(f"Prompt error: {str(e)}; CONTEXT_WINDOW={CONTEXT_WINDOW} is too small")
+        raise ChatbotException("Failed to generate response")
+
+def completion_request(context: PromptContext, model: str = PRIMARY_MODEL) -> dict:
+    """Keyword arguments for a Groq chat completion"""
+    return {
+        "messages": context.messages,
+        "model": model,
+        "temperature": 0.4,
+        "max_tokens": MAX_COMPLETION_TOKENS,
+        "top_p": 0.9,
+    }
+
+def upstream_priority(messages: List[Dict[str, str]]) -> int:
+    """Short follow-up questions jump the upstream queue.
+
+    A follow-up answers something the bot said, so it needs an assistant turn
+    before the current question (prepare_messages has already dropped the
+    client's copy of the question from the history).
+    """
+    follow_up = any(msg["role"] == "assistant" for msg in messages[:-1])
+    if follow_up and len(messages[-1]["content"]) <= SHORT_FOLLOWUP_CHARS:
+        return PRIORITY_HIGH
+    return PRIORITY_NORMAL
+
+def response_cache_key(context: PromptContext, language: str) -> str:
+    """Cache key for the prompt that context sends upstream"""
+    packed = context.messages
+    return make_cache_key(language, packed[-1]["content"], packed[1:-1])
+
+def acquire_upstream(messages: List[Dict[str, str]], priority: Optional[int] = None) -> float:
+    """Wait for an upstream admission slot, recording how long that took"""
+    if priority is None:
+        priority = upstream_priority(messages)
+    started = time.perf_counter()
+    try:
+        return upstream_admission.acquire(priority)
+    finally:
+        STAGE_SECONDS.observe(time.perf_counter() - started, stage="admission_wait")
+
+def chunk_usage(chunk):
+    """Token usage reported on a streamed chunk (Groq sends it on the last one)"""
+    if chunk.usage is not None:
+        return chunk.usage
+    return chunk.x_groq.usage if chunk.x_groq is not None else None
+
+def fetch_completion(messages: List[Dict[str, str]], context: PromptContext,
+                     priority: Optional[int] = None, model: str = PRIMARY_MODEL) -> str:
+    """Get the raw, unformatted answer from Groq API in one response"""
+    admitted_at = acquire_upstream(messages, priority)
+    try:
+        with STAGE_SECONDS.time(stage="upstream"):
+            response = client.get().chat.completions.create(
+                **completion_request(context, model),
+                stream=False
+            )
+        record_usage(response.usage)
+        return response.choices[0].message.content
+
+    except Exception as e:
+        ERRORS_TOTAL.inc(type="upstream")
+        logger.error(f"AI API Error ({model}): {str(e)}")
+        raise ChatbotException("Failed to generate response")
+    finally:
+        upstream_admission.release(admitted_at)
+
+class CompletionStream:
+    """Raw text deltas of one streaming Groq completion.
+
+    Holds an admission slot until the stream is exhausted or closed. abort()
+    may be called from another thread to cut the upstream connection, e.g.
+    when a hedged request lost the race.
+    """
+
+    def __init__(self, stream, admitted_at: float, started: float):
+        self._stream = stream
+        self._admitted_at = admitted_at
+        self._started = started
+        self._released = False
+        self.aborted = False
+        self._deltas = self._generate()
+
+    def __iter__(self) -> Iterator[str]:
+        return self._deltas
+
+    def __next__(self) -> str:
+        return next(self._deltas)
+
+    def _generate(self) -> Generator[str, None, None]:
+        first_token = True
+        try:
+            for chunk in self._stream:
+                record_usage(chunk_usage(chunk))
+                if chunk.choices and chunk.choices[0].delta.content:
+                    if first_token:
+                        STAGE_SECONDS.observe(time.perf_counter() - self._started, stage="upstream_first_token")
+                        first_token = False
+                    yield chunk.choices[0].delta.content
+        except Exception as e:
+            if self.aborted:
+                return
+            ERRORS_TOTAL.inc(type="upstream_stream")
+            logger.error(f"AI stream error: {str(e)}")
+            raise ChatbotException("Failed to generate response")
+        finally:
+            self._release()
+
+    def _release(self):
+        if not self._released:
+            self._released = True
+            # Release the upstream connection, also when the client disconnects
+            self._stream.close()
+            upstream_admission.release(self._admitted_at)
+            STAGE_SECONDS.observe(time.perf_counter() - self._started, stage="upstream")
+
+    def close(self):
+        self._deltas.close()
+        self._release()  # In case iteration never started
+
+    def abort(self):
+        self.aborted = True
+        self._stream.close()
+
+def open_completion_stream(messages: List[Dict[str, str]], context: PromptContext,
+                           model: str = PRIMARY_MODEL) -> CompletionStream:
+    """Open a streaming Groq completion and return its raw text deltas.
+
+    The upstream request is sent before this function returns, so connection
+    and authentication failures surface as ChatbotException (or
+    AdmissionRejected when upstream capacity is exhausted) while the HTTP
+    status can still be changed. Errors after that are raised while iterating.
+    """
+    admitted_at = acquire_upstream(messages)
+    started = time.perf_counter()
+    try:
+        stream = client.get().chat.completions.create(
+            **completion_request(context, model),
+            stream=True
+        )
+    except Exception as e:
+        upstream_admission.release(admitted_at)
+        ERRORS_TOTAL.inc(type="upstream")
+        logger.error(f"AI API Error ({model}): {str(e)}")
+        raise ChatbotException("Failed to generate response")
+    return CompletionStream(stream, admitted_at, started)
+
+def models_unavailable(error: ModelsUnavailable) -> ChatbotException:
+    ERRORS_TOTAL.inc(type="models_unavailable")
+    logger.error(f"AI API Error: {str(error)}")
+    return ChatbotException("Failed to generate response")
+
+def fetch_routed_completion(messages: List[Dict[str, str]], context: PromptContext, cache_key: str,
+                            candidates: List[str], priority: Optional[int] = None) -> RoutedStream:
+    """Get the raw answer from the routed model, falling back to the other on failure"""
+    model_router.missed(cache_key, candidates)
+    try:
+        model, text = model_router.call(
+            candidates, lambda model: fetch_completion(messages, context, priority, model)
+        )
+    except ModelsUnavailable as e:
+        raise models_unavailable(e)
+    return RoutedStream(iter([text]), model)
+
+def open_routed_stream(messages: List[Dict[str, str]], context: PromptContext, cache_key: str,
+                       candidates: List[str]) -> RoutedStream:
+    """Stream the answer from the routed model, hedging a slow first token.
+
+    Returns once the first token has arrived, so when every candidate fails
+    the error still surfaces before the response starts.
+    """
+    model_router.missed(cache_key, candidates)
+    try:
+        return model_router.stream(
+            candidates, lambda model: open_completion_stream(messages, context, model)
+        )
+    except ModelsUnavailable as e:
+        raise models_unavailable(e)
+
+def get_ai_response(messages: List[Dict[str, str]], language: str = "en",
+                    priority: Optional[int] = None, context: Optional[PromptContext] = None) -> str:
+    """Get formatted response from Groq API, served from the cache when possible.
+
+    context is the packed prompt from build_context, if the caller has it already.
+    """
+    if context is None:
+        context = build_context(messages, language)
+    key = response_cache_key(context, language)
+    candidates = model_router.route(messages, language, key)
+    chunks = response_cache.get_or_stream(
+        key,
+        lambda: fetch_routed_completion(messages, context, key, candidates, priority),
+        store=model_router.cacheable
+    )
+    try:
+        text = "".join(chunks)
+        with STAGE_SECONDS.time(stage="format"):
+            return enforce_response_format(text, language)
+    except (ChatbotException, AdmissionRejected):
+        raise
+    except Exception as e:
+        logger.error(f"AI API Error: {str(e)}")
+        raise ChatbotException("Failed to generate response")
+
+def stream_ai_response(messages: List[Dict[str, str]], language: str = "en",
+                       context: Optional[PromptContext] = None) -> Generator[str, None, None]:
+    """Return a generator of formatted chunks as the answer is produced.
+
+    Identical concurrent requests share one upstream call and completed
+    answers are replayed from the cache. context is as for get_ai_response.
+    """
+    if context is None:
+        context = build_context(messages, language)
+    key = response_cache_key(context, language)
+    candidates = model_router.route(messages, language, key)
+    deltas = response_cache.get_or_stream(
+        key,
+        lambda: open_routed_stream(messages, context, key, candidates),
+        store=model_router.cacheable
+    )
+
+    def generate() -> Generator[str, None, None]:
+        formatter = ResponseFormatter(language)
+        formatting = 0.0
+        try:
+            for delta in deltas:
+                started = time.perf_counter()
+                formatted = formatter.feed(delta)
+                formatting += time.perf_counter() - started
+                if formatted:
+                    yield formatted
+            tail = formatter.flush()
+            if tail:
+                yield tail
+        except ChatbotException:
+            raise
+        except Exception as e:
+            logger.error(f"AI stream error: {str(e)}")
+            raise ChatbotException("Failed to generate response")
+        finally:
+            STAGE_SECONDS.observe(formatting, stage="format")
+            close = getattr(deltas, "close", None)
+            if close:
+                close()
+
+    return generate()
+
+def sse_event(event_id: str, data: str) -> str:
+    """Frame a recorded event as a server-sent event"""
+    return f"id: {event_id}\ndata: {data}\n\n"
+
+def chat_events(chunks: Iterator[str]) -> Iterator[dict]:
+    """SSE payloads for an answer: its chunks, then a done or error marker"""
+    try:
+        for chunk in chunks:
+            yield {"chunk": chunk}
+        yield {"done": True}  # End of stream marker
+    except Exception as e:
+        ERRORS_TOTAL.inc(type="stream")
+        logger.error(f"Streaming error: {str(e)}")
+        yield {"error": "Streaming failed", "done": True}
+
+def stream_encoding(accept_encoding: str) -> Dict[str, str]:
+    """Headers for a gzipped SSE body, if enabled and the client accepts it"""
+    if SSE_COMPRESSION and "gzip" in accept_encoding.lower():
+        return {"Content-Encoding": "gzip", "Vary": "Accept-Encoding"}
+    return {}
+
+def resume_position(token: str, last_event_id: Optional[str], after: int) -> int:
+    """Event number to resume token from, preferring a matching Last-Event-ID"""
+    last_event = parse_event_id(last_event_id)
+    if last_event and last_event[0] == token:
+        return last_event[1]
+    return after
+
+def prepare_messages(data: dict) -> List[Dict[str, str]]:
+    """Build the conversation context from a validated chat request.
+
+    Only user and assistant turns with text content are kept. The web client
+    sends the current question as the last history entry too; that copy is
+    dropped so the question is counted and sent once.
+    """
+    message = data['message'].strip()
+    history = data.get('history', [])
+    valid_messages = [
+        {"role": msg["role"], "content": msg["content"]}
+        for msg in history[-MAX_HISTORY_MESSAGES:]
+        if isinstance(msg, dict) and msg.get("role") in ("user", "assistant")
+        and isinstance(msg.get("content"), str) and msg["content"].strip()
+    ]
+    last = valid_messages[-1] if valid_messages else None
+    if last and last["role"] == "user" and last["content"].strip() == message:
+        valid_messages.pop()
+    valid_messages.append({"role": "user", "content": message})
+    return valid_messages
+
+def prompt_headers(context: PromptContext) -> Dict[str, str]:
+    """Log the prompt size for a request and describe it in response headers"""
+    logger.info(
+        f"Prompt: {context.prompt_tokens} tokens, {context.turns_included} turns, "
+        f"{context.turns_summarized} summarized"
+    )
+    return {"X-Prompt-Tokens": str(context.prompt_tokens)}
+
+def validate_batch_request(data: dict) -> tuple:
+    """Validate a batch request; the items themselves are checked one by one"""
+    if not isinstance(data, dict) or not data:
+        return False, "Request data is empty"
+
+    items = data.get('items')
+    if not isinstance(items, list) or not items:
+        return False, "Items must be a non-empty list"
+
+    if len(items) > BATCH_MAX_ITEMS:
+        return False, f"A batch can have at most {BATCH_MAX_ITEMS} items"
+
+    return True, ""
+
+def validate_batch_item(item) -> tuple:
+    """Validate one batch item like a single chat request"""
+    if not isinstance(item, dict):
+        return False, "Item must be an object"
+    return validate_chat_request(item)
+
+def ndjson_line(payload: dict) -> str:
+    """Serialize a payload as one line of newline-delimited JSON"""
+    return json.dumps(payload, ensure_ascii=False) + "\n"
+
+def batch_success(index: int, response: str) -> dict:
+    BATCH_ITEMS_TOTAL.inc(outcome="ok")
+    return {"index": index, "response": response}
+
+def batch_error(index: int, item: dict, error: Exception) -> dict:
+    """Per-item result line for a failed batch item"""
+    language = item.get('language', 'en') if isinstance(item, dict) else 'en'
+    if isinstance(error, AdmissionRejected):
+        BATCH_ITEMS_TOTAL.inc(outcome="busy")
+        return {"index": index, "error": busy_error_message(language), "retry_after": error.retry_after}
+    BATCH_ITEMS_TOTAL.inc(outcome="failed")
+    if isinstance(error, ChatbotException):
+        return {"index": index, "error": technical_error_message(language)}
+    logger.error(f"Unexpected batch item error: {str(error)}")
+    return {"index": index, "error": "Internal server error"}
+
+def technical_error_message(language: str) -> str:
+    """User facing message for upstream failures"""
+    return (
+        "Sorry, I'm having technical issues. Please try again later."
+        if language == 'en' else
+        "क्षमा करें, तकनीकी समस्या हो रही है। कृपया बाद में प्रयास करें।"
+    )
+
+def busy_error_message(language: str) -> str:
+    """User facing message when upstream capacity is exhausted"""
+    return (
+        "KrishiBot is busy right now. Please try again in a few seconds."
+        if language == 'en' else
+        "कृषि बॉट अभी व्यस्त है। कृपया कुछ सेकंड बाद पुनः प्रयास करें।"
+    )
+
+def knowledge_stats() -> Optional[dict]:
+    """FAQ index stats for the health check, without loading the index for it"""
+    index = knowledge_index.get() if knowledge_index.created else None
+    return index.stats() if index else None
+
+def warm_upstream():
+    """Build the Groq client and open keep-alive connections to the API"""
+    groq = client.get()
+    with ThreadPoolExecutor(max_workers=WARMUP_CONNECTIONS, thread_name_prefix="warmup") as executor:
+        # Concurrent requests each open their own connection, which then
+        # stays in the pool for the first chats
+        for future in [executor.submit(groq.models.list) for _ in range(WARMUP_CONNECTIONS)]:
+            future.result()
+
+def warm_knowledge():
+    knowledge_index.get()
+
+def warm_prompts():
+    """Count the system prompt tokens and run the formatter for each language"""
+    for language, system_prompt in SYSTEM_PROMPTS.items():
+        # estimate_tokens memoizes the system prompt count for every later chat
+        context_builder.build(system_prompt, [{"role": "user", "content": "?"}])
+        # The prompts are written in the answer format, so they take the
+        # formatter through its title, section and bullet paths
+        enforce_response_format(system_prompt, language)
+
+def create_warmup(warm_upstream_step) -> WarmUp:
+    """Warm-up steps for a server, given its way of warming the upstream client"""
+    return WarmUp([
+        ("upstream", warm_upstream_step),
+        ("knowledge", warm_knowledge),
+        ("prompts", warm_prompts),
+    ], enabled=WARMUP)
@@ -0,0 +1,130 @@
+"""Cold start helpers: lazily built objects and the optional warm-up phase.
+
+Heavy clients and indexes are wrapped in Lazy so importing the app stays
+cheap and the first request (or warm-up) pays for them exactly once. A
+WarmUp runs named steps in the background after start-up and tells the
+readiness check when they are done.
+"""
+import asyncio
+import logging
+import threading
+import time
+from typing import Awaitable, Callable, Dict, Generic, List, Tuple, TypeVar, Union
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+_UNSET = object()
+
+
+class Lazy(Generic[T]):
+    """A value built by factory on first use, once, even when threads race.
+
+    If the factory raises, nothing is stored and the next get() tries again.
+    """
+
+    def __init__(self, factory: Callable[[], T]):
+        self._factory = factory
+        self._value = _UNSET
+        self._lock = threading.Lock()
+
+    @property
+    def created(self) -> bool:
+        return self._value is not _UNSET
+
+    def get(self) -> T:
+        value = self._value
+        if value is _UNSET:
+            with self._lock:
+                if self._value is _UNSET:
+                    self._value = self._factory()
+                value = self._value
+        return value
+
+
+Step = Callable[[], Union[None, Awaitable[None]]]
+
+
+class WarmUp:
+    """Start-up steps that prepare the process before it reports ready.
+
+    Steps run in order, each timed. A failing step is logged and recorded but
+    does not hold readiness back: what it would have prepared is still built
+    lazily by the first request that needs it. When disabled the process is
+    ready from the start.
+    """
+
+    def __init__(self, steps: List[Tuple[str, Step]], enabled: bool = True):
+        self.steps = steps
+        self.enabled = enabled
+        self.timings: Dict[str, float] = {}
+        self.errors: Dict[str, str] = {}
+        self.seconds = 0.0
+        self._ready = threading.Event()
+        if not enabled:
+            self._ready.set()
+
+    @property
+    def ready(self) -> bool:
+        return self._ready.is_set()
+
+    def start(self) -> threading.Thread:
+        """Run the steps on a background thread"""
+        thread = threading.Thread(target=self.run, daemon=True, name="warmup")
+        thread.start()
+        return thread
+
+    def run(self):
+        started = time.perf_counter()
+        try:
+            for name, step in self.steps:
+                self._run_step(name, step)
+        finally:
+            self._finish(started)
+
+    async def run_async(self):
+        """Run the steps on the event loop; blocking steps go to a thread"""
+        started = time.perf_counter()
+        try:
+            for name, step in self.steps:
+                if asyncio.iscoroutinefunction(step):
+                    await self._run_step_async(name, step)
+                else:
+                    await asyncio.to_thread(self._run_step, name, step)
+        finally:
+            self._finish(started)
+
+    def _run_step(self, name: str, step: Step):
+        step_started = time.perf_counter()
+        try:
+            step()
+        except Exception as e:
+            self._failed(name, e)
+        self.timings[name] = round(time.perf_counter() - step_started, 4)
+
+    async def _run_step_async(self, name: str, step: Step):
+        step_started = time.perf_counter()
+        try:
+            await step()
+        except Exception as e:
+            self._failed(name, e)
+        self.timings[name] = round(time.perf_counter() - step_started, 4)
+
+    def _failed(self, name: str, error: Exception):
+        self.errors[name] = str(error)
+        logger.error(f"Warm-up step {name} failed: {str(error)}")
+
+    def _finish(self, started: float):
+        self.seconds = round(time.perf_counter() - started, 4)
+        self._ready.set()
+        logger.info(f"Warm-up finished in {self.seconds:.2f}s: {self.timings}")
+
+    def status(self) -> dict:
+        return {
+            "ready": self.ready,
+            "warmup": self.enabled,
+            "seconds": self.seconds,
+            "steps": dict(self.timings),
+            "errors": dict(self.errors),
+        }
@@ -0,0 +1,14 @@
+import os
+import sys
+import tempfile
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+# service.py reads its configuration on import. Tests never reach the Groq
+# API (nothing listens on port 9), build their own FAQ index and are not
+# held up by the per-client rate limit.
+os.environ.setdefault("GROQ_API_KEY", "test")
+os.environ.setdefault("GROQ_BASE_URL", "http://127.0.0.1:9")
+os.environ.setdefault("KNOWLEDGE_INDEX_DIR", tempfile.mkdtemp(prefix="krishibot-test-knowledge-"))
+os.environ.setdefault("RATE_LIMIT_BURST", "1000")
@@ -0,0 +1,118 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from admission import PRIORITY_HIGH, PRIORITY_LOW, PRIORITY_NORMAL, AdmissionController, AdmissionRejected
+
+
+def wait_until(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "condition not met in time"
+        time.sleep(0.001)
+
+
+def test_waiters_are_served_by_priority_then_arrival():
+    admission = AdmissionController(max_in_flight=1, max_queue=10, queue_timeout=5)
+    held = admission.acquire()
+    order = []
+
+    def wait(name, priority):
+        admitted_at = admission.acquire(priority)
+        order.append(name)
+        admission.release(admitted_at)
+
+    threads = []
+    for name, priority in (("low", PRIORITY_LOW), ("normal-1", PRIORITY_NORMAL),
+                           ("high", PRIORITY_HIGH), ("normal-2", PRIORITY_NORMAL)):
+        thread = threading.Thread(target=wait, args=(name, priority))
+        thread.start()
+        threads.append(thread)
+        wait_until(lambda: admission.queued == len(threads))
+
+    admission.release(held)
+    for thread in threads:
+        thread.join(5)
+    assert order == ["high", "normal-1", "normal-2", "low"]
+    assert admission.stats()["in_flight"] == 0
+
+
+def test_full_queue_rejects_at_once_with_retry_after():
+    admission = AdmissionController(max_in_flight=1, max_queue=0)
+    held = admission.acquire()
+    with pytest.raises(AdmissionRejected) as rejected:
+        admission.acquire()
+    assert rejected.value.retry_after >= 1
+    admission.release(held)
+    assert admission.stats()["rejected"] == 1
+    assert admission.stats()["in_flight"] == 0
+
+
+def test_timed_out_waiter_does_not_take_the_released_slot():
+    admission = AdmissionController(max_in_flight=1, max_queue=5, queue_timeout=0.05)
+    held = admission.acquire()
+    with pytest.raises(AdmissionRejected):
+        admission.acquire()
+    admission.release(held)
+    stats = admission.stats()
+    assert (stats["in_flight"], stats["queued"], stats["timed_out"]) == (0, 0, 1)
+    admission.release(admission.acquire())
+
+
+def test_cancelled_async_waiter_gives_its_slot_back():
+    admission = AdmissionController(max_in_flight=1, max_queue=5, queue_timeout=5)
+
+    async def main():
+        held = await admission.acquire_async()
+        waiter = asyncio.create_task(admission.acquire_async())
+        await asyncio.sleep(0.01)
+        assert admission.queued == 1
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+        admission.release(held)
+
+    asyncio.run(main())
+    assert admission.stats()["in_flight"] == 0
+    assert admission.stats()["queued"] == 0
+
+
+def test_async_waiter_cancelled_as_it_is_granted_releases_the_slot():
+    admission = AdmissionController(max_in_flight=1, max_queue=5, queue_timeout=5)
+
+    async def main():
+        held = await admission.acquire_async()
+        waiter = asyncio.create_task(admission.acquire_async())
+        await asyncio.sleep(0.01)
+        # The slot is handed to the waiter, which is cancelled before it runs
+        admission.release(held)
+        waiter.cancel()
+        result = await asyncio.gather(waiter, return_exceptions=True)
+        assert isinstance(result[0], asyncio.CancelledError)
+
+    asyncio.run(main())
+    assert admission.stats()["in_flight"] == 0
+    assert admission.stats()["queued"] == 0
+
+
+def test_overloaded_upstream_answers_503_and_releases_slots(monkeypatch):
+    import app as flask_app
+    import service
+
+    admission = service.upstream_admission
+    monkeypatch.setattr(admission, "max_queue", 0)
+    held = [admission.acquire() for _ in range(admission.max_in_flight)]
+    try:
+        response = flask_app.app.test_client().post(
+            "/api/chat", json={"message": "How do I store onions through the monsoon?", "language": "en"}
+        )
+    finally:
+        for admitted_at in held:
+            admission.release(admitted_at)
+
+    assert response.status_code == 503
+    assert int(response.headers["Retry-After"]) >= 1
+    assert "error" in response.get_json()
+    assert admission.stats()["in_flight"] == 0
+    assert admission.stats()["queued"] == 0
@@ -0,0 +1,77 @@
+import json
+
+import pytest
+
+from service import ChatbotException, batch_error, validate_batch_item, validate_batch_request
+
+# The first item is answered from the curated FAQs, so no upstream is needed
+ITEMS = [
+    {"message": "PM-KISAN eligibility", "language": "en"},
+    {"message": 5},
+    {"message": "wheat", "history": "not a list"},
+    7,
+    {"message": "   "},
+    {"message": "wheat", "language": "fr"},
+]
+
+
+@pytest.fixture(params=["flask", "asgi"])
+def post_batch(request):
+    if request.param == "flask":
+        import app
+        client = app.app.test_client()
+
+        def post(payload):
+            response = client.post("/api/chat/batch", json=payload)
+            return response.status_code, response.get_data(as_text=True)
+    else:
+        from starlette.testclient import TestClient
+
+        import asgi
+        client = TestClient(asgi.app)
+
+        def post(payload):
+            response = client.post("/api/chat/batch", json=payload)
+            return response.status_code, response.text
+    return post
+
+
+def test_validate_batch_item():
+    assert validate_batch_item({"message": "wheat"}) == (True, "")
+    assert validate_batch_item(7) == (False, "Item must be an object")
+    assert validate_batch_item({"message": 5}) == (False, "Message must be text")
+    assert validate_batch_item({"message": ""})[0] is False
+    assert validate_batch_item({"message": "wheat", "history": "x"}) == (False, "History must be a list")
+
+
+def test_validate_batch_request():
+    assert validate_batch_request({"items": [{"message": "wheat"}]}) == (True, "")
+    assert validate_batch_request({"items": []})[0] is False
+    assert validate_batch_request([])[0] is False
+
+
+def test_batch_error_lines():
+    assert batch_error(3, 7, ValueError("bad"))["index"] == 3
+    line = batch_error(1, {"language": "hi"}, ChatbotException("down"))
+    assert line["index"] == 1 and "error" in line
+
+
+def test_bad_items_become_error_lines_without_ending_the_batch(post_batch):
+    status, body = post_batch({"items": ITEMS})
+    assert status == 200
+    lines = [json.loads(line) for line in body.splitlines()]
+    assert lines[-1] == {"done": True, "total": len(ITEMS), "failed": len(ITEMS) - 1}
+
+    results = {line["index"]: line for line in lines[:-1]}
+    assert sorted(results) == list(range(len(ITEMS)))
+    assert "PM-KISAN" in results[0]["response"]
+    for index in range(1, len(ITEMS)):
+        assert "error" in results[index]
+    assert results[1]["error"] == "Message must be text"
+    assert results[2]["error"] == "History must be a list"
+    assert results[3]["error"] == "Item must be an object"
+
+
+def test_invalid_batch_is_rejected(post_batch):
+    status, _ = post_batch({"items": "wheat"})
+    assert status == 400
@@ -0,0 +1,153 @@
+import asyncio
+import threading
+
+import pytest
+
+from cache import ResponseCache, make_cache_key
+
+
+class Upstream:
+    """Counts calls and streams its chunks once released"""
+
+    def __init__(self, chunks, error=None):
+        self.chunks = chunks
+        self.error = error
+        self.calls = 0
+        self.release = threading.Event()
+
+    def open(self):
+        self.calls += 1
+        return self._generate()
+
+    def _generate(self):
+        for chunk in self.chunks:
+            assert self.release.wait(5)
+            yield chunk
+        if self.error is not None:
+            raise self.error
+
+    async def open_async(self):
+        self.calls += 1
+        return self._generate_async()
+
+    async def _generate_async(self):
+        for chunk in self.chunks:
+            while not self.release.is_set():
+                await asyncio.sleep(0.001)
+            yield chunk
+        if self.error is not None:
+            raise self.error
+
+
+def test_cache_key_ignores_case_spacing_and_trailing_punctuation():
+    history = [{"role": "user", "content": "hi"}]
+    assert make_cache_key("en", "PM-KISAN  eligibility?", history) == \
+        make_cache_key("en", "pm-kisan eligibility", history)
+    assert make_cache_key("en", "wheat", history) != make_cache_key("hi", "wheat", history)
+    assert make_cache_key("en", "wheat", history) != make_cache_key("en", "wheat", [])
+
+
+def test_identical_concurrent_requests_share_one_upstream_call():
+    cache = ResponseCache()
+    upstream = Upstream(["Wheat ", "is sown ", "in November"])
+    leader = cache.get_or_stream("k", upstream.open)
+    follower = cache.get_or_stream("k", upstream.open)
+
+    results = {}
+    thread = threading.Thread(target=lambda: results.setdefault("follower", "".join(follower)))
+    thread.start()
+    upstream.release.set()
+    results["leader"] = "".join(leader)
+    thread.join(5)
+
+    assert results == {"leader": "Wheat is sown in November", "follower": "Wheat is sown in November"}
+    assert upstream.calls == 1
+    assert cache.stats()["coalesced"] == 1
+
+
+def test_completed_answer_is_served_from_cache():
+    cache = ResponseCache()
+    upstream = Upstream(["cached ", "answer"])
+    upstream.release.set()
+    assert "".join(cache.get_or_stream("k", upstream.open)) == "cached answer"
+    assert "".join(cache.get_or_stream("k", upstream.open)) == "cached answer"
+    assert upstream.calls == 1
+    assert cache.stats()["hits"] == 1
+
+
+def test_leader_keeps_reading_after_its_client_goes_away():
+    cache = ResponseCache()
+    upstream = Upstream(["a", "b", "c"])
+    upstream.release.set()
+    leader = cache.get_or_stream("k", upstream.open)
+    assert next(leader) == "a"
+    leader.close()
+
+    assert "".join(cache.get_or_stream("k", upstream.open)) == "abc"
+    assert upstream.calls == 1
+
+
+def test_upstream_error_reaches_followers_and_is_not_cached():
+    cache = ResponseCache()
+    upstream = Upstream(["partial"], error=RuntimeError("upstream failed"))
+    leader = cache.get_or_stream("k", upstream.open)
+    follower = cache.get_or_stream("k", upstream.open)
+    upstream.release.set()
+
+    with pytest.raises(RuntimeError):
+        "".join(leader)
+    with pytest.raises(RuntimeError):
+        "".join(follower)
+    assert cache.stats()["entries"] == 0
+    assert cache.stats()["in_flight"] == 0
+
+
+def test_open_stream_error_propagates_and_ends_the_flight():
+    cache = ResponseCache()
+
+    def fail():
+        raise ConnectionError("no upstream")
+
+    with pytest.raises(ConnectionError):
+        cache.get_or_stream("k", fail)
+    upstream = Upstream(["retry"])
+    upstream.release.set()
+    assert "".join(cache.get_or_stream("k", upstream.open)) == "retry"
+
+
+def test_async_requests_share_one_upstream_call():
+    cache = ResponseCache()
+    upstream = Upstream(["one ", "call"])
+
+    async def read():
+        chunks = await cache.get_or_stream_async("k", upstream.open_async)
+        return "".join([chunk async for chunk in chunks])
+
+    async def main():
+        readers = [asyncio.create_task(read()) for _ in range(5)]
+        await asyncio.sleep(0.01)
+        upstream.release.set()
+        return await asyncio.gather(*readers)
+
+    assert asyncio.run(main()) == ["one call"] * 5
+    assert upstream.calls == 1
+    assert cache.stats()["coalesced"] == 4
+
+
+def test_lru_eviction_by_entries_and_bytes():
+    cache = ResponseCache(max_entries=2, max_bytes=10)
+    for key, text in (("a", "1234"), ("b", "5678"), ("c", "90")):
+        list(cache.get_or_stream(key, lambda text=text: iter([text])))
+    stats = cache.stats()
+    assert stats["entries"] == 2
+    assert stats["bytes"] <= 10
+    assert stats["evictions"] == 1
+
+
+def test_disabled_cache_calls_upstream_every_time():
+    cache = ResponseCache(max_entries=0)
+    upstream = Upstream(["x"])
+    upstream.release.set()
+    "".join(cache.get_or_stream("k", upstream.open))
+    "".join(cache.get_or_stream("k", upstream.open))
+    assert upstream.calls == 2
@@ -0,0 +1,105 @@
+from types import SimpleNamespace
+
+import pytest
+
+from context import MESSAGE_OVERHEAD, ContextBuilder, PromptTooLong, estimate_tokens, message_tokens
+
+SYSTEM = "You are KrishiBot, an assistant for farmers."
+
+
+def turns(count, words=20):
+    """Alternating farmer and bot turns, each with a distinct title line"""
+    messages = []
+    for n in range(count):
+        role = "user" if n % 2 == 0 else "assistant"
+        messages.append({"role": role, "content": f"Topic {n}\n" + "word " * words})
+    return messages
+
+
+def builder(budget, summary_tokens=60):
+    built = ContextBuilder(summary_tokens=summary_tokens)
+    built.prompt_budget = budget
+    return built
+
+
+def test_estimate_tokens():
+    assert estimate_tokens("") == 0
+    assert estimate_tokens("sow wheat") == 2
+    assert estimate_tokens("123456") == 2
+    assert estimate_tokens("गेहूं") > 1
+
+
+def test_everything_fits():
+    messages = turns(5)
+    context = builder(10000).build(SYSTEM, messages)
+    assert context.messages[0] == {"role": "system", "content": SYSTEM}
+    assert context.messages[1:] == messages
+    assert (context.turns_included, context.turns_summarized) == (4, 0)
+    assert context.prompt_tokens == sum(map(message_tokens, context.messages))
+
+
+def test_old_turns_are_summarized_newest_first():
+    messages = turns(9)
+    budget = message_tokens({"content": SYSTEM}) + 3 * message_tokens(messages[-1]) + 60
+    context = builder(budget).build(SYSTEM, messages)
+
+    summary = context.messages[1]
+    assert summary["role"] == "system"
+    assert summary["content"].startswith("Earlier in this conversation:")
+    assert context.messages[-3:] == messages[-3:]
+    assert (context.turns_included, context.turns_summarized) == (2, 6)
+    # The newest dropped turns get into the summary slot, oldest first
+    lines = summary["content"].split("\n")[1:]
+    assert lines[-1] == "- KrishiBot: Topic 5"
+    assert lines == sorted(lines, key=lambda line: int(line.split()[-1]))
+    assert context.prompt_tokens <= budget
+
+
+def test_oversized_question_is_cut_to_the_budget():
+    question = {"role": "user", "content": "word " * 500}
+    budget = message_tokens({"content": SYSTEM}) + 50
+    context = builder(budget).build(SYSTEM, turns(2) + [question])
+
+    latest = context.messages[-1]
+    assert question["content"].startswith(latest["content"])
+    assert 0 < message_tokens(latest) <= 50
+    assert context.turns_included == 0
+    assert context.prompt_tokens <= budget
+
+
+def test_grounding_gives_way_to_the_question():
+    grounding = "\n\nReference\n" + "\n".join(f"Line {n} " + "word " * 10 for n in range(40))
+    question = {"role": "user", "content": "How do I store onions through the monsoon? " * 5}
+    budget = message_tokens({"content": SYSTEM}) + message_tokens(question) + 100
+    context = builder(budget).build(SYSTEM, [question], grounding)
+
+    assert context.messages[-1] == question
+    system = context.messages[0]["content"]
+    assert system.startswith(SYSTEM + "\n\nReference\nLine 0 ")
+    assert (SYSTEM + grounding).startswith(system) and system != SYSTEM + grounding
+    assert context.prompt_tokens <= budget
+
+    roomy = builder(100000).build(SYSTEM, [question], grounding)
+    assert roomy.messages[0]["content"] == SYSTEM + grounding
+
+
+def test_no_room_for_the_question_raises():
+    budget = message_tokens({"content": SYSTEM}) + MESSAGE_OVERHEAD
+    with pytest.raises(PromptTooLong):
+        builder(budget).build(SYSTEM, [{"role": "user", "content": "Best time to sow wheat"}])
+
+
+def test_small_context_window_keeps_the_question_with_grounding(monkeypatch):
+    import service
+
+    monkeypatch.setattr(service, "context_builder", ContextBuilder(context_window=2000, max_completion_tokens=1024))
+    long_answer = SimpleNamespace(answer="\n".join(["Sow from early to mid November."] * 200))
+    monkeypatch.setattr(service, "lookup_knowledge", lambda messages, language: long_answer)
+    question = "When should I sow wheat in the plains?"
+    context = service.build_context([{"role": "user", "content": question}], "en")
+    assert context.messages[-1]["content"] == question
+    assert context.prompt_tokens <= service.context_builder.prompt_budget
+
+    monkeypatch.setattr(service, "context_builder", ContextBuilder(context_window=1100, max_completion_tokens=1024))
+    with pytest.raises(service.ChatbotException):
+        service.build_context([{"role": "user", "content": question}], "en")
@@ -0,0 +1,111 @@
+from datetime import datetime
+
+import pytest
+
+import formatter
+from formatter import ResponseFormatter, enforce_response_format, get_section_emoji
+
+EN = (
+    "Wheat Sowing Guide\n\n"
+    "## Pest Management\n\n"
+    "- Use *neem* oil\n"
+    "- ✨ Rotate crops\n\n"
+    "Tip: Sow early.\n\n\n"
+    "## Irrigation Schedule\n\n"
+    "Water at crown root stage.\n\n"
+    "Additional Tip: Check soil moisture."
+)
+
+HI = (
+    "**गेहूं की बुवाई**\n\n"
+    "## कीट प्रबंधन\n"
+    "- नीम का तेल\n\n"
+    "Tip: जल्दी बोएं\n\n"
+    "## सिंचाई\n\n"
+    "ताज मूल अवस्था पर पानी दें"
+)
+
+
+class FixedClock(datetime):
+    @classmethod
+    def now(cls, tz=None):
+        return cls(2026, 1, 1, 9, 30)
+
+
+@pytest.fixture(autouse=True)
+def fixed_time(monkeypatch):
+    monkeypatch.setattr(formatter, "datetime", FixedClock)
+
+
+def fed_in_chunks(text, language, size):
+    stream = ResponseFormatter(language)
+    pieces = [stream.feed(text[start:start + size]) for start in range(0, len(text), size)]
+    return "".join(pieces) + stream.flush()
+
+
+@pytest.mark.parametrize("language,text", [("en", EN), ("hi", HI)])
+@pytest.mark.parametrize("size", [1, 2, 5, 13, 1000])
+def test_chunked_feed_matches_the_whole_text(language, text, size):
+    assert fed_in_chunks(text, language, size) == enforce_response_format(text, language)
+
+
+def test_english_answer():
+    assert enforce_response_format(EN, "en") == (
+        "**Wheat Sowing Guide** (09:30)"
+        "\n\n---\n\n## 🐛 Pest Management"
+        "\n\n- ✨  Use *neem* oil\n- ✨ Rotate crops"
+        "\n\n---\n\n💡 Pro Tip: Sow early."
+        "\n\n---\n\n## 💧 Irrigation Schedule"
+        "\n\nWater at crown root stage."
+        "\n\n---\n\n💡 Pro Tip: Check soil moisture."
+    )
+
+
+def test_hindi_answer():
+    # Bullets under a heading in the same block are formatted as bullets;
+    # the legacy formatter folded the whole block into the heading text.
+    # The divider goes before "Pro Tip" only, so Hindi tips get none.
+    assert enforce_response_format(HI, "hi") == (
+        "**गेहूं की बुवाई** (09:30)"
+        "\n\n---\n\n## 🐛 कीट प्रबंधन\n- ✨  नीम का तेल"
+        "\n\n💡 विशेषज्ञ सलाह: जल्दी बोएं"
+        "\n\n---\n\n## 💧 सिंचाई"
+        "\n\nताज मूल अवस्था पर पानी दें"
+    )
+
+
+def test_title_is_bold_and_timed_once():
+    assert enforce_response_format("Wheat", "en") == "**Wheat** (09:30)"
+    assert enforce_response_format("**Wheat**", "en") == "**Wheat** (09:30)"
+    assert enforce_response_format("**Wheat** (08:15)", "en") == "**Wheat** (08:15)"
+
+
+def test_section_emoji_priority():
+    # Several keywords: the one listed first in SECTION_EMOJIS wins
+    assert get_section_emoji("Organic Pest Control", "en") == "🐛"
+    assert get_section_emoji("Chemical Control", "en") == "🛡️"
+    assert get_section_emoji("Crop Insurance Schemes", "en") == "🌾"
+    assert get_section_emoji("रासायनिक नियंत्रण", "hi") == "🛡️"
+    assert get_section_emoji("Harvest", "en") == "ℹ️"
+    assert get_section_emoji("Pest", "fr") == "ℹ️"
+
+
+def test_tip_label_is_only_rewritten_at_the_start_of_a_section():
+    # The legacy formatter replaced "Tip:" anywhere in a tip section
+    text = "Title\n\nWater weekly.\nTip: not a label\n\nTip: Mulch. Tip: twice"
+    assert enforce_response_format(text, "en") == (
+        "**Title** (09:30)"
+        "\n\nWater weekly.\nTip: not a label"
+        "\n\n---\n\n💡 Pro Tip: Mulch. Tip: twice"
+    )
+
+
+def test_dividers_go_before_headings_and_tips_only():
+    text = "Title\n\nFirst paragraph.\n\n\n\nSecond paragraph.\n\n## Market Prices\n\n- Check mandi rates"
+    assert enforce_response_format(text, "en") == (
+        "**Title** (09:30)"
+        "\n\nFirst paragraph."
+        "\n\nSecond paragraph."
+        "\n\n---\n\n## 📈 Market Prices"
+        "\n\n- ✨  Check mandi rates"
+    )
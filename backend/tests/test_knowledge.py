@@ -0,0 +1,125 @@
+import asyncio
+import os
+import threading
+
+import pytest
+
+from knowledge import KnowledgeIndex, parse_entries, tokenize
+from service import knowledge_answer
+
+DOCUMENT = """Q: What is the best time to sow wheat?
+Q: When should I sow wheat?
+A:
+Wheat Sowing
+Sow from early to mid November.
+
+Q: Who is eligible for PM-KISAN?
+A:
+PM-KISAN Eligibility
+All landholding farmer families.
+"""
+
+
+def build(tmp_path, text=DOCUMENT):
+    source = tmp_path / "faq"
+    (source / "en").mkdir(parents=True, exist_ok=True)
+    (source / "en" / "crops.md").write_text(text, encoding="utf-8")
+    index = KnowledgeIndex(str(source), str(tmp_path / "index"), refresh_interval=0)
+    index.refresh(force=True)
+    return index
+
+
+def ask(text):
+    return knowledge_answer([{"role": "user", "content": text}], "en")
+
+
+def test_parse_entries_and_tokenize():
+    entries = parse_entries(DOCUMENT)
+    assert [entry["questions"] for entry in entries] == [
+        ["What is the best time to sow wheat?", "When should I sow wheat?"],
+        ["Who is eligible for PM-KISAN?"],
+    ]
+    assert tokenize("When should I sow the wheat crops?") == ["sow", "wheat", "crop"]
+    assert tokenize("गेहूं की बुवाई") == tokenize("गेहूँ की बुवाई")
+
+
+def test_search_reports_score_margin_and_coverage(tmp_path):
+    index = build(tmp_path)
+    exact = index.search("best time to sow wheat", "en")
+    assert exact.score > 0.99 and exact.coverage == 1.0 and exact.margin > 0.5
+    extra_word = index.search("best time to sow wheat in kerala", "en")
+    assert extra_word.question == exact.question
+    assert extra_word.coverage < 1.0
+    assert index.search("tomato blight", "en") is None
+    assert index.search("best time to sow wheat", "hi") is None
+
+
+def test_only_clear_matches_are_answered_word_for_word():
+    assert "PM-KISAN" in ask("PM-KISAN eligibility")
+    assert ask("best time to sow wheat in kerala") is None
+    assert ask("wheat") is None
+
+
+def test_rebuild_switches_generation_for_concurrent_searches(tmp_path):
+    index = build(tmp_path)
+    old = index.generation
+    results = []
+    stop = threading.Event()
+
+    def search():
+        while not stop.is_set():
+            match = index.search("best time to sow wheat", "en")
+            results.append(match.answer if match else None)
+
+    threads = [threading.Thread(target=search) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    path = tmp_path / "faq" / "en" / "crops.md"
+    path.write_text(DOCUMENT.replace("mid November", "late November"), encoding="utf-8")
+    os.utime(path, ns=(1, 1))
+    index.refresh(force=True)
+    stop.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert index.generation != old
+    assert "late November" in index.search("best time to sow wheat", "en").answer
+    assert all(answer is not None and "November" in answer for answer in results)
+
+
+@pytest.mark.parametrize("server", ["flask", "asgi"])
+def test_chat_packs_the_prompt_once_and_off_the_event_loop(server, monkeypatch):
+    import service
+
+    build = service.context_builder.build
+    on_loop = []
+
+    def counting_build(*args):
+        try:
+            asyncio.get_running_loop()
+            on_loop.append(True)
+        except RuntimeError:
+            on_loop.append(False)
+        return build(*args)
+
+    async def once():
+        yield "Cached answer"
+
+    async def answer_async(*args, **kwargs):
+        return once()
+
+    monkeypatch.setattr(service.context_builder, "build", counting_build)
+    monkeypatch.setattr(service.response_cache, "get_or_stream", lambda *args, **kwargs: iter(["Cached answer"]))
+    monkeypatch.setattr(service.response_cache, "get_or_stream_async", answer_async)
+    payload = {"message": "How do I store onions through the monsoon?", "language": "en"}
+    if server == "flask":
+        import app
+        body = app.app.test_client().post("/api/chat", json=payload).get_data(as_text=True)
+    else:
+        from starlette.testclient import TestClient
+
+        import asgi
+        body = TestClient(asgi.app).post("/api/chat", json=payload).text
+
+    assert "Cached answer" in body
+    assert on_loop == [False]
@@ -0,0 +1,118 @@
+import threading
+import time
+
+import pytest
+
+from ratelimit import (
+    MemoryRateLimiter,
+    SQLiteRateLimiter,
+    TokenBucketLimiter,
+    client_key,
+    create_rate_limiter,
+    forwarded_client,
+)
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def limiter_factory(request, tmp_path):
+    def build(burst, refill_rate):
+        return create_rate_limiter(request.param, burst, refill_rate, path=str(tmp_path / "rl.sqlite3"))
+    return build
+
+
+def test_base_class_is_abstract():
+    with pytest.raises(TypeError):
+        TokenBucketLimiter(1, 1)
+
+
+def test_burst_then_reject_with_retry_after(limiter_factory):
+    limiter = limiter_factory(3, 0.5)
+    results = [limiter.hit("ip:1") for _ in range(4)]
+    assert [r.allowed for r in results] == [True, True, True, False]
+    assert [r.remaining for r in results[:3]] == [2, 1, 0]
+    rejected = results[3]
+    assert rejected.retry_after == pytest.approx(2, abs=0.1)
+    assert rejected.headers()["Retry-After"] == "2"
+    assert rejected.headers()["X-RateLimit-Limit"] == "3"
+    assert limiter.rejected == 1
+
+
+def test_bucket_refills_over_time(limiter_factory):
+    limiter = limiter_factory(1, 20)
+    assert limiter.hit("ip:1").allowed
+    assert not limiter.hit("ip:1").allowed
+    time.sleep(0.1)
+    assert limiter.hit("ip:1").allowed
+
+
+def test_keys_have_separate_buckets(limiter_factory):
+    limiter = limiter_factory(1, 0.01)
+    assert limiter.hit("ip:1").allowed
+    assert limiter.hit("ip:2").allowed
+    assert not limiter.hit("ip:1").allowed
+
+
+def test_sqlite_buckets_are_shared_between_limiters(tmp_path):
+    path = str(tmp_path / "shared.sqlite3")
+    first = SQLiteRateLimiter(2, 0.01, path)
+    second = SQLiteRateLimiter(2, 0.01, path)
+    assert first.hit("ip:1").allowed
+    assert second.hit("ip:1").allowed
+    assert not first.hit("ip:1").allowed
+
+
+def test_rejections_are_counted_across_threads(limiter_factory):
+    limiter = limiter_factory(5, 0.001)
+    threads = [
+        threading.Thread(target=lambda: [limiter.hit("ip:1") for _ in range(10)])
+        for _ in range(8)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert limiter.rejected == 8 * 10 - 5
+
+
+def test_memory_limiter_forgets_idle_buckets():
+    limiter = MemoryRateLimiter(1, 100, max_keys=2)
+    for key in ("ip:1", "ip:2", "ip:3"):
+        limiter.hit(key)
+    assert len(limiter) <= 2
+
+
+def test_client_key_trusts_only_configured_api_keys():
+    headers = {"X-API-Key": "partner", "X-Session-ID": "abc"}
+    assert client_key(headers, "10.0.0.1", {"partner"}) == "key:partner"
+    assert client_key(headers, "10.0.0.1") == "ip:10.0.0.1"
+    assert client_key({"X-Session-ID": "abc"}, "10.0.0.1", {"partner"}) == "ip:10.0.0.1"
+
+
+def test_forwarded_client_ignores_client_supplied_hops():
+    assert forwarded_client("1.1.1.1, 2.2.2.2", "10.0.0.1", 1) == "2.2.2.2"
+    assert forwarded_client("1.1.1.1, 2.2.2.2", "10.0.0.1", 2) == "1.1.1.1"
+    assert forwarded_client("2.2.2.2", "10.0.0.1", 2) == "10.0.0.1"
+    assert forwarded_client("1.1.1.1", "10.0.0.1", 0) == "10.0.0.1"
+    assert forwarded_client("", "10.0.0.1", 1) == "10.0.0.1"
+
+
+@pytest.mark.parametrize("server", ["flask", "asgi"])
+def test_spoofed_forwarded_for_does_not_get_a_fresh_bucket(server, monkeypatch):
+    limiter = MemoryRateLimiter(1, 0.001)
+    if server == "flask":
+        import app
+        monkeypatch.setattr(app, "rate_limiter", limiter)
+        client = app.app.test_client()
+    else:
+        from starlette.testclient import TestClient
+
+        import asgi
+        monkeypatch.setattr(asgi, "rate_limiter", limiter)
+        client = TestClient(asgi.app)
+
+    statuses = [
+        client.post("/api/chat", json={}, headers={"X-Forwarded-For": f"10.0.0.{n}"}).status_code
+        for n in range(3)
+    ]
+    # The first request is let through (and fails validation), the rest are limited
+    assert statuses == [400, 429, 429]
@@ -0,0 +1,200 @@
+import asyncio
+import gzip
+import json
+import threading
+import time
+
+import pytest
+
+from replay import ReplayBuffer, StreamLog, coalesce, coalesce_async, gzip_stream, parse_event_id
+
+
+class Upstream:
+    """A chat answer as payloads; counts how often it is produced"""
+
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.calls = 0
+
+    def payloads(self):
+        self.calls += 1
+        for chunk in self.chunks:
+            yield {"chunk": chunk}
+        yield {"done": True}
+
+    async def payloads_async(self):
+        self.calls += 1
+        for chunk in self.chunks:
+            await asyncio.sleep(0)
+            yield {"chunk": chunk}
+        yield {"done": True}
+
+
+def payloads_of(events):
+    return [json.loads(data) for _, data in events]
+
+
+def test_parse_event_id():
+    assert parse_event_id("abc:3") == ("abc", 3)
+    assert parse_event_id("a:b:12") == ("a:b", 12)
+    assert parse_event_id("abc") is None
+    assert parse_event_id("abc:x") is None
+    assert parse_event_id(None) is None
+
+
+def test_dropped_client_resumes_without_a_second_upstream_call():
+    buffer = ReplayBuffer()
+    upstream = Upstream(["Wheat ", "is sown ", "in November"])
+    log = buffer.open()
+    events = log.lead(upstream.payloads())
+    first = [next(events), next(events)]
+    # The client goes away; the rest is recorded in the background
+    events.close()
+
+    resumed = buffer.get(log.token)
+    assert resumed is log
+    rest = list(resumed.subscribe(2, timeout=5))
+
+    assert [event_id for event_id, _ in first + rest] == [log.event_id(n) for n in range(1, 5)]
+    assert payloads_of(first + rest) == list(Upstream(upstream.chunks).payloads())
+    assert upstream.calls == 1
+    assert buffer.stats()["resumed"] == 1
+
+
+def test_async_resume_reads_the_recording():
+    buffer = ReplayBuffer()
+    upstream = Upstream(["a", "b", "c"])
+
+    async def main():
+        log = buffer.open()
+        log.task = asyncio.create_task(log.pump_async(upstream.payloads_async()))
+        async for event_id, _ in log.subscribe_async(0, timeout=5):
+            break
+        _, after = parse_event_id(event_id)
+        return [event async for event in buffer.get(log.token).subscribe_async(after, timeout=5)]
+
+    rest = asyncio.run(main())
+    assert payloads_of(rest) == [{"chunk": "b"}, {"chunk": "c"}, {"done": True}]
+    assert upstream.calls == 1
+
+
+def test_unknown_or_expired_stream_is_not_found():
+    buffer = ReplayBuffer(ttl=0.01)
+    log = buffer.open()
+    list(log.lead(iter([{"done": True}])))
+    time.sleep(0.02)
+    assert buffer.get(log.token) is None
+    assert buffer.get("missing") is None
+    assert buffer.stats()["missed"] == 2
+
+
+def test_finished_streams_are_evicted_first():
+    buffer = ReplayBuffer(max_streams=2)
+    running = buffer.open()
+    finished = buffer.open()
+    finished.finish()
+    newest = buffer.open()
+    assert buffer.get(finished.token) is None
+    assert buffer.get(running.token) is running
+    assert buffer.get(newest.token) is newest
+
+
+def test_stream_log_size_counts_utf8_bytes():
+    log = StreamLog("t")
+    _, data = log.append({"chunk": "गेहूं"})
+    assert log.size == len(data.encode("utf-8")) > len(data)
+
+
+def test_subscribe_times_out_when_nothing_arrives():
+    log = StreamLog("t")
+    with pytest.raises(TimeoutError):
+        list(log.subscribe(0, timeout=0.05))
+
+
+def stalled_answer(stall):
+    """A title, two quick chunks, then an upstream stall"""
+    yield {"chunk": "Title\n"}
+    time.sleep(0.01)
+    yield {"chunk": "a"}
+    time.sleep(0.01)
+    yield {"chunk": "b"}
+    time.sleep(stall)
+    yield {"chunk": "c"}
+    yield {"done": True}
+
+
+def timed(payloads):
+    started = time.monotonic()
+    return [(time.monotonic() - started, payload) for payload in payloads]
+
+
+def test_coalesce_sends_the_first_chunk_at_once_and_flushes_during_a_stall():
+    events = timed(coalesce(stalled_answer(0.5), 512, 0.05))
+    assert [payload for _, payload in events] == [
+        {"chunk": "Title\n"}, {"chunk": "ab"}, {"chunk": "c"}, {"done": True}
+    ]
+    assert events[0][0] < 0.03
+    # "ab" goes out on the flush deadline, not when "c" ends the stall
+    assert events[1][0] < 0.3
+
+
+def test_coalesce_async_sends_the_first_chunk_at_once_and_flushes_during_a_stall():
+    async def answer():
+        for payload in stalled_answer(0):
+            if payload == {"chunk": "c"}:
+                await asyncio.sleep(0.5)
+            yield payload
+
+    async def main():
+        started = time.monotonic()
+        return [(time.monotonic() - started, payload) async for payload in coalesce_async(answer(), 512, 0.05)]
+
+    events = asyncio.run(main())
+    assert [payload for _, payload in events] == [
+        {"chunk": "Title\n"}, {"chunk": "ab"}, {"chunk": "c"}, {"done": True}
+    ]
+    assert events[0][0] < 0.03
+    assert events[1][0] < 0.3
+
+
+def test_coalesce_flushes_on_size_and_before_other_payloads():
+    payloads = [{"chunk": "x" * 4} for _ in range(5)] + [{"error": "boom"}]
+    assert list(coalesce(iter(payloads), 8, 60)) == [
+        {"chunk": "xxxx"}, {"chunk": "xxxxxxxx"}, {"chunk": "xxxxxxxx"}, {"error": "boom"}
+    ]
+
+
+def test_coalesce_raises_upstream_errors_after_flushing():
+    def failing():
+        yield {"chunk": "first"}
+        yield {"chunk": "pending"}
+        raise ConnectionError("upstream went away")
+
+    events = coalesce(failing(), 512, 60)
+    assert next(events) == {"chunk": "first"}
+    assert next(events) == {"chunk": "pending"}
+    with pytest.raises(ConnectionError):
+        next(events)
+
+
+def test_closing_coalesce_stops_reading_upstream():
+    closed = threading.Event()
+
+    def endless():
+        try:
+            while True:
+                time.sleep(0.001)
+                yield {"chunk": "x"}
+        finally:
+            closed.set()
+
+    events = coalesce(endless(), 512, 0.01)
+    next(events)
+    events.close()
+    assert closed.wait(5)
+
+
+def test_gzip_stream_decodes_frame_by_frame():
+    frames = ["data: one\n\n", "data: two\n\n"]
+    body = b"".join(gzip_stream(iter(frames)))
+    assert gzip.decompress(body).decode("utf-8") == "".join(frames)
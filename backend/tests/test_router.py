@@ -0,0 +1,260 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from cache import ResponseCache
+from router import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, ModelRouter, ModelsUnavailable, RoutedStream
+
+
+class SlowStream:
+    """Deltas that only start after `delay` seconds, cut short by abort()"""
+
+    def __init__(self, deltas, delay):
+        self.deltas = deltas
+        self.delay = delay
+        self.aborted = threading.Event()
+
+    def __iter__(self):
+        if self.aborted.wait(self.delay):
+            return
+        yield from self.deltas
+
+    def abort(self):
+        self.aborted.set()
+
+
+def make_router(**options):
+    options.setdefault("hedge_default_delay", 0.05)
+    return ModelRouter("primary", "fast", **options)
+
+
+def question(text="Best time to sow wheat"):
+    return [{"role": "user", "content": text}]
+
+
+def test_circuit_breaker_opens_and_lets_one_trial_through():
+    breaker = CircuitBreaker(failure_threshold=2, cooldown=0.05)
+    breaker.record_failure()
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    assert not breaker.allow()
+    time.sleep(0.06)
+    assert breaker.allow()
+    assert breaker.state == HALF_OPEN
+    assert not breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CLOSED
+    assert breaker.allow()
+
+
+def test_half_open_failure_opens_again():
+    breaker = CircuitBreaker(failure_threshold=1, cooldown=0.01)
+    breaker.record_failure()
+    time.sleep(0.02)
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    assert breaker.opened == 2
+
+
+def test_slow_first_token_is_hedged_and_the_loser_aborted():
+    router = make_router()
+    streams = {"primary": SlowStream(["slow"], 5), "fast": iter(["quick ", "answer"])}
+    started = time.monotonic()
+    answer = "".join(router.stream(["primary", "fast"], lambda model: streams[model]))
+
+    assert answer == "quick answer"
+    assert time.monotonic() - started < 2
+    assert streams["primary"].aborted.is_set()
+    stats = router.stats()
+    assert stats["fast"]["hedges"] == 1
+    assert stats["fast"]["wins"] == 1
+    assert stats["primary"]["losses"] == 1
+
+
+def test_no_hedge_without_spare_capacity():
+    router = make_router(can_hedge=lambda: False)
+    streams = {"primary": SlowStream(["primary answer"], 0.2), "fast": iter(["unused"])}
+    assert "".join(router.stream(["primary", "fast"], lambda model: streams[model])) == "primary answer"
+    assert router.stats()["fast"]["requests"] == 0
+
+
+def test_failure_before_the_first_token_falls_back():
+    router = make_router()
+
+    def open_stream(model):
+        if model == "primary":
+            raise ConnectionError("primary down")
+        return iter(["from ", "fast"])
+
+    assert "".join(router.stream(["primary", "fast"], open_stream)) == "from fast"
+    assert router.stats()["primary"]["failures"] == 1
+
+
+def test_buffered_call_fails_over_and_skips_an_open_breaker():
+    router = make_router(failure_threshold=1, cooldown=60)
+    calls = []
+
+    def fetch(model):
+        calls.append(model)
+        if model == "primary":
+            raise ConnectionError("primary down")
+        return f"answer from {model}"
+
+    assert router.call(["primary", "fast"], fetch) == ("fast", "answer from fast")
+    assert router.call(["primary", "fast"], fetch) == ("fast", "answer from fast")
+    assert calls == ["primary", "fast", "fast"]
+    assert router.stats()["primary"]["breaker"] == OPEN
+
+
+def test_every_breaker_open_raises_models_unavailable():
+    router = make_router(failure_threshold=1, cooldown=60)
+    for model in ("primary", "fast"):
+        router.breakers[model].record_failure()
+    with pytest.raises(ModelsUnavailable):
+        router.call(["primary", "fast"], lambda model: "unused")
+
+
+def test_async_hedge_cancels_the_slow_attempt():
+    router = make_router()
+    cancelled = []
+
+    async def open_stream(model):
+        async def deltas():
+            if model == "primary":
+                try:
+                    await asyncio.sleep(5)
+                except asyncio.CancelledError:
+                    cancelled.append(model)
+                    raise
+            yield f"answer from {model}"
+        return deltas()
+
+    async def main():
+        deltas = await router.stream_async(["primary", "fast"], open_stream)
+        return "".join([delta async for delta in deltas])
+
+    started = time.monotonic()
+    assert asyncio.run(main()) == "answer from fast"
+    assert time.monotonic() - started < 2
+    assert cancelled == ["primary"]
+
+
+def test_short_first_question_goes_to_the_fast_model():
+    router = make_router()
+    assert router.route(question(), "en", "k") == ["fast", "primary"]
+    # Routing records nothing; only a cache miss does
+    assert router.route(question(), "en", "k") == ["fast", "primary"]
+    assert router.route(question("x" * 200), "en", "k2") == ["primary", "fast"]
+    assert router.route(question(), "hi", "k3") == ["primary", "fast"]
+    history = [{"role": "user", "content": "hi"}, {"role": "assistant", "content": "hello"}]
+    assert router.route(history + question(), "en", "k4") == ["primary", "fast"]
+
+
+def test_frontend_history_does_not_keep_first_questions_off_the_fast_model():
+    from service import prepare_messages
+
+    text = "Best time to sow wheat"
+    messages = prepare_messages({"message": text, "history": [{"role": "user", "content": text}]})
+    assert make_router().route(messages, "en", "k")[0] == "fast"
+
+
+def test_repeated_question_is_answered_and_cached_by_the_primary_model():
+    router = make_router()
+    cache = ResponseCache()
+    calls = []
+
+    def ask():
+        candidates = router.route(question(), "en", "k")
+
+        def open_stream():
+            router.missed("k", candidates)
+            calls.append(candidates[0])
+            return router.stream(candidates, lambda model: iter([f"answer from {model}"]))
+
+        return "".join(cache.get_or_stream("k", open_stream, store=router.cacheable))
+
+    assert ask() == "answer from fast"
+    assert ask() == "answer from primary"
+    assert ask() == "answer from primary"
+    assert calls == ["fast", "primary"]
+    assert router.stats()["fast"]["routed"] == 1
+    assert router.stats()["primary"]["routed"] == 1
+
+
+def test_hedged_fast_answer_to_a_primary_route_is_not_cached():
+    router = make_router()
+    cache = ResponseCache()
+    streams = {"primary": SlowStream(["slow"], 5), "fast": iter(["quick"])}
+    deltas = cache.get_or_stream(
+        "k", lambda: router.stream(["primary", "fast"], lambda model: streams[model]),
+        store=router.cacheable
+    )
+    assert "".join(deltas) == "quick"
+    assert cache.stats()["entries"] == 0
+
+
+def test_failover_answers_are_not_cached():
+    router = make_router()
+    cache = ResponseCache()
+
+    def fetch(model):
+        if model == "primary":
+            raise ConnectionError("primary down")
+        return f"answer from {model}"
+
+    def open_stream(model):
+        return iter([fetch(model)])
+
+    def call():
+        model, text = router.call(["primary", "fast"], fetch)
+        return RoutedStream(iter([text]), model)
+
+    assert "".join(cache.get_or_stream("k", call, store=router.cacheable)) == "answer from fast"
+    streamed = cache.get_or_stream(
+        "k", lambda: router.stream(["primary", "fast"], open_stream), store=router.cacheable
+    )
+    assert "".join(streamed) == "answer from fast"
+    assert cache.stats()["entries"] == 0
+
+
+def test_async_failover_answer_is_not_cached():
+    router = make_router()
+    cache = ResponseCache()
+
+    async def open_stream(model):
+        if model == "primary":
+            raise ConnectionError("primary down")
+
+        async def deltas():
+            yield f"answer from {model}"
+        return deltas()
+
+    async def main():
+        deltas = await cache.get_or_stream_async(
+            "k", lambda: router.stream_async(["primary", "fast"], open_stream), store=router.cacheable
+        )
+        return "".join([delta async for delta in deltas])
+
+    assert asyncio.run(main()) == "answer from fast"
+    assert cache.stats()["entries"] == 0
+
+
+def test_primary_answer_is_cached():
+    router = make_router()
+    cache = ResponseCache()
+    answer = cache.get_or_stream(
+        "k", lambda: router.stream(["primary", "fast"], lambda model: iter([f"from {model}"])),
+        store=router.cacheable
+    )
+    assert "".join(answer) == "from primary"
+    assert "".join(cache.get_or_stream("k", lambda: iter(["unused"]))) == "from primary"
+
+
+def test_groq_client_leaves_retries_to_the_router():
+    from service import initialize_groq_client
+
+    assert initialize_groq_client().max_retries == 0
@@ -21,6 +21,12 @@ document.addEventListener("DOMContentLoaded", function () {
   let lastRequestTime = 0;
   let currentBotMessageId = null;
 
+  const API_BASE = "https://krishibot-ai.onrender.com/api";
+  // A dropped answer stream is resumed up to this many times, waiting a
+  // little longer before each attempt
+  const MAX_RESUME_ATTEMPTS = 5;
+  const RESUME_DELAY_MS = 1000;
+
   // Initialize chat
   function initChat() {
     loadConversation();
@@ -442,7 +448,35 @@ function formatMessage(text) {
     chatMessages.scrollTop = chatMessages.scrollHeight;
 
     try {
-      const response = await fetch("https://krishibot-ai.onrender.com/api/chat", {
+      let fullResponse = "";
+      let streamDone = false;
+      let streamError = null;
+      let streamId = null;
+      let lastEventId = null;
+
+      const handleEvent = (id, data) => {
+        if (id) lastEventId = id;
+        if (data.error) streamError = data.error;
+        if (data.done) streamDone = true;
+        if (data.chunk) {
+          fullResponse += data.chunk;
+          const contentDiv = document.getElementById(
+            `${currentBotMessageId}-content`
+          );
+          if (contentDiv) {
+            contentDiv.innerHTML = formatMessage(fullResponse);
+            // Auto-scroll only if user hasn't manually scrolled up
+            const isNearBottom =
+              chatMessages.scrollHeight - chatMessages.clientHeight <=
+              chatMessages.scrollTop + 100;
+            if (isNearBottom) {
+              chatMessages.scrollTop = chatMessages.scrollHeight;
+            }
+          }
+        }
+      };
+
+      let response = await fetch(`${API_BASE}/chat`, {
         method: "POST",
         headers: {
           "Content-Type": "application/json",
@@ -454,48 +488,39 @@ function formatMessage(text) {
         }),
       });
 
-      if (!response.ok) {
-        throw new Error(`HTTP error! status: ${response.status}`);
-      }
-
-      const reader = response.body.getReader();
-      const decoder = new TextDecoder();
-      let buffer = "";
-      let fullResponse = "";
-
-      while (true) {
-        const { done, value } = await reader.read();
-        if (done) break;
-
-        buffer += decoder.decode(value, { stream: true });
-        const lines = buffer.split("\n");
-        buffer = lines.pop(); // Save incomplete line for next iteration
-
-        for (const line of lines) {
-          if (line.startsWith("data: ")) {
-            try {
-              const data = JSON.parse(line.substring(6));
-              if (data.chunk) {
-                fullResponse += data.chunk;
-                const contentDiv = document.getElementById(
-                  `${currentBotMessageId}-content`
-                );
-                if (contentDiv) {
-                  contentDiv.innerHTML = formatMessage(fullResponse);
-                  // Auto-scroll only if user hasn't manually scrolled up
-                  const isNearBottom =
-                    chatMessages.scrollHeight - chatMessages.clientHeight <=
-                    chatMessages.scrollTop + 100;
-                  if (isNearBottom) {
-                    chatMessages.scrollTop = chatMessages.scrollHeight;
-                  }
-                }
-              }
-            } catch (e) {
-              console.error("Error parsing SSE data:", e);
-            }
+      for (let attempt = 1; ; attempt++) {
+        if (response) {
+          if (!response.ok) {
+            throw new Error(`HTTP error! status: ${response.status}`);
+          }
+          streamId = streamId || response.headers.get("X-Stream-ID");
+          try {
+            await readEvents(response, handleEvent);
+          } catch (e) {
+            console.warn("Stream interrupted:", e);
           }
         }
+        if (streamDone) break;
+
+        // The connection dropped mid-answer: the server keeps the answer, so
+        // pick it up after the last event we saw instead of asking again
+        if (!streamId || attempt > MAX_RESUME_ATTEMPTS) {
+          throw new Error("Stream interrupted");
+        }
+        await new Promise((resolve) =>
+          setTimeout(resolve, RESUME_DELAY_MS * attempt)
+        );
+        try {
+          response = await fetch(`${API_BASE}/chat/stream/${streamId}`, {
+            headers: lastEventId ? { "Last-Event-ID": lastEventId } : {},
+          });
+        } catch (e) {
+          response = null; // Still offline, try again
+        }
+      }
+
+      if (streamError) {
+        throw new Error(streamError);
       }
 
       if (fullResponse.trim()) {
@@ -535,6 +560,35 @@ function formatMessage(text) {
     }
   }
 
+  // Read server-sent events from a response until it ends
+  async function readEvents(response, onEvent) {
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = "";
+    let eventId = null;
+
+    while (true) {
+      const { done, value } = await reader.read();
+      if (done) return;
+
+      buffer += decoder.decode(value, { stream: true });
+      const lines = buffer.split("\n");
+      buffer = lines.pop(); // Save incomplete line for next iteration
+
+      for (const line of lines) {
+        if (line.startsWith("id: ")) {
+          eventId = line.substring(4);
+        } else if (line.startsWith("data: ")) {
+          try {
+            onEvent(eventId, JSON.parse(line.substring(6)));
+          } catch (e) {
+            console.error("Error parsing SSE data:", e);
+          }
+        }
+      }
+    }
+  }
+
   // Add message to chat
   function addMessage(sender, message, saveToHistory = true) {
     // Check if this is a duplicate of the last message